@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+訊息記憶體用量基準測試：dict 列表 vs 欄式 MessageStore
+執行方式: python -m benchmarks.bench_message_memory [訊息數量]
+"""
+
+import sys
+import tracemalloc
+from datetime import datetime, timedelta
+
+from src.message_store import MessageStore
+
+
+def generate_messages(count: int):
+    """產生測試訊息（約 10% 已處理，發送者重複出現）"""
+    base = datetime(2024, 1, 1)
+    for i in range(1, count + 1):
+        message = {
+            "id": i,
+            "text": f"第 {i} 則訊息，明天的會議記得帶報告",
+            "sender_id": f"user_{i % 500:03d}",
+            "sender_name": f"聯絡人{i % 500}",
+            "timestamp": (base + timedelta(seconds=i)).isoformat(),
+            "processed": i % 10 == 0
+        }
+        if message["processed"]:
+            message["processing_result"] = {
+                "category": "工作",
+                "tags": ["會議", "工作"],
+                "priority": 2,
+                "should_archive": False,
+                "draft": "收到"
+            }
+        yield message
+
+
+def measure(label: str, build):
+    """量測建立資料結構後仍存活的記憶體"""
+    tracemalloc.start()
+    data = build()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<16} 目前: {current / 1024 / 1024:8.1f} MB   峰值: {peak / 1024 / 1024:8.1f} MB")
+    return data, current
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    print(f"📊 訊息數量: {count:,}")
+
+    _, dict_bytes = measure("dict 列表", lambda: list(generate_messages(count)))
+    _, store_bytes = measure("MessageStore", lambda: MessageStore.from_records(generate_messages(count)))
+
+    print(f"\n🎉 欄式儲存節省 {(1 - store_bytes / dict_bytes) * 100:.1f}% 記憶體 "
+          f"({dict_bytes / max(store_bytes, 1):.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+priority_tool 查詢吞吐量基準測試（本機 SQLite）
+比較「每次呼叫都建立新的資料庫管理器」與「注入共用連接池」兩種方式
+執行方式: python -m benchmarks.bench_priority_lookup [查詢次數]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+from src.constants import DEFAULT_USER_ID
+from src.database import SyncDatabaseManager
+from src.toolbox import priority_tool, set_database_manager
+
+CONTACTS = 1000
+
+
+def seed(db: SyncDatabaseManager):
+    """建立測試聯絡人（每 10 位中有 1 位設定優先級）"""
+    for i in range(0, CONTACTS, 10):
+        db.set_contact_priority(DEFAULT_USER_ID, f"user_{i:04d}", priority_boost=-1, is_starred=i % 20 == 0)
+
+
+def run(lookups: int) -> float:
+    """執行 priority_tool 並回傳每秒查詢數"""
+    start = time.perf_counter()
+    for i in range(lookups):
+        priority_tool(f"user_{i % CONTACTS:04d}", "工作")
+    return lookups / (time.perf_counter() - start)
+
+
+class PerCallManager:
+    """模擬舊寫法：每次查詢都建立新的管理器與連接"""
+
+    def __init__(self, database_url: str):
+        self.database_url = database_url
+
+    def get_contact_priority(self, user_id: str, sender_id: str):
+        db = SyncDatabaseManager(self.database_url, min_size=1, max_size=1)
+        try:
+            return db.get_contact_priority(user_id, sender_id)
+        finally:
+            db.close_pool()
+
+
+def main():
+    lookups = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        database_url = f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}"
+        shared = SyncDatabaseManager(database_url)
+        seed(shared)
+
+        set_database_manager(PerCallManager(database_url))
+        per_call = run(max(lookups // 10, 1))
+
+        set_database_manager(shared)
+        pooled = run(lookups)
+
+        set_database_manager(None)
+        shared.close_pool()
+
+    print(f"📊 查詢次數: {lookups:,}")
+    print(f"每次建立管理器   {per_call:12,.0f} 次/秒")
+    print(f"共用連接池       {pooled:12,.0f} 次/秒")
+    print(f"\n🎉 加速 {pooled / per_call:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+冷啟動基準測試：解析 JSON vs 讀取二進位快照
+執行方式: python -m benchmarks.bench_snapshot [訊息數量]
+"""
+
+import json
+import os
+import sys
+import tempfile
+import time
+
+from src.message_store import MessageStore
+from src.snapshot import file_fingerprint, read_snapshot, write_snapshot
+from benchmarks.bench_message_memory import generate_messages
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    print(f"📊 訊息數量: {count:,}")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        json_path = os.path.join(tmp_dir, "demo_messages.json")
+        snap_path = os.path.join(tmp_dir, "demo_messages.snap")
+
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump({"messages": list(generate_messages(count))}, f,
+                      ensure_ascii=False, indent=2, default=str)
+        write_snapshot(snap_path, MessageStore.from_records(generate_messages(count)),
+                       file_fingerprint(json_path))
+
+        start = time.perf_counter()
+        with open(json_path, "r", encoding="utf-8") as f:
+            json_store = MessageStore.from_records(json.load(f)["messages"])
+        json_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        snap_store, _ = read_snapshot(snap_path)
+        snap_time = time.perf_counter() - start
+
+        assert len(json_store) == len(snap_store) == count
+
+        print(f"JSON      {os.path.getsize(json_path) / 1024 / 1024:8.1f} MB   載入 {json_time:6.2f}s")
+        print(f"快照      {os.path.getsize(snap_path) / 1024 / 1024:8.1f} MB   載入 {snap_time:6.2f}s")
+        print(f"\n🎉 冷啟動加速 {json_time / snap_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+工具流程在不同儲存後端上的吞吐量基準測試
+每則訊息: 新增訊息 → classify_tool → priority_tool → 標記已處理 → 記錄執行日誌
+執行方式: python -m benchmarks.bench_storage_backends [訊息數]
+（設定 BENCH_POSTGRES_URL 時另外測試 PostgreSQL）
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+from src.constants import DEFAULT_USER_ID
+from src.storage import MEMORY_URL, StorageBackend, create_storage
+from src.toolbox import classify_tool, priority_tool, set_database_manager
+
+CONTACTS = 200
+TEXTS = ["明天早上十點開會討論專案", "媽媽問你週末要不要回家", "限時特價優惠只到今天", "晚上一起吃飯嗎"]
+
+
+def seed(storage: StorageBackend):
+    """建立測試聯絡人（每 10 位中有 1 位設定優先級）"""
+    for i in range(0, CONTACTS, 10):
+        storage.set_contact_priority(DEFAULT_USER_ID, f"user_{i:04d}", priority_boost=1, is_starred=i % 20 == 0)
+
+
+def run(storage: StorageBackend, messages: int) -> float:
+    """執行工具流程並回傳每秒處理訊息數"""
+    set_database_manager(storage)
+    start = time.perf_counter()
+    for i in range(messages):
+        sender_id = f"user_{i % CONTACTS:04d}"
+        text = TEXTS[i % len(TEXTS)]
+        message_id = storage.add_message(text, sender_id, sender_id)
+        category = classify_tool(text)["category"]
+        priority = priority_tool(sender_id, category)["priority"]
+        result = {"category": category, "priority": priority}
+        storage.mark_message_processed(message_id, result)
+        storage.log_agent_execution({
+            "user_id": DEFAULT_USER_ID,
+            "message_text": text,
+            "prompt_used": "benchmark",
+            "tool_results": [],
+            "final_response": result,
+            "total_execution_time": 0.0,
+            "token_usage": {"total_tokens": 0},
+        })
+    elapsed = time.perf_counter() - start
+    set_database_manager(None)
+    return messages / elapsed
+
+
+def main():
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        urls = {
+            "memory": MEMORY_URL,
+            "sqlite": f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}",
+            "json": f"json://{os.path.join(tmp_dir, 'demo')}",
+        }
+        if os.getenv("BENCH_POSTGRES_URL"):
+            urls["postgres"] = os.environ["BENCH_POSTGRES_URL"]
+
+        for name, url in urls.items():
+            storage = create_storage(url)
+            try:
+                seed(storage)
+                results[name] = run(storage, messages)
+                assert storage.count_messages()["unprocessed_count"] == 0
+            finally:
+                storage.close()
+
+    print(f"📊 訊息數: {messages:,}")
+    for name, rate in results.items():
+        print(f"{name:<10} {rate:12,.0f} 則/秒")
+    if "sqlite" in results:
+        print(f"\n🎉 記憶體後端比 SQLite 快 {results['memory'] / results['sqlite']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
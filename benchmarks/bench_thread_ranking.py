@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+對話串排序基準測試
+比較 sort_tool 的 sorted() 排序與 RankingEngine（欄式批次評分 + argpartition 前 k 筆）
+執行方式: python -m benchmarks.bench_thread_ranking [對話串數 ...] [--top K]
+（預設 10,000 / 100,000 / 1,000,000 個對話串，前 50 筆）
+"""
+
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from src.ranking import RankingEngine, ThreadBatch, np
+from src.toolbox import sort_tool
+
+BASE_TIME = datetime(2024, 1, 1)
+
+
+def make_threads(count: int, seed: int = 42):
+    """產生隨機對話串（時間戳分布於 90 天內）"""
+    rng = random.Random(seed)
+    return [
+        {
+            "id": f"thread_{i}",
+            "priority": rng.randint(1, 5),
+            "last_message_at": (BASE_TIME + timedelta(seconds=rng.randrange(90 * 86400))).isoformat() + "Z",
+            "unread_count": rng.randint(0, 20),
+            "is_starred": rng.random() < 0.05,
+        }
+        for i in range(count)
+    ]
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    args = sys.argv[1:]
+    top = 50
+    if "--top" in args:
+        index = args.index("--top")
+        top = int(args[index + 1])
+        del args[index:index + 2]
+    sizes = [int(arg) for arg in args] or [10_000, 100_000, 1_000_000]
+
+    engine = RankingEngine()
+    now = int((BASE_TIME + timedelta(days=90) - datetime(1970, 1, 1)).total_seconds() * 1_000_000)
+
+    print(f"📊 評分後端: {'NumPy ' + np.__version__ if np is not None else '純 Python'}，前 {top} 筆")
+    print(f"{'對話串數':>12}{'sorted()':>12}{'建立陣列':>12}{'前 k 筆':>12}{'完整排序':>12}{'前 k 加速':>10}")
+    for size in sizes:
+        threads = make_threads(size)
+        sorted_result, sorted_time = timed(sort_tool, threads)
+        batch, build_time = timed(ThreadBatch.from_threads, threads)
+        top_ids, top_time = timed(engine.top_k, batch, top, now)
+        ranked, rank_time = timed(engine.rank, batch, now)
+
+        assert len(sorted_result["sorted_threads"]) == size
+        assert ranked[:top] == top_ids
+        print(f"{size:>12,}{sorted_time * 1000:>10.0f}ms{build_time * 1000:>10.0f}ms"
+              f"{top_time * 1000:>10.1f}ms{rank_time * 1000:>10.0f}ms{sorted_time / top_time:>9.0f}x")
+
+    print("\n（建立陣列只需在對話串變更時執行一次，之後可用不同權重反覆評分）")
+
+
+if __name__ == "__main__":
+    main()
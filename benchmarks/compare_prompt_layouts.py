@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Prompt 版面 token 比較
+以同一批使用者設定渲染各版面的預設模板，比較平均 token 數與所有使用者共用的前綴長度
+執行方式: python -m benchmarks.compare_prompt_layouts [使用者數]
+"""
+
+import sys
+
+from src.constants import PROMPT_LAYOUTS, REPLY_LENGTH_OPTIONS, TONE_STYLES
+from src.prompts import PromptManager
+from src.schemas import ToneProfile
+from src.storage import InMemoryStorage
+from src.token_estimator import MIN_CACHEABLE_PREFIX_TOKENS, compare_layouts, tokenizer_name
+
+NAMES = ["王小明", "陳美玲", "Alex Chen", "林志豪", "Emily Wu"]
+PROFILES = ["軟體工程師", "行銷經理", "大學生", "自由接案設計師", ""]
+
+
+def sample_profiles(count: int):
+    """產生不同的語調設定檔"""
+    return [
+        ToneProfile(
+            name=NAMES[i % len(NAMES)],
+            profile=PROFILES[i % len(PROFILES)],
+            style=TONE_STYLES[i % len(TONE_STYLES)],
+            reply_length=REPLY_LENGTH_OPTIONS[i % len(REPLY_LENGTH_OPTIONS)],
+            signature=f"-- {NAMES[i % len(NAMES)]}" if i % 2 else "",
+        )
+        for i in range(count)
+    ]
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    profiles = sample_profiles(users)
+
+    renders = {}
+    for layout in PROMPT_LAYOUTS:
+        manager = PromptManager(InMemoryStorage(), layout=layout)
+        renders[layout] = [manager.render_prompt(manager.default_template, profile) for profile in profiles]
+    result = compare_layouts(renders)
+
+    print(f"📊 使用者數: {users}，token 計算: {tokenizer_name() or '字元估算'}")
+    print(f"{'版面':<16}{'平均 tokens':>12}{'共用前綴':>10}{'可快取比例':>12}")
+    for layout, stats in result.items():
+        print(f"{layout:<16}{stats['avg_tokens']:>12.0f}{stats['shared_prefix_tokens']:>10}"
+              f"{stats['cacheable_ratio']:>11.0%}")
+
+    for layout, stats in result.items():
+        if not stats["prefix_cacheable"]:
+            print(f"⚠️  {layout}: 共用前綴未達 {MIN_CACHEABLE_PREFIX_TOKENS} tokens，"
+                  f"供應商可能不會快取（可在靜態區段加入更多說明或範例）")
+
+
+if __name__ == "__main__":
+    main()
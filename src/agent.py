@@ -2,6 +2,7 @@
 LangChain Agent 核心模組
 負責協調所有工具執行並處理訊息
 """
+import asyncio
 import logging
 import time
 import json
@@ -15,10 +16,10 @@ from langchain_core.messages import SystemMessage
 
 from .config import settings
 from .prompts import PromptManager
-from .database import SyncDatabaseManager as DatabaseManager
 from .schemas import MessageRequest, OrganizeResponse, ToneProfile, AgentExecutionLog, ToolResult
 from .constants import ERROR_MESSAGES, PERFORMANCE_THRESHOLDS
-from .toolbox import get_all_tools
+from .rules import get_rule_set, pinned_rule_set
+from .toolbox import get_all_tools, get_database_manager
 
 logger = logging.getLogger(__name__)
 
@@ -27,8 +28,8 @@ class MessageAgent:
     """訊息處理 Agent"""
     
     def __init__(self):
-        self.db = DatabaseManager()
-        self.prompt_manager = PromptManager(self.db)
+        self.db = get_database_manager()
+        self.prompt_manager = PromptManager(self.db, layout=settings.prompt_layout)
         self.llm = ChatOpenAI(
             api_key=settings.openai_api_key,
             model=settings.openai_model,
@@ -48,6 +49,12 @@ class MessageAgent:
         Returns:
             處理結果
         """
+        # 整個處理流程（含工具呼叫）固定使用同一版規則集
+        with pinned_rule_set():
+            return await self._process_message(request)
+    
+    async def _process_message(self, request: MessageRequest) -> OrganizeResponse:
+        """依固定的規則集處理訊息"""
         start_time = time.time()
         execution_log = {
             'user_id': request.sender_id,
@@ -57,6 +64,7 @@ class MessageAgent:
             'final_response': {},
             'total_execution_time': 0,
             'token_usage': {},
+            'rule_version': get_rule_set().version,
             'timestamp': datetime.now()
         }
         
@@ -64,9 +72,9 @@ class MessageAgent:
             logger.info(f"開始處理用戶 {request.sender_id} 的訊息，長度: {len(request.text)}")
             
             # 1. 載入並渲染 System Prompt
-            prompt_template = self.prompt_manager.get_user_prompt(request.sender_id)
-            system_prompt = self.prompt_manager.render_prompt(prompt_template, request.tone_profile)
-            execution_log['prompt_used'] = system_prompt[:500] + "..." if len(system_prompt) > 500 else system_prompt
+            system_prompt = self.prompt_manager.get_rendered_prompt(request.sender_id, request.tone_profile)
+            # 完整 Prompt 由資料庫以內容雜湊去重儲存，不需截斷
+            execution_log['prompt_used'] = system_prompt
             
             logger.debug(f"使用 System Prompt 長度: {len(system_prompt)}")
             
@@ -181,14 +189,15 @@ class MessageAgent:
                 'tags': result.get('tags', []),
                 'priority': int(result.get('priority', 3)),
                 'should_archive': bool(result.get('should_archive', False)),
-                'draft': result.get('draft', None)
+                'draft': result.get('draft', None),
+                'rule_version': get_rule_set().version
             }
             
             # 驗證分類
-            from .constants import CATEGORIES
-            if response_data['category'] not in CATEGORIES:
+            rules = get_rule_set()
+            if response_data['category'] not in rules.categories:
                 logger.warning(f"無效分類: {response_data['category']}，使用預設值")
-                response_data['category'] = '朋友'
+                response_data['category'] = rules.default_category
             
             # 驗證優先級
             if not (1 <= response_data['priority'] <= 5):
@@ -209,7 +218,8 @@ class MessageAgent:
             tags=["需人工檢查"],
             priority=3,
             should_archive=False,
-            draft=None
+            draft=None,
+            rule_version=get_rule_set().version
         )
     
     def _parse_text_result(self, text_result: str) -> Dict[str, Any]:
@@ -252,7 +262,7 @@ class MessageAgent:
     async def _log_execution(self, execution_log: Dict[str, Any]):
         """記錄執行日誌到資料庫"""
         try:
-            success = await self.db.log_agent_execution(execution_log)
+            success = await asyncio.to_thread(self.db.log_agent_execution, execution_log)
             if not success:
                 logger.error("執行日誌記錄失敗")
         except Exception as e:
@@ -261,7 +271,7 @@ class MessageAgent:
     async def get_user_stats(self, user_id: str, days: int = 30) -> Dict[str, Any]:
         """獲取用戶統計資訊"""
         try:
-            stats = await self.db.get_execution_stats(user_id, days)
+            stats = await asyncio.to_thread(self.db.get_execution_stats, user_id, days)
             logger.info(f"獲取用戶 {user_id} 的 {days} 天統計")
             return stats
         except Exception as e:
@@ -1,21 +1,73 @@
 """
 FastAPI 入口點 - 簡化版本用於測試
 """
+import json
 import logging
-from typing import Dict, Any
+import os
+from typing import AsyncIterator, Dict, Any, List, Optional
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 
 from .config import settings
-from .schemas import MessageRequest, ToneProfile
-from .toolbox import classify_tool, tag_tool, priority_tool, archive_tool, draft_reply_tool
-from .demo_storage import demo_storage
+from .schemas import ArchiveRule, MessageRequest, ToneProfile
+from .toolbox import (
+    classify_tool, tag_tool, priority_tool, batch_priority_tool, archive_tool, draft_reply_tool,
+    get_database_manager, set_database_manager,
+)
+from .demo_storage import DemoStorage
+from .constants import API_LIMITS, DEFAULT_USER_ID
+from .archive import ArchiveTable
+from .database import SyncDatabaseManager, set_sync_database_manager
+from .dependencies import STALE_REASONS, build_depends_on, prompt_version
+from .drafts import DraftService
+from .rules import RuleSetError, get_rule_set, pinned_rule_set, reload_rules, update_archive_rules
+from .storage import create_storage_from_settings
 
 # 設定日誌
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 依 STORAGE_URL（未設定時為 DATABASE_URL）建立工具與 Agent 共用的儲存後端（資料庫第一次查詢時才連線）
+storage = create_storage_from_settings(settings)
+if isinstance(storage, SyncDatabaseManager):
+    set_sync_database_manager(storage)
+set_database_manager(storage)
+
+# /demo 路由的資料：json:// 後端直接共用同一個 DemoStorage，其他後端另外使用 data 目錄的 JSON 檔案
+demo_storage = storage if isinstance(storage, DemoStorage) else DemoStorage()
+
+# 載入規則集（檔案不存在或格式錯誤時使用內建規則）
+if os.path.exists(settings.rules_path):
+    try:
+        reload_rules(settings.rules_path)
+    except (OSError, RuleSetError) as e:
+        logger.error(f"載入規則集失敗，使用內建規則: {e}")
+
+
+def _create_draft_llm():
+    """建立串流草稿用的聊天模型（未啟用或未安裝 langchain_openai 時回傳 None）"""
+    if not settings.draft_stream_llm:
+        return None
+    try:
+        from langchain_openai import ChatOpenAI
+    except ImportError:
+        logger.warning("未安裝 langchain_openai，串流草稿改用規則式產生")
+        return None
+    return ChatOpenAI(
+        api_key=settings.openai_api_key,
+        model=settings.openai_model,
+        temperature=settings.openai_temperature,
+        max_tokens=settings.openai_max_tokens,
+        streaming=True
+    )
+
+
+# 回覆草稿的延遲產生與快取
+draft_service = DraftService(eager_max_priority=settings.draft_eager_max_priority,
+                             llm=_create_draft_llm())
+
 # 建立 FastAPI 應用
 app = FastAPI(
     title="AI Messenger Agent",
@@ -33,6 +85,14 @@ app.add_middleware(
 )
 
 
+@app.on_event("shutdown")
+async def flush_demo_storage():
+    """關閉前寫出訊息快照並關閉儲存後端（資料庫連接池）"""
+    if demo_storage is not storage:
+        demo_storage.flush()
+    storage.close()
+
+
 @app.get("/")
 async def root():
     """根路徑 - 健康檢查"""
@@ -54,51 +114,155 @@ async def health_check():
     }
 
 
-@app.post("/organize")
-async def organize_message(request: MessageRequest):
+def _organize(request: MessageRequest, rule_version: str, category: Optional[str] = None,
+              priority: Optional[int] = None) -> Dict[str, Any]:
     """
-    處理訊息 - 分類、優先級、封存決定、回覆草稿
+    依序執行分類、標籤、優先級、封存與草稿工具
+
+    批次處理時可傳入已批次算好的 category / priority，略過逐則的分類與聯絡人查詢
     """
-    try:
-        logger.info(f"收到訊息處理請求，發送者: {request.sender_id}")
-        
-        # 1. 分類
+    logger.info(f"收到訊息處理請求，發送者: {request.sender_id}")
+    
+    # 1. 分類
+    if category is None:
         classify_result = classify_tool(request.text)
         category = classify_result["category"]
-        
-        # 2. 標籤
-        tag_result = tag_tool(request.text)
-        tags = tag_result["tags"]
-        
-        # 3. 優先級
+    
+    # 2. 標籤
+    tag_result = tag_tool(request.text)
+    tags = tag_result["tags"]
+    
+    # 3. 優先級
+    if priority is None:
         priority_result = priority_tool(request.sender_id, category)
         priority = priority_result["priority"]
-        
-        # 4. 封存決定
-        archive_result = archive_tool(category, priority)
-        should_archive = archive_result["should_archive"]
-        
-        # 5. 回覆草稿
-        tone_profile_dict = request.tone_profile.dict()
-        draft_result = draft_reply_tool(request.text, tone_profile_dict)
-        draft = draft_result.get("draft")
-        
-        result = {
-            "category": category,
-            "tags": tags,
-            "priority": priority,
-            "should_archive": should_archive,
-            "draft": draft
-        }
-        
-        logger.info(f"訊息處理完成: {category}, 優先級: {priority}")
-        return result
+    
+    # 4. 封存決定
+    archive_result = archive_tool(category, priority)
+    should_archive = archive_result["should_archive"]
+    
+    # 5. 回覆草稿（低優先級或會被封存的訊息只回傳 token，需要時再產生）
+    tone_profile_dict = request.tone_profile.dict()
+    draft = None
+    draft_token = None
+    if draft_service.should_defer(priority, should_archive):
+        draft_token = draft_service.defer(request.text, tone_profile_dict)
+    else:
+        draft, _ = draft_service.generate(request.text, tone_profile_dict)
+    
+    result = {
+        "category": category,
+        "tags": tags,
+        "priority": priority,
+        "should_archive": should_archive,
+        "draft": draft,
+        "draft_token": draft_token,
+        "rule_version": rule_version
+    }
+    
+    logger.info(f"訊息處理完成: {category}, 優先級: {priority}")
+    return result
+
+
+@app.post("/organize")
+async def organize_message(request: MessageRequest):
+    """
+    處理訊息 - 分類、優先級、封存決定、回覆草稿
+    """
+    try:
+        # 整個請求固定使用同一版規則集（處理中遇到重載也不會混用）
+        with pinned_rule_set() as rules:
+            return _organize(request, rules.version)
         
     except Exception as e:
         logger.error(f"處理訊息時發生錯誤: {e}")
         raise HTTPException(status_code=500, detail=f"處理訊息失敗: {str(e)}")
 
 
+@app.post("/drafts/{token}")
+async def generate_draft(token: str):
+    """以 /organize 回傳的 draft_token 產生回覆草稿（結果會快取）"""
+    try:
+        result = draft_service.generate_for_token(token)
+        if result is None:
+            raise HTTPException(status_code=404, detail="草稿 token 不存在或已過期，請重新送出 /organize")
+        draft, cached = result
+        return {"draft_token": token, "draft": draft, "cached": cached}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"產生草稿失敗: {e}")
+        raise HTTPException(status_code=500, detail=f"產生草稿失敗: {str(e)}")
+
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    """組成一則 Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _stream_draft_response(http_request: Request, text: str, tone_profile: Dict[str, Any]) -> StreamingResponse:
+    """
+    以 SSE 逐段輸出草稿
+
+    事件: token（{"text": 片段}）→ done（{"draft": 完整草稿}），失敗時為 error；
+    用戶端斷線時停止產生（關閉 LLM 串流）
+    """
+    async def events() -> AsyncIterator[str]:
+        stream = draft_service.stream(text, tone_profile)
+        parts = []
+        try:
+            async for chunk in stream:
+                if await http_request.is_disconnected():
+                    logger.info("用戶端已斷線，停止產生草稿")
+                    return
+                parts.append(chunk)
+                yield _sse("token", {"text": chunk})
+            yield _sse("done", {"draft": "".join(parts)})
+        except Exception as e:
+            logger.error(f"串流草稿失敗: {e}")
+            yield _sse("error", {"detail": str(e)})
+        finally:
+            await stream.aclose()
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.get("/drafts/{token}/stream")
+async def stream_draft(token: str, request: Request):
+    """以 SSE 串流產生 draft_token 對應的回覆草稿"""
+    pending = draft_service.pending_input(token)
+    if pending is None:
+        raise HTTPException(status_code=404, detail="草稿 token 不存在或已過期，請重新送出 /organize")
+    return _stream_draft_response(request, *pending)
+
+
+@app.get("/rules")
+async def get_rules():
+    """目前生效的規則集摘要"""
+    return get_rule_set().info()
+
+
+@app.post("/rules/reload")
+async def reload_rule_set():
+    """
+    重新載入規則檔（RULES_PATH）並以原子替換生效
+
+    驗證失敗時維持目前的規則集；處理中的請求繼續使用開始時的版本
+    """
+    previous = get_rule_set().version
+    try:
+        rule_set = reload_rules(settings.rules_path)
+    except (OSError, RuleSetError) as e:
+        logger.error(f"重新載入規則集失敗: {e}")
+        raise HTTPException(status_code=400, detail=f"重新載入規則集失敗: {str(e)}")
+    return {
+        "message": "規則集已更新",
+        "previous_version": previous,
+        "version": rule_set.version
+    }
+
+
 @app.post("/test")
 async def test_tools():
     """測試所有工具"""
@@ -133,17 +297,36 @@ async def test_tools():
 # Demo 相關端點
 # =============================================================================
 
+def _parse_field_list(value: Optional[str]) -> Optional[list]:
+    """解析逗號分隔的欄位清單"""
+    if not value:
+        return None
+    return [field.strip() for field in value.split(",") if field.strip()]
+
+
 @app.get("/demo/messages")
-async def get_demo_messages():
-    """獲取所有 Demo 訊息"""
+async def get_demo_messages(cursor: Optional[int] = None, limit: int = 50,
+                            fields: Optional[str] = None, exclude: Optional[str] = None):
+    """
+    分頁獲取 Demo 訊息
+    
+    - cursor: 上一頁回傳的 next_cursor（訊息 ID）
+    - fields / exclude: 逗號分隔的欄位清單，例如 exclude=processing_result
+    """
     try:
-        messages = demo_storage.get_all_messages()
-        unprocessed = demo_storage.get_unprocessed_messages()
+        page = demo_storage.list_messages(
+            cursor=cursor,
+            limit=max(1, min(limit, API_LIMITS["MAX_PAGE_SIZE"])),
+            fields=_parse_field_list(fields),
+            exclude=_parse_field_list(exclude)
+        )
+        counts = demo_storage.count_messages()
         
         return {
-            "total_messages": len(messages),
-            "unprocessed_count": len(unprocessed),
-            "messages": messages
+            "total_messages": counts["total_messages"],
+            "unprocessed_count": counts["unprocessed_count"],
+            "messages": page["messages"],
+            "next_cursor": page["next_cursor"]
         }
     except Exception as e:
         logger.error(f"獲取 Demo 訊息失敗: {e}")
@@ -151,19 +334,106 @@ async def get_demo_messages():
 
 
 @app.get("/demo/messages/unprocessed")
-async def get_unprocessed_messages():
-    """獲取未處理的訊息"""
+async def get_unprocessed_messages(cursor: Optional[int] = None, limit: int = 50,
+                                   fields: Optional[str] = None, exclude: Optional[str] = None):
+    """分頁獲取未處理的訊息"""
     try:
-        messages = demo_storage.get_unprocessed_messages()
+        page = demo_storage.list_messages(
+            cursor=cursor,
+            limit=max(1, min(limit, API_LIMITS["MAX_PAGE_SIZE"])),
+            fields=_parse_field_list(fields),
+            exclude=_parse_field_list(exclude),
+            unprocessed_only=True
+        )
         return {
-            "count": len(messages),
-            "messages": messages
+            "count": demo_storage.count_messages()["unprocessed_count"],
+            "messages": page["messages"],
+            "next_cursor": page["next_cursor"]
         }
     except Exception as e:
         logger.error(f"獲取未處理訊息失敗: {e}")
         raise HTTPException(status_code=500, detail=f"獲取未處理訊息失敗: {str(e)}")
 
 
+@app.get("/demo/search")
+async def search_demo_messages(q: str, category: Optional[str] = None,
+                               sender_id: Optional[str] = None,
+                               offset: int = 0, limit: int = 20):
+    """全文搜尋訊息，支援分類/發送者過濾與分頁"""
+    try:
+        limit = max(1, min(limit, 100))
+        result = demo_storage.search_messages(
+            q, category=category, sender_id=sender_id,
+            offset=max(0, offset), limit=limit
+        )
+        return {
+            "query": q,
+            "total": result["total"],
+            "offset": offset,
+            "limit": limit,
+            "messages": result["messages"]
+        }
+    except Exception as e:
+        logger.error(f"搜尋訊息失敗: {e}")
+        raise HTTPException(status_code=500, detail=f"搜尋訊息失敗: {str(e)}")
+
+
+def _demo_tone_profile() -> ToneProfile:
+    """由 Demo 用戶設定檔建立語調設定"""
+    user_profile = demo_storage.get_user_profile()
+    return ToneProfile(
+        name=user_profile["name"],
+        profile=user_profile["profile"],
+        style=user_profile["tone_style"],
+        reply_length=user_profile["reply_length"],
+        signature=user_profile["signature"],
+        language=user_profile["language"]
+    )
+
+
+def _current_contacts(sender_ids: List[str]) -> Optional[Dict[str, Dict[str, Any]]]:
+    """以單次批次查詢取得發送者目前的聯絡人設定（查詢失敗時回傳 None）"""
+    try:
+        return get_database_manager().get_contact_priorities(DEFAULT_USER_ID, sender_ids)
+    except Exception as e:
+        logger.warning(f"讀取聯絡人設定失敗: {e}")
+        return None
+
+
+async def _process_demo(target_message: Dict[str, Any], tone_profile: ToneProfile,
+                        contact: Optional[Dict[str, Any]], category: Optional[str] = None,
+                        priority: Optional[int] = None, reprocess: bool = False) -> Dict[str, Any]:
+    """
+    處理一則 Demo 訊息並寫回結果（結果附上 depends_on：所依賴的聯絡人設定、規則與語調版本）
+
+    category / priority 為批次預先算好的值（需在同一個 pinned_rule_set 區塊內算出）；
+    reprocess 時處理日誌標記為重新處理，不重複計入處理統計
+    """
+    request = MessageRequest(
+        text=target_message["text"],
+        sender_id=target_message["sender_id"],
+        tone_profile=tone_profile
+    )
+    
+    # 處理訊息（重用現有邏輯）
+    with pinned_rule_set() as rules:
+        result = _organize(request, rules.version, category=category, priority=priority)
+    result["depends_on"] = build_depends_on(request.sender_id, contact, result["rule_version"],
+                                            request.tone_profile.dict())
+    
+    # 標記為已處理
+    demo_storage.mark_message_processed(target_message["id"], result)
+    
+    # 記錄處理日誌
+    demo_storage.log_processing(target_message["id"], {
+        "request": request.dict(),
+        "final_response": result,
+        "total_execution_time": 1.0,  # 簡化版
+        **({"reprocess": True} if reprocess else {})
+    })
+    return result
+
+
 @app.post("/demo/process/{message_id}")
 async def process_demo_message(message_id: int):
     """處理指定的 Demo 訊息"""
@@ -179,37 +449,9 @@ async def process_demo_message(message_id: int):
                 "result": target_message.get("processing_result")
             }
         
-        # 獲取用戶設定檔
-        user_profile = demo_storage.get_user_profile()
-        
-        # 建立處理請求
-        tone_profile = ToneProfile(
-            name=user_profile["name"],
-            profile=user_profile["profile"],
-            style=user_profile["tone_style"],
-            reply_length=user_profile["reply_length"],
-            signature=user_profile["signature"],
-            language=user_profile["language"]
-        )
-        
-        request = MessageRequest(
-            text=target_message["text"],
-            sender_id=target_message["sender_id"],
-            tone_profile=tone_profile
-        )
-        
-        # 處理訊息（重用現有邏輯）
-        result = await organize_message(request)
-        
-        # 標記為已處理
-        demo_storage.mark_message_processed(message_id, result)
-        
-        # 記錄處理日誌
-        demo_storage.log_processing(message_id, {
-            "request": request.dict(),
-            "final_response": result,
-            "total_execution_time": 1.0  # 簡化版
-        })
+        sender_id = target_message["sender_id"]
+        contact = (_current_contacts([sender_id]) or {}).get(sender_id)
+        result = await _process_demo(target_message, _demo_tone_profile(), contact)
         
         return {
             "message_id": message_id,
@@ -225,29 +467,76 @@ async def process_demo_message(message_id: int):
         raise HTTPException(status_code=500, detail=f"處理訊息失敗: {str(e)}")
 
 
+@app.post("/demo/messages/{message_id}/draft")
+async def draft_demo_message(message_id: int):
+    """以目前的用戶設定檔為指定訊息產生回覆草稿（依訊息與語調設定快取）"""
+    try:
+        target_message = demo_storage.get_message_by_id(message_id)
+        if not target_message:
+            raise HTTPException(status_code=404, detail="訊息不存在")
+        
+        draft, cached = draft_service.generate(target_message["text"], _demo_tone_profile().dict())
+        return {
+            "message_id": message_id,
+            "draft": draft,
+            "cached": cached
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"產生草稿失敗: {e}")
+        raise HTTPException(status_code=500, detail=f"產生草稿失敗: {str(e)}")
+
+
+@app.get("/demo/messages/{message_id}/draft/stream")
+async def stream_demo_draft(message_id: int, request: Request):
+    """以 SSE 串流產生指定訊息的回覆草稿"""
+    target_message = demo_storage.get_message_by_id(message_id)
+    if not target_message:
+        raise HTTPException(status_code=404, detail="訊息不存在")
+    return _stream_draft_response(request, target_message["text"], _demo_tone_profile().dict())
+
+
 @app.post("/demo/batch-process")
 async def batch_process_unprocessed():
     """批次處理所有未處理的訊息"""
     try:
         unprocessed = demo_storage.get_unprocessed_messages()
         results = []
+        tone_profile = _demo_tone_profile()
         
-        for msg in unprocessed:
-            try:
-                result = await process_demo_message(msg["id"])
-                results.append({
-                    "success": True,
-                    "message_id": msg["id"],
-                    "sender": msg["sender_name"],
-                    "result": result
-                })
-            except Exception as e:
-                results.append({
-                    "success": False,
-                    "message_id": msg["id"],
-                    "sender": msg.get("sender_name", "未知"),
-                    "error": str(e)
-                })
+        # 整批使用同一版規則集：先分類，再以單次批次查詢算出所有訊息的優先級
+        with pinned_rule_set():
+            categories = [classify_tool(msg["text"])["category"] for msg in unprocessed]
+            priorities = batch_priority_tool([
+                {"sender_id": msg["sender_id"], "category": category}
+                for msg, category in zip(unprocessed, categories)
+            ])["priorities"]
+            contacts = _current_contacts([msg["sender_id"] for msg in unprocessed]) or {}
+            
+            for msg, category, priority in zip(unprocessed, categories, priorities):
+                try:
+                    result = await _process_demo(msg, tone_profile, contacts.get(msg["sender_id"]),
+                                                 category=category, priority=priority)
+                    results.append({
+                        "success": True,
+                        "message_id": msg["id"],
+                        "sender": msg["sender_name"],
+                        "result": {
+                            "message_id": msg["id"],
+                            "original_text": msg["text"],
+                            "sender": msg["sender_name"],
+                            "result": result
+                        }
+                    })
+                except Exception as e:
+                    logger.error(f"處理 Demo 訊息 {msg['id']} 失敗: {e}")
+                    results.append({
+                        "success": False,
+                        "message_id": msg["id"],
+                        "sender": msg.get("sender_name", "未知"),
+                        "error": str(e)
+                    })
         
         return {
             "processed_count": len([r for r in results if r["success"]]),
@@ -265,20 +554,153 @@ async def get_demo_stats():
     """獲取 Demo 統計資料"""
     try:
         stats = demo_storage.get_processing_stats()
-        messages = demo_storage.get_all_messages()
-        contacts = demo_storage.load_json("contacts")
+        counts = demo_storage.count_messages()
         
         return {
             "processing_stats": stats,
-            "total_messages": len(messages),
-            "total_contacts": len(contacts),
-            "unprocessed_count": len(demo_storage.get_unprocessed_messages())
+            "total_messages": counts["total_messages"],
+            "total_contacts": len(demo_storage.contacts),
+            "unprocessed_count": counts["unprocessed_count"]
         }
     except Exception as e:
         logger.error(f"獲取統計失敗: {e}")
         raise HTTPException(status_code=500, detail=f"獲取統計失敗: {str(e)}")
 
 
+@app.get("/metrics/database")
+async def get_database_metrics():
+    """資料庫查詢延遲、連接池等待與快取統計"""
+    if not settings.enable_metrics:
+        raise HTTPException(status_code=404, detail="監控指標未啟用")
+    db = get_database_manager()
+    if not hasattr(db, "get_metrics"):
+        raise HTTPException(status_code=404, detail="目前的儲存後端不提供資料庫監控指標")
+    return db.get_metrics()
+
+
+@app.post("/demo/maintenance/compact-history")
+async def compact_demo_history(retain_days: int = 30, max_hot_logs: Optional[int] = None):
+    """
+    壓縮處理歷史：過期紀錄轉為每日彙總並移入 gzip 封存，
+    並刪除資料庫中整月過期的 Agent 執行日誌分區（失敗或後端不支援時 purged_log_partitions 為 None）
+    """
+    try:
+        result = demo_storage.compact_processing_history(
+            retain_days=retain_days, max_hot_logs=max_hot_logs
+        )
+        try:
+            db = get_database_manager()
+            purged = db.purge_execution_logs(retain_days) if hasattr(db, "purge_execution_logs") else None
+        except Exception as e:
+            logger.error(f"清除過期執行日誌失敗: {e}")
+            purged = None
+        return {
+            "message": "處理歷史壓縮完成",
+            "result": result,
+            "purged_log_partitions": purged,
+            "processing_stats": demo_storage.get_processing_stats()
+        }
+    except Exception as e:
+        logger.error(f"壓縮處理歷史失敗: {e}")
+        raise HTTPException(status_code=500, detail=f"壓縮處理歷史失敗: {str(e)}")
+
+
+@app.post("/demo/maintenance/rearchive")
+async def rearchive_demo_messages(rules: Optional[Dict[str, ArchiveRule]] = None, dry_run: bool = False):
+    """
+    以封存規則重新決定所有已處理訊息的封存狀態，只寫回決定改變的訊息
+
+    - rules: 分類 -> 封存規則，未提供時使用目前規則集的封存規則；
+      非 dry_run 時寫入規則檔（RULES_PATH）並替換規則集，之後處理的訊息也套用同樣的規則
+    - dry_run: 只計算不寫回（rules 也不會寫入規則檔）
+
+    寫入新的封存規則後規則集版本會改變，依賴舊版本的處理結果改記為新版本（rule_version_updated），
+    之後的重新處理不會因此把它們視為過期
+    """
+    archive_rules = {category: rule.dict() for category, rule in rules.items()} if rules is not None else None
+    previous_version = get_rule_set().version
+    if archive_rules is not None and not dry_run:
+        try:
+            table = update_archive_rules(settings.rules_path, archive_rules).archive_table
+        except (OSError, RuleSetError) as e:
+            logger.error(f"更新封存規則失敗: {e}")
+            raise HTTPException(status_code=400, detail=f"更新封存規則失敗: {str(e)}")
+    elif archive_rules is not None:
+        table = ArchiveTable(archive_rules)
+    else:
+        table = get_rule_set().archive_table
+
+    try:
+        rule_version = None if dry_run and archive_rules is not None else get_rule_set().version
+        # 依賴更新前規則版本的處理結果改記為新版本（只換了封存規則，其他結果仍有效）
+        result = demo_storage.rearchive(table, dry_run=dry_run, rule_version=rule_version,
+                                        previous_rule_version=previous_version)
+        return {
+            "message": "封存狀態試算完成" if dry_run else "封存狀態重新評估完成",
+            "dry_run": dry_run,
+            "rule_version": rule_version,
+            **result
+        }
+    except Exception as e:
+        logger.error(f"重新評估封存狀態失敗: {e}")
+        raise HTTPException(status_code=500, detail=f"重新評估封存狀態失敗: {str(e)}")
+
+
+@app.post("/demo/maintenance/reprocess")
+async def reprocess_stale_messages(sender_id: Optional[List[str]] = Query(None), dry_run: bool = False):
+    """
+    只重新處理結果已過期的訊息
+
+    依每筆結果記錄的 depends_on 判斷：發送者的聯絡人設定（priority_boost / is_starred）、
+    規則集版本或語調設定改變，以及沒有相依紀錄的舊結果
+
+    - sender_id: 只檢查這些發送者（例如剛修改優先級的聯絡人），可重複指定
+    - dry_run: 只回傳會重新處理的訊息數
+
+    讀取聯絡人設定失敗時仍依規則集 / 語調版本重新處理，但回應的 contacts_checked 為 false
+    （聯絡人設定改變的訊息這次不會被找出）
+    """
+    try:
+        tone_profile = _demo_tone_profile()
+        senders = sender_id if sender_id else demo_storage.dependencies.senders()
+        contacts = _current_contacts(senders)
+        if contacts is None:
+            logger.warning("無法讀取聯絡人設定，本次略過聯絡人設定的過期檢查")
+        stale = demo_storage.find_stale_messages(
+            get_rule_set().version, prompt_version(tone_profile.dict()),
+            contacts=contacts, sender_ids=sender_id or None
+        )
+        reasons = {reason: 0 for reason in STALE_REASONS}
+        for reason in stale.values():
+            reasons[reason] += 1
+        
+        reprocessed = 0
+        failed = []
+        if not dry_run:
+            for message_id in sorted(stale):
+                target_message = demo_storage.get_message_by_id(message_id)
+                try:
+                    await _process_demo(target_message, tone_profile,
+                                        (contacts or {}).get(target_message["sender_id"]), reprocess=True)
+                    reprocessed += 1
+                except Exception as e:
+                    logger.error(f"重新處理訊息 {message_id} 失敗: {e}")
+                    failed.append(message_id)
+        
+        return {
+            "message": "過期結果試算完成" if dry_run else "過期結果重新處理完成",
+            "dry_run": dry_run,
+            "stale_count": len(stale),
+            "contacts_checked": contacts is not None,
+            "reasons": reasons,
+            "reprocessed_count": reprocessed,
+            "failed": failed
+        }
+    except Exception as e:
+        logger.error(f"重新處理過期結果失敗: {e}")
+        raise HTTPException(status_code=500, detail=f"重新處理過期結果失敗: {str(e)}")
+
+
 @app.post("/demo/add-message")
 async def add_demo_message(text: str, sender_id: str, sender_name: str):
     """新增 Demo 訊息"""
@@ -296,19 +718,60 @@ async def add_demo_message(text: str, sender_id: str, sender_name: str):
 
 
 @app.get("/demo/contacts")
-async def get_demo_contacts():
-    """獲取所有聯絡人資料"""
+async def get_demo_contacts(cursor: Optional[str] = None, limit: int = 50):
+    """分頁獲取聯絡人資料（cursor 為上一頁回傳的 next_cursor）"""
     try:
-        contacts = demo_storage.load_json("contacts")
+        page = demo_storage.list_contacts(cursor=cursor, limit=max(1, min(limit, API_LIMITS["MAX_PAGE_SIZE"])))
         return {
-            "total_contacts": len(contacts),
-            "contacts": contacts
+            "total_contacts": len(demo_storage.contacts),
+            "contacts": page["contacts"],
+            "next_cursor": page["next_cursor"]
         }
     except Exception as e:
         logger.error(f"獲取聯絡人失敗: {e}")
         raise HTTPException(status_code=500, detail=f"獲取聯絡人失敗: {str(e)}")
 
 
+@app.get("/demo/inbox")
+async def get_demo_inbox(cursor: Optional[str] = None, limit: int = 50):
+    """
+    優先收件匣：依優先級、最新訊息時間、未讀數排序的對話串
+
+    - cursor: 上一頁回傳的 next_cursor（對話串 ID）
+    """
+    try:
+        page = demo_storage.get_inbox(cursor=cursor, limit=max(1, min(limit, API_LIMITS["MAX_PAGE_SIZE"])))
+        return {
+            "total_threads": len(demo_storage.threads),
+            "threads": page["threads"],
+            "next_cursor": page["next_cursor"]
+        }
+    except Exception as e:
+        logger.error(f"獲取收件匣失敗: {e}")
+        raise HTTPException(status_code=500, detail=f"獲取收件匣失敗: {str(e)}")
+
+
+@app.get("/demo/threads/{thread_id}")
+async def get_demo_thread(thread_id: str, cursor: Optional[int] = None, limit: int = 50):
+    """
+    對話串彙總（未讀數、優先級範圍、分類分布）與訊息，訊息新的在前
+
+    - cursor: 上一頁回傳的 next_cursor（訊息 ID）
+    """
+    try:
+        thread = demo_storage.get_thread(
+            thread_id, cursor=cursor, limit=max(1, min(limit, API_LIMITS["MAX_PAGE_SIZE"]))
+        )
+        if thread is None:
+            raise HTTPException(status_code=404, detail="對話串不存在")
+        return thread
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"獲取對話串失敗: {e}")
+        raise HTTPException(status_code=500, detail=f"獲取對話串失敗: {str(e)}")
+
+
 @app.get("/demo/user-profile")
 async def get_demo_user_profile():
     """獲取用戶設定檔"""
@@ -0,0 +1,91 @@
+"""
+批次封存規則評估
+將封存規則編譯為「分類 × 優先級」查詢表，單則決定只需一次索引；
+整欄評估時直接對訊息儲存的分類 / 優先級 / 封存狀態欄位以 NumPy 一次查表（未安裝 NumPy 時逐列查表）
+"""
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .constants import AUTO_ARCHIVE_RULES, PRIORITY_LEVELS
+
+# 查詢表每個分類佔的欄數（索引 0 保留給無效優先級，1-5 對應優先級）
+_ROW_WIDTH = max(PRIORITY_LEVELS) + 1
+
+
+class ArchiveTable:
+    """編譯後的封存規則查詢表"""
+
+    def __init__(self, rules: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.rules = AUTO_ARCHIVE_RULES if rules is None else rules
+        # 未設定規則的分類共用索引 0（整列都不封存）
+        self.category_index: Dict[str, int] = {}
+        table = bytearray(_ROW_WIDTH)
+        for category, rule in self.rules.items():
+            self.category_index[category] = len(table) // _ROW_WIDTH
+            table.extend(
+                1 if 0 < priority and rule.get('enabled') and priority >= rule['priority_threshold'] else 0
+                for priority in range(_ROW_WIDTH)
+            )
+        self.table = bytes(table)
+        self._array = np.frombuffer(self.table, dtype=np.uint8) if np is not None else None
+
+    def cell(self, category: str, priority: Any) -> int:
+        """(分類, 優先級) 在查詢表中的位置，無效優先級對應到不封存的欄位"""
+        offset = self.category_index.get(category, 0) * _ROW_WIDTH
+        if isinstance(priority, int) and 0 < priority < _ROW_WIDTH:
+            return offset + priority
+        return offset
+
+    def should_archive(self, category: str, priority: Any) -> bool:
+        """單則封存決定"""
+        return bool(self.table[self.cell(category, priority)])
+
+    def evaluate(self, cells: Sequence[int]) -> List[bool]:
+        """整欄評估（cells 為 cell() 的結果）"""
+        if self._array is not None:
+            return self._array[np.asarray(cells, dtype=np.intp)].astype(bool).tolist()
+        table = self.table
+        return [bool(table[cell]) for cell in cells]
+
+    def changed_rows(self, columns: Dict[str, Any]) -> Tuple[int, List[int]]:
+        """
+        整欄評估已處理訊息，找出決定與目前封存狀態不同的列
+
+        Args:
+            columns: MessageStore.archive_columns() 的欄位
+
+        Returns:
+            (評估筆數, 決定改變的列號)
+        """
+        categories = columns["categories"]
+        archived = columns["archived"]
+        if self._array is not None:
+            total = len(archived)
+            processed = np.unpackbits(np.frombuffer(columns["processed"], dtype=np.uint8),
+                                      bitorder="little")[:total].astype(bool)
+            state = np.array(archived, dtype=np.int8)
+            priority = np.array(columns["priority"], dtype=np.intp)
+            # 儲存端的分類索引 -> 查詢表的分類列（分類數很少，只需逐一查一次）
+            category_rows = np.array([self.category_index.get(name, 0) for name in categories], dtype=np.intp)
+            cells = (category_rows[np.array(columns["category_idx"], dtype=np.intp)] * _ROW_WIDTH
+                     + np.where((priority > 0) & (priority < _ROW_WIDTH), priority, 0))
+            evaluated = processed & (state >= 0)
+            changed = evaluated & (self._array[cells].astype(bool) != (state == 1))
+            return int(evaluated.sum()), np.flatnonzero(changed).tolist()
+
+        processed = columns["processed"]
+        table = self.table
+        evaluated = 0
+        changed = []
+        for row, (category_idx, priority, state) in enumerate(
+                zip(columns["category_idx"], columns["priority"], archived)):
+            if state < 0 or not processed[row >> 3] & (1 << (row & 7)):
+                continue
+            evaluated += 1
+            if bool(table[self.cell(categories[category_idx], priority)]) != bool(state):
+                changed.append(row)
+        return evaluated, changed
@@ -0,0 +1,165 @@
+"""
+行程內快取工具
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+_MISSING = object()
+
+
+class LRUCache:
+    """執行緒安全、有容量上限的 LRU 快取（附命中/淘汰統計）"""
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """取得快取值（命中時移到最新位置）"""
+        # 讀取路徑不加鎖：OrderedDict 的單一操作在 GIL 下是原子的，
+        # 與淘汰同時發生時最多只是這次不更新順序（統計值為近似值）
+        value = self._data.get(key, _MISSING)
+        if value is _MISSING:
+            self.misses += 1
+            return default
+        try:
+            self._data.move_to_end(key)
+        except KeyError:
+            pass
+        self.hits += 1
+        return value
+
+    def put(self, key: Hashable, value: Any):
+        """寫入快取，超過容量時淘汰最久未使用的項目"""
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """移除單一項目"""
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def discard_where(self, predicate: Callable[[Hashable], bool]) -> int:
+        """移除所有鍵符合條件的項目，回傳移除數量"""
+        with self._lock:
+            keys = [key for key in self._data if predicate(key)]
+            for key in keys:
+                del self._data[key]
+            return len(keys)
+
+    def clear(self):
+        """清空快取"""
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """快取統計"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+
+# 不存在的聯絡人（最常見的情況）共用同一個負向快取值
+DEFAULT_CONTACT_PRIORITY: Tuple[int, bool] = (0, False)
+
+
+class ContactPriorityCache:
+    """
+    聯絡人優先級的讀穿（read-through）快取
+
+    - 以 (user_id, sender_id) 為鍵，值為 (priority_boost, is_starred)，未設定的聯絡人也會被快取
+    - 本行程內 set_contact_priority 會直接寫入新值（write-through）
+    - 其他 worker 的修改透過版本號偵測：每隔 version_check_interval 秒由管理器讀取一次版本，
+      版本改變時整個快取失效
+    - 讀穿時先記下 generation 再查詢資料庫，回填時若期間有寫入或失效（generation 已改變）
+      則放棄回填，避免較慢的讀取覆蓋較新的值
+    """
+
+    def __init__(self, maxsize: int = 10000, version_check_interval: float = 1.0):
+        self._entries = LRUCache(maxsize)
+        self.version_check_interval = version_check_interval
+        self.version: Optional[int] = None
+        self._next_check = 0.0
+        # 每次寫入 / 失效遞增
+        self.generation = 0
+
+    def get(self, user_id: str, sender_id: str) -> Optional[Tuple[int, bool]]:
+        """取得快取的 (priority_boost, is_starred)，未命中回傳 None"""
+        return self._entries.get((user_id, sender_id))
+
+    def _store(self, user_id: str, sender_id: str, priority_boost: int, is_starred: bool):
+        value = (priority_boost, bool(is_starred))
+        self._entries.put((user_id, sender_id), DEFAULT_CONTACT_PRIORITY if value == DEFAULT_CONTACT_PRIORITY else value)
+
+    def put(self, user_id: str, sender_id: str, priority_boost: int, is_starred: bool):
+        """寫入新值（本行程的修改，write-through）"""
+        self.generation += 1
+        self._store(user_id, sender_id, priority_boost, is_starred)
+
+    def fill(self, user_id: str, sender_id: str, priority_boost: int, is_starred: bool, generation: int) -> bool:
+        """
+        讀穿回填（generation 為查詢資料庫前讀到的值）
+
+        查詢期間快取有寫入或失效時不回填，回傳是否已寫入
+        """
+        if generation != self.generation:
+            return False
+        self._store(user_id, sender_id, priority_boost, is_starred)
+        return True
+
+    def invalidate(self, user_id: str, sender_id: str):
+        """失效單一聯絡人"""
+        self.generation += 1
+        self._entries.pop((user_id, sender_id))
+
+    def needs_version_check(self) -> bool:
+        """是否該向資料庫確認版本"""
+        return time.monotonic() >= self._next_check
+
+    def note_own_write(self, version: int):
+        """本行程寫入後的新版本號；若中間沒有其他 worker 的修改則不需清空快取"""
+        if self.version is not None and version == self.version + 1:
+            self.version = version
+
+    def apply_version(self, version: int):
+        """套用最新版本號，版本改變時清空快取"""
+        if self.version is not None and version != self.version:
+            self.clear()
+        self.version = version
+        self._next_check = time.monotonic() + self.version_check_interval
+
+    def clear(self):
+        """清空快取"""
+        self.generation += 1
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """快取統計"""
+        return {**self._entries.stats(), "version": self.version}
+
+
+def as_contact_priority(value: Tuple[int, bool]) -> Dict[str, Any]:
+    """將快取值轉為 get_contact_priority 的回傳格式"""
+    return {"priority_boost": value[0], "is_starred": value[1]}
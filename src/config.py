@@ -6,6 +6,8 @@ from typing import Optional
 from pydantic_settings import BaseSettings
 from pydantic import Field
 
+from .constants import DRAFTS
+
 
 class Settings(BaseSettings):
     """系統設定"""
@@ -19,6 +21,26 @@ class Settings(BaseSettings):
     # 資料庫設定
     database_url: str = Field(..., env="DATABASE_URL")
     redis_url: Optional[str] = Field(None, env="REDIS_URL")
+    # 儲存後端：memory://、json://目錄（Demo JSON 檔案）、sqlite:///、postgresql://；未設定時使用 DATABASE_URL
+    storage_url: Optional[str] = Field(None, env="STORAGE_URL")
+    
+    # 資料庫連接池設定
+    db_pool_min_size: int = Field(1, env="DB_POOL_MIN_SIZE")
+    db_pool_max_size: int = Field(10, env="DB_POOL_MAX_SIZE")
+    db_statement_cache_size: int = Field(100, env="DB_STATEMENT_CACHE_SIZE")
+    db_acquire_timeout: float = Field(10.0, env="DB_ACQUIRE_TIMEOUT")
+    db_command_timeout: float = Field(30.0, env="DB_COMMAND_TIMEOUT")
+    db_init_retry_interval: float = Field(30.0, env="DB_INIT_RETRY_INTERVAL")
+    
+    # Prompt 設定
+    prompt_layout: str = Field("default", env="PROMPT_LAYOUT")
+    
+    # 回覆草稿設定（優先級數字大於此值或會被封存的訊息延後產生草稿）
+    draft_eager_max_priority: int = Field(DRAFTS["EAGER_MAX_PRIORITY"], env="DRAFT_EAGER_MAX_PRIORITY")
+    draft_stream_llm: bool = Field(False, env="DRAFT_STREAM_LLM")
+    
+    # 規則集設定（檔案不存在時使用內建規則）
+    rules_path: str = Field("data/rules.json", env="RULES_PATH")
     
     # 系統設定
     debug: bool = Field(False, env="DEBUG")
@@ -10,6 +10,9 @@ CATEGORIES = [
     "廣告"
 ]
 
+# Demo 環境的預設使用者（聯絡人優先級設定屬於此使用者）
+DEFAULT_USER_ID = "demo_user"
+
 # 優先級等級 (1=最高, 5=最低)
 PRIORITY_LEVELS = [1, 2, 3, 4, 5]
 
@@ -106,6 +109,52 @@ DEFAULT_PROMPT_TEMPLATE = """
 }
 """
 
+# 適合供應商 prompt 前綴快取的版面：靜態指示在前，個人化區塊在最後，
+# 所有使用者共用相同前綴
+CACHE_FRIENDLY_PROMPT_TEMPLATE = """
+# Goal
+你的主要任務是協助處理通訊訊息，對收到的訊息進行以下處理：
+1. 分類到四大類別：工作、朋友、家人、廣告
+2. 根據發送者設定優先級 (1-5)
+3. 判斷是否需要封存
+4. 必要時生成符合個人風格的回覆草稿
+
+# Tools
+你有以下工具可用：
+- classify: 判斷訊息類別
+- priority: 設定優先級
+- archive: 決定是否封存
+- draft_reply: 生成回覆草稿
+
+# Constraint
+- 輸出格式必須為有效 JSON
+- 語言、語調風格、回覆字數與個人簽名依照最後的「使用者設定」
+- 回覆草稿結尾加上個人簽名
+
+# Example
+輸入："今晚一起去看電影《沙丘2》好嗎？"
+輸出：
+{
+  "category": "朋友",
+  "priority": 2,
+  "should_archive": false,
+  "draft": "可以啊，幾點開場？（個人簽名）"
+}
+
+# 使用者設定
+你是 {{user_name}}，{{user_profile}}。
+- 語言：{{language}}
+- 語調風格：{{tone_style}}
+- 回覆字數：{{reply_length}}
+- 個人簽名：{{signature}}
+"""
+
+# Prompt 版面（PromptManager 的 layout 參數）
+PROMPT_LAYOUTS = {
+    "default": DEFAULT_PROMPT_TEMPLATE,
+    "cache_friendly": CACHE_FRIENDLY_PROMPT_TEMPLATE
+}
+
 # 錯誤訊息常量
 ERROR_MESSAGES = {
     "INVALID_CATEGORY": "無效的訊息分類",
@@ -123,7 +172,8 @@ API_LIMITS = {
     "MAX_MESSAGE_LENGTH": 5000,      # 最大訊息長度
     "MAX_PROMPT_LENGTH": 10000,      # 最大 Prompt 長度
     "MAX_PROMPTS_PER_USER": 10,      # 每位使用者最多 Prompt 數量
-    "RATE_LIMIT_PER_MINUTE": 100     # 每分鐘 API 呼叫限制
+    "RATE_LIMIT_PER_MINUTE": 100,    # 每分鐘 API 呼叫限制
+    "MAX_PAGE_SIZE": 500             # 分頁查詢每頁上限
 }
 
 # 效能監控
@@ -131,4 +181,109 @@ PERFORMANCE_THRESHOLDS = {
     "MAX_TOOL_EXECUTION_TIME": 5.0,  # 單一工具最大執行時間（秒）
     "MAX_TOTAL_EXECUTION_TIME": 15.0, # 總執行時間上限（秒）
     "TOKEN_WARNING_THRESHOLD": 1000   # Token 使用量警告閾值
-} 
\ No newline at end of file
+} 
+
+# Prompt 快取設定
+PROMPT_CACHE = {
+    "ACTIVE_PROMPT_TTL": 300.0,      # 活躍 Prompt 快取秒數（None 表示只靠主動失效）
+    "MAX_USERS": 10000,              # 快取活躍 Prompt 的使用者數上限
+    "MAX_RENDERED": 50000,           # 渲染結果快取上限
+    "MAX_COMPILED": 256              # 已編譯 Jinja 模板快取上限
+}
+
+# 對話串加權排序的各因子權重（分數越高越前面）
+RANKING_WEIGHTS = {
+    "priority": 1.0,                 # 優先級（1 → 1.0，5 → 0.2）
+    "recency": 0.5,                  # 時間衰減（最新訊息為 1.0，每經過半衰期減半）
+    "unread": 0.2,                   # 未讀數（達 UNREAD_CAP 時為 1.0）
+    "starred": 0.3                   # 星號聯絡人
+}
+
+# 對話串加權排序的因子參數（與權重分開設定）
+RANKING = {
+    "RECENCY_HALF_LIFE_HOURS": 24.0, # 時間衰減的半衰期（小時）
+    "UNREAD_CAP": 10                 # 未讀數計分上限
+}
+
+# 延遲產生回覆草稿設定
+DRAFTS = {
+    "EAGER_MAX_PRIORITY": 3,         # 優先級數字不大於此值（且不封存）時立即產生草稿
+    "MAX_PENDING": 10000,            # 尚未產生的草稿 token 上限
+    "MAX_CACHED": 10000,             # 已產生草稿的快取上限
+    "MAX_REPLY_TABLES": 1024         # 已編譯回覆模板表（每組語調設定一份）的快取上限
+}
+
+# 串流草稿使用的 LLM 指示（簽名由程式在最後附加，模型不需輸出）
+DRAFT_STREAM_PROMPT = (
+    "你是 {name} 的訊息回覆助手。請直接輸出一則回覆草稿，不要加任何說明。\n"
+    "語調風格: {style}\n"
+    "回覆長度: {reply_length}\n"
+    "語言: {language}\n"
+    "不要加上簽名。"
+)
+
+# 回覆草稿模板：語言 -> 意圖 -> 語調風格 -> 回覆
+# 未列出的風格依 REPLY_STYLE_FALLBACK 取用相近風格，未支援的語言使用 zh-tw
+REPLY_TEMPLATES = {
+    "zh-tw": {
+        "question": {"正式": "好的，沒問題。", "輕鬆": "可以啊！", "極簡": "好",
+                     "詳細": "好的，沒問題，細節我再跟你確認。", "幽默": "當然可以，包在我身上！",
+                     "專業": "好的，沒問題，我會安排處理。"},
+        "thanks": {"正式": "不用客氣！", "輕鬆": "不用客氣！", "極簡": "不客氣",
+                   "詳細": "不用客氣！有需要隨時告訴我。", "幽默": "小事一樁，不用客氣啦！",
+                   "專業": "不客氣，很高興能協助。"},
+        "meeting": {"正式": "收到，我會準時參加。", "輕鬆": "收到，我會準時參加。", "極簡": "收到，我會準時參加。",
+                    "詳細": "收到，我會準時參加，並先準備好相關資料。", "幽默": "收到，我會準時出席，絕不遲到！",
+                    "專業": "收到，我會準時參加並準備相關資料。"},
+        "general": {"正式": "好的，我知道了。", "輕鬆": "了解！", "極簡": "收到",
+                    "詳細": "好的，我知道了，有進一步消息再跟你說。", "幽默": "收到收到，了解！",
+                    "專業": "好的，已收到，我會跟進。"},
+    },
+    "zh-cn": {
+        "question": {"正式": "好的，没问题。", "輕鬆": "可以啊！", "極簡": "好",
+                     "詳細": "好的，没问题，细节我再跟你确认。", "幽默": "当然可以，包在我身上！",
+                     "專業": "好的，没问题，我会安排处理。"},
+        "thanks": {"正式": "不用客气！", "輕鬆": "不用客气！", "極簡": "不客气",
+                   "詳細": "不用客气！有需要随时告诉我。", "幽默": "小事一桩，不用客气啦！",
+                   "專業": "不客气，很高兴能协助。"},
+        "meeting": {"正式": "收到，我会准时参加。", "極簡": "收到，我会准时参加。",
+                    "詳細": "收到，我会准时参加，并先准备好相关资料。", "幽默": "收到，我会准时出席，绝不迟到！"},
+        "general": {"正式": "好的，我知道了。", "輕鬆": "了解！", "極簡": "收到",
+                    "詳細": "好的，我知道了，有进一步消息再跟你说。", "幽默": "收到收到，了解！",
+                    "專業": "好的，已收到，我会跟进。"},
+    },
+    "en": {
+        "question": {"正式": "Sure, no problem.", "輕鬆": "Sure thing!", "極簡": "OK"},
+        "thanks": {"正式": "You're welcome!", "極簡": "Welcome"},
+        "meeting": {"正式": "Got it, I'll be there on time.", "極簡": "Got it"},
+        "general": {"正式": "Noted, thank you.", "輕鬆": "Got it!", "極簡": "OK"},
+    },
+    "ja": {
+        "question": {"正式": "はい、問題ありません。", "輕鬆": "いいよ！", "極簡": "はい"},
+        "thanks": {"正式": "どういたしまして！", "極簡": "いえいえ"},
+        "meeting": {"正式": "承知しました。時間通りに参加します。", "極簡": "了解です"},
+        "general": {"正式": "承知しました。", "輕鬆": "了解！", "極簡": "了解"},
+    },
+    "ko": {
+        "question": {"正式": "네, 괜찮습니다.", "輕鬆": "좋아!", "極簡": "네"},
+        "thanks": {"正式": "천만에요!", "極簡": "별말씀을요"},
+        "meeting": {"正式": "알겠습니다. 시간 맞춰 참석하겠습니다.", "極簡": "확인했습니다"},
+        "general": {"正式": "알겠습니다.", "輕鬆": "알겠어!", "極簡": "확인"},
+    },
+}
+
+# 回覆長度偏好優先採用的風格（其餘長度直接依語調風格）
+REPLY_LENGTH_STYLE = {
+    "極簡": "極簡",
+    "詳細": "詳細"
+}
+
+# 模板缺少某風格時依序嘗試的風格
+REPLY_STYLE_FALLBACK = {
+    "正式": ["正式"],
+    "輕鬆": ["輕鬆", "正式"],
+    "極簡": ["極簡", "正式"],
+    "詳細": ["詳細", "正式"],
+    "幽默": ["幽默", "輕鬆", "正式"],
+    "專業": ["專業", "正式"],
+}
@@ -1,27 +1,312 @@
 """
 資料庫管理模組
 """
+import hashlib
+import json
 import logging
-import asyncpg
-from typing import Optional, List, Dict, Any
-from datetime import datetime
 import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Optional, List, Dict, Any
+from datetime import datetime, timedelta
+
+import asyncpg
+import asyncpg.connection
+
+try:
+    import psycopg2
+    import psycopg2.pool
+except ImportError:
+    psycopg2 = None
+
+from .cache import ContactPriorityCache, DEFAULT_CONTACT_PRIORITY, LRUCache, as_contact_priority
+from .message_store import project_message
+from .query_metrics import POOL_WAIT, QueryMetrics
+from .storage import StorageBackend
 
 logger = logging.getLogger(__name__)
 
+# 聯絡人優先級快取在 cache_versions 表中的名稱
+CONTACT_CACHE_NAME = "contact_priorities"
+
+# 執行統計彙總表（粒度 -> 資料表）
+ROLLUP_TABLES = {
+    "hour": "agent_execution_rollups_hourly",
+    "day": "agent_execution_rollups_daily",
+}
+
+# SQLite 批次查詢每次最多帶入的 IN 參數數量
+SQLITE_MAX_IN_PARAMS = 500
+
+# 未設定 DATABASE_URL 時使用的本機 SQLite 資料庫
+DEFAULT_SQLITE_URL = "sqlite:///data/ai_line.db"
+
+# 執行日誌依月份分區：postgres 為 RANGE 分區表，SQLite 為每月一張資料表
+LOG_TABLE = "agent_execution_logs"
+LOG_PARTITION_PREFIX = f"{LOG_TABLE}_p"
+
+# 行程內記住已寫入 prompts_seen 的雜湊數量上限
+SEEN_PROMPT_CACHE_SIZE = 4096
+
+
+def _truncate_hour(dt: datetime) -> datetime:
+    return dt.replace(minute=0, second=0, microsecond=0)
+
+
+def _truncate_day(dt: datetime) -> datetime:
+    return dt.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def rollup_query_ranges(start: datetime, end: datetime) -> Dict[str, Any]:
+    """
+    將統計區間 [start, end) 拆成每日彙總與每小時彙總的查詢範圍
+    
+    完整的日子讀每日彙總，頭尾不足一天的部分讀每小時彙總（以小時為最小精度）。
+    """
+    hour_start = _truncate_hour(start)
+    day_start = _truncate_day(start)
+    if day_start < hour_start:
+        day_start += timedelta(days=1)
+    day_end = _truncate_day(end)
+    if day_start >= day_end:
+        # 區間不足一整天，全部由每小時彙總提供
+        return {"daily": (day_end, day_end), "hourly": [(hour_start, end)]}
+    return {"daily": (day_start, day_end), "hourly": [(hour_start, day_start), (day_end, end)]}
+
+
+def _month_start(dt: datetime) -> datetime:
+    return dt.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _next_month(dt: datetime) -> datetime:
+    return (_month_start(dt) + timedelta(days=32)).replace(day=1)
+
+
+def log_partition_name(timestamp: datetime) -> str:
+    """執行日誌所屬的月份分區名稱，例如 agent_execution_logs_p202401"""
+    return f"{LOG_PARTITION_PREFIX}{timestamp:%Y%m}"
+
+
+def partition_month(name: str) -> Optional[datetime]:
+    """由分區名稱解析月份起點，非分區名稱回傳 None"""
+    if not name.startswith(LOG_PARTITION_PREFIX):
+        return None
+    try:
+        return datetime.strptime(name[len(LOG_PARTITION_PREFIX):], "%Y%m")
+    except ValueError:
+        return None
+
+
+# 執行日誌表（postgres，依月份 RANGE 分區，分區於寫入時建立）
+PG_LOG_TABLE_DDL = """
+    CREATE TABLE IF NOT EXISTS agent_execution_logs (
+        id BIGSERIAL,
+        user_id VARCHAR(50) NOT NULL,
+        message_text TEXT NOT NULL,
+        prompt_hash CHAR(64) NOT NULL,
+        tool_results JSONB NOT NULL,
+        final_response JSONB NOT NULL,
+        total_execution_time FLOAT NOT NULL,
+        token_usage JSONB NOT NULL,
+        rule_version VARCHAR(64),
+        timestamp TIMESTAMP NOT NULL DEFAULT NOW(),
+        PRIMARY KEY (id, timestamp)
+    ) PARTITION BY RANGE (timestamp)
+"""
+
+# 規則集版本欄位加入前建立的日誌表（分區表新增欄位會套用到所有分區）
+PG_LOG_ADD_RULE_VERSION = f"ALTER TABLE {LOG_TABLE} ADD COLUMN IF NOT EXISTS rule_version VARCHAR(64)"
+
+# 既有日誌表的狀態（資料表不存在時沒有資料列）
+PG_LOG_TABLE_STATE = """
+    SELECT
+        EXISTS (SELECT 1 FROM pg_partitioned_table p WHERE p.partrelid = c.oid) AS partitioned,
+        EXISTS (SELECT 1 FROM pg_attribute a
+                WHERE a.attrelid = c.oid AND a.attname = 'prompt_hash' AND NOT a.attisdropped) AS has_prompt_hash,
+        EXISTS (SELECT 1 FROM pg_attribute a
+                WHERE a.attrelid = c.oid AND a.attname = 'prompt_used' AND NOT a.attisdropped) AS has_prompt_used
+    FROM pg_class c
+    WHERE c.oid = to_regclass('agent_execution_logs')
+"""
+
+# 舊版未分區日誌表（完整 Prompt 存在 prompt_used）遷移時的暫存名稱與步驟
+LEGACY_LOG_TABLE = f"{LOG_TABLE}_legacy"
+PG_LEGACY_LOG_MONTHS = f"""
+    SELECT DISTINCT date_trunc('month', COALESCE(timestamp, NOW())) AS month,
+           MIN(COALESCE(timestamp, NOW())) OVER () AS since
+    FROM {LEGACY_LOG_TABLE}
+"""
+PG_LEGACY_LOG_COPY = [
+    f"""
+    INSERT INTO prompts_seen (hash, content)
+    SELECT DISTINCT encode(sha256(convert_to(prompt_used, 'UTF8')), 'hex'), prompt_used
+    FROM {LEGACY_LOG_TABLE}
+    ON CONFLICT (hash) DO NOTHING
+    """,
+    f"""
+    INSERT INTO agent_execution_logs
+        (user_id, message_text, prompt_hash, tool_results, final_response,
+         total_execution_time, token_usage, timestamp)
+    SELECT user_id, message_text, encode(sha256(convert_to(prompt_used, 'UTF8')), 'hex'),
+           tool_results, final_response, total_execution_time, token_usage, COALESCE(timestamp, NOW())
+    FROM {LEGACY_LOG_TABLE}
+    """,
+    f"DROP TABLE {LEGACY_LOG_TABLE}",
+]
+
+
+def pg_partition_ddl(month: datetime) -> str:
+    """建立 month 所屬月份分區的 DDL（postgres）"""
+    month = _month_start(month)
+    return f"""
+        CREATE TABLE IF NOT EXISTS {log_partition_name(month)} PARTITION OF agent_execution_logs
+        FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{_next_month(month):%Y-%m-%d}')
+    """
+
+
+def log_table_needs_migration(state: Optional[Dict[str, Any]]) -> bool:
+    """
+    依 PG_LOG_TABLE_STATE 判斷既有日誌表是否需要遷移為分區表
+
+    CREATE TABLE IF NOT EXISTS 遇到舊表不會有任何作用，之後每次寫入都會因缺少 prompt_hash 而失敗；
+    無法自動遷移的結構直接拋出 RuntimeError，讓啟動失敗而不是每個請求各記一筆錯誤
+    """
+    if state is None:
+        return False
+    if state["partitioned"]:
+        if not state["has_prompt_hash"]:
+            raise RuntimeError(f"{LOG_TABLE} 已分區但缺少 prompt_hash 欄位，請手動遷移")
+        return False
+    if not state["has_prompt_used"]:
+        raise RuntimeError(f"無法辨識的 {LOG_TABLE} 結構（未分區且沒有 prompt_used 欄位），請手動遷移")
+    return True
+
+
+def expired_log_partitions(names: List[str], cutoff: datetime) -> List[str]:
+    """整個月份都早於 cutoff 的分區（可直接整表刪除）"""
+    expired = []
+    for name in names:
+        month = partition_month(name)
+        if month is not None and _next_month(month) <= cutoff:
+            expired.append(name)
+    return sorted(expired)
+
+
+def prompt_hash(content: str) -> str:
+    """prompts_seen 的內容定址鍵（SHA-256）"""
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def _empty_stats() -> Dict[str, Any]:
+    return {"total_executions": 0, "avg_execution_time": 0, "total_tokens": 0}
+
+
+def _stats_from_totals(executions, total_time, total_tokens) -> Dict[str, Any]:
+    executions = int(executions or 0)
+    if not executions:
+        return _empty_stats()
+    return {
+        "total_executions": executions,
+        "avg_execution_time": float(total_time or 0) / executions,
+        "total_tokens": int(total_tokens or 0)
+    }
+
+
+def _rollup_upsert_sql(table: str) -> str:
+    return f"""
+        INSERT INTO {table} (user_id, bucket, executions, total_execution_time, total_tokens)
+        VALUES ($1, $2, 1, $3, $4)
+        ON CONFLICT (user_id, bucket) DO UPDATE SET
+            executions = {table}.executions + 1,
+            total_execution_time = {table}.total_execution_time + excluded.total_execution_time,
+            total_tokens = {table}.total_tokens + excluded.total_tokens
+    """
+
+
+# 高頻查詢：每個連接第一次使用時 prepare，之後只送參數
+HOT_STATEMENTS = {
+    "get_active_prompt": """
+        SELECT id, name, content, created_at, updated_at
+        FROM user_prompts 
+        WHERE user_id = $1 AND is_active = true
+    """,
+    "get_cache_version": """
+        SELECT version FROM cache_versions WHERE name = $1
+    """,
+    "get_contact_priority": """
+        SELECT priority_boost, is_starred
+        FROM contact_priorities 
+        WHERE user_id = $1 AND sender_id = $2
+    """,
+    "insert_prompt_seen": """
+        INSERT INTO prompts_seen (hash, content) VALUES ($1, $2)
+        ON CONFLICT (hash) DO NOTHING
+    """,
+    "insert_execution_log": """
+        INSERT INTO agent_execution_logs 
+        (user_id, message_text, prompt_hash, tool_results, 
+         final_response, total_execution_time, token_usage, rule_version, timestamp)
+        VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)
+    """,
+    "upsert_rollup_hour": _rollup_upsert_sql(ROLLUP_TABLES["hour"]),
+    "upsert_rollup_day": _rollup_upsert_sql(ROLLUP_TABLES["day"]),
+}
+
+
+class _PreparedConnection(asyncpg.connection.Connection):
+    """保存 HOT_STATEMENTS prepared statement 的連接"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.hot_statements = {}
+
 
 class DatabaseManager:
     """資料庫管理器"""
     
-    def __init__(self, database_url: str = None):
+    def __init__(self, database_url: str = None, contact_cache_size: int = 10000,
+                 version_check_interval: float = 1.0, min_size: int = 1, max_size: int = 10,
+                 statement_cache_size: int = 100, acquire_timeout: float = 10.0,
+                 command_timeout: float = 30.0):
         self.database_url = database_url or os.getenv("DATABASE_URL")
+        self.min_size = min_size
+        self.max_size = max_size
+        self.statement_cache_size = statement_cache_size
+        self.acquire_timeout = acquire_timeout
+        self.command_timeout = command_timeout
         self.pool = None
+        self.contact_cache = ContactPriorityCache(contact_cache_size, version_check_interval)
+        self.metrics = QueryMetrics()
+        self._log_partitions = set()
+        self._seen_prompts = LRUCache(SEEN_PROMPT_CACHE_SIZE)
+    
+    @classmethod
+    def from_settings(cls, settings) -> "DatabaseManager":
+        """以系統設定（config.Settings）的連接池參數建立"""
+        return cls(
+            settings.database_url,
+            min_size=settings.db_pool_min_size,
+            max_size=settings.db_pool_max_size,
+            statement_cache_size=settings.db_statement_cache_size,
+            acquire_timeout=settings.db_acquire_timeout,
+            command_timeout=settings.db_command_timeout,
+        )
     
     async def init_pool(self):
         """初始化連接池"""
         try:
-            self.pool = await asyncpg.create_pool(self.database_url)
-            logger.info("資料庫連接池初始化成功")
+            self.pool = await asyncpg.create_pool(
+                self.database_url,
+                min_size=self.min_size,
+                max_size=self.max_size,
+                statement_cache_size=self.statement_cache_size,
+                command_timeout=self.command_timeout,
+                connection_class=_PreparedConnection,
+            )
+            logger.info(f"資料庫連接池初始化成功 (min={self.min_size}, max={self.max_size})")
         except Exception as e:
             logger.error(f"資料庫連接池初始化失敗: {e}")
             raise
@@ -32,9 +317,51 @@ class DatabaseManager:
             await self.pool.close()
             logger.info("資料庫連接池已關閉")
     
+    @asynccontextmanager
+    async def _acquire(self):
+        """取得連接（記錄等待時間，超過 acquire_timeout 時丟出 asyncio.TimeoutError）"""
+        started = time.perf_counter()
+        conn = await self.pool.acquire(timeout=self.acquire_timeout)
+        self.metrics.record(POOL_WAIT, time.perf_counter() - started)
+        try:
+            yield conn
+        finally:
+            await self.pool.release(conn)
+    
+    async def _statement(self, conn, name: str):
+        """取得此連接上已 prepare 的高頻查詢"""
+        statement = conn.hot_statements.get(name)
+        if statement is None:
+            statement = await conn.prepare(HOT_STATEMENTS[name])
+            conn.hot_statements[name] = statement
+        return statement
+    
+    def pool_stats(self) -> Dict[str, Any]:
+        """連接池使用狀況"""
+        if self.pool is None:
+            return {"initialized": False}
+        size = self.pool.get_size()
+        idle = self.pool.get_idle_size()
+        return {
+            "initialized": True,
+            "size": size,
+            "idle": idle,
+            "in_use": size - idle,
+            "min_size": self.pool.get_min_size(),
+            "max_size": self.pool.get_max_size(),
+        }
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        """查詢延遲、連接池等待與快取統計"""
+        return {
+            "queries": self.metrics.snapshot(),
+            "pool": self.pool_stats(),
+            "contact_cache": self.contact_cache.stats(),
+        }
+    
     async def create_tables(self):
         """建立資料表"""
-        async with self.pool.acquire() as conn:
+        async with self._acquire() as conn:
             # 建立用戶 Prompt 表
             await conn.execute("""
                 CREATE TABLE IF NOT EXISTS user_prompts (
@@ -70,31 +397,80 @@ class DatabaseManager:
                 );
             """)
             
-            # 建立執行日誌表
+            # 建立執行統計彙總表（每小時 / 每日）
+            for table in ROLLUP_TABLES.values():
+                await conn.execute(f"""
+                    CREATE TABLE IF NOT EXISTS {table} (
+                        user_id VARCHAR(50) NOT NULL,
+                        bucket TIMESTAMP NOT NULL,
+                        executions INTEGER NOT NULL DEFAULT 0,
+                        total_execution_time FLOAT NOT NULL DEFAULT 0,
+                        total_tokens BIGINT NOT NULL DEFAULT 0,
+                        PRIMARY KEY (user_id, bucket)
+                    );
+                """)
+            
+            # 建立快取版本表（多 worker 之間的快取一致性）
             await conn.execute("""
-                CREATE TABLE IF NOT EXISTS agent_execution_logs (
-                    id SERIAL PRIMARY KEY,
-                    user_id VARCHAR(50) NOT NULL,
-                    message_text TEXT NOT NULL,
-                    prompt_used TEXT NOT NULL,
-                    tool_results JSONB NOT NULL,
-                    final_response JSONB NOT NULL,
-                    total_execution_time FLOAT NOT NULL,
-                    token_usage JSONB NOT NULL,
-                    timestamp TIMESTAMP DEFAULT NOW()
+                CREATE TABLE IF NOT EXISTS cache_versions (
+                    name VARCHAR(50) PRIMARY KEY,
+                    version BIGINT NOT NULL DEFAULT 0
                 );
             """)
             
+            # 建立 Prompt 內容表（相同內容只存一份，日誌以雜湊參照）
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS prompts_seen (
+                    hash CHAR(64) PRIMARY KEY,
+                    content TEXT NOT NULL,
+                    first_seen TIMESTAMP DEFAULT NOW()
+                );
+            """)
+            
+            # 建立執行日誌表（依月份分區，分區於寫入時建立；舊版未分區表先遷移）
+            migrated_since = await self._migrate_log_table(conn)
+            await conn.execute(PG_LOG_TABLE_DDL)
+            await conn.execute(PG_LOG_ADD_RULE_VERSION)
+            
+            # 執行日誌依使用者與時間查詢的複合索引（自動套用到每個分區）
+            await conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_agent_logs_user_ts
+                ON agent_execution_logs (user_id, timestamp);
+            """)
+            
             logger.info("資料表建立完成")
+        
+        if migrated_since is not None:
+            await self.rebuild_execution_rollups(migrated_since)
+    
+    async def _migrate_log_table(self, conn) -> Optional[datetime]:
+        """
+        將舊版未分區的執行日誌表遷移為月份分區表（單一交易）
+
+        回傳遷移資料的最早時間（供重建彙總），不需遷移或沒有資料時回傳 None
+        """
+        state = await conn.fetchrow(PG_LOG_TABLE_STATE)
+        if not log_table_needs_migration(dict(state) if state else None):
+            return None
+        logger.warning(f"偵測到未分區的 {LOG_TABLE}，開始遷移為月份分區表")
+        async with conn.transaction():
+            await conn.execute(f"ALTER TABLE {LOG_TABLE} RENAME TO {LEGACY_LOG_TABLE}")
+            await conn.execute("DROP INDEX IF EXISTS idx_agent_logs_user_ts")
+            await conn.execute(PG_LOG_TABLE_DDL)
+            months = await conn.fetch(PG_LEGACY_LOG_MONTHS)
+            for row in months:
+                await conn.execute(pg_partition_ddl(row["month"]))
+            for statement in PG_LEGACY_LOG_COPY:
+                await conn.execute(statement)
+        logger.warning(f"{LOG_TABLE} 遷移完成，共 {len(months)} 個月份分區")
+        return months[0]["since"] if months else None
     
     async def get_active_prompt(self, user_id: str) -> Optional[Dict[str, Any]]:
         """獲取用戶活躍的 Prompt"""
-        async with self.pool.acquire() as conn:
-            result = await conn.fetchrow("""
-                SELECT id, name, content, created_at, updated_at
-                FROM user_prompts 
-                WHERE user_id = $1 AND is_active = true
-            """, user_id)
+        async with self._acquire() as conn:
+            with self.metrics.timer("get_active_prompt"):
+                statement = await self._statement(conn, "get_active_prompt")
+                result = await statement.fetchrow(user_id)
             
             if result:
                 return dict(result)
@@ -102,7 +478,7 @@ class DatabaseManager:
     
     async def save_user_prompt(self, user_id: str, name: str, content: str) -> bool:
         """儲存用戶 Prompt"""
-        async with self.pool.acquire() as conn:
+        async with self._acquire() as conn:
             try:
                 await conn.execute("""
                     INSERT INTO user_prompts (user_id, name, content, updated_at)
@@ -117,7 +493,7 @@ class DatabaseManager:
     
     async def activate_prompt(self, user_id: str, prompt_id: int) -> bool:
         """啟用特定 Prompt"""
-        async with self.pool.acquire() as conn:
+        async with self._acquire() as conn:
             async with conn.transaction():
                 try:
                     # 先停用所有 prompt
@@ -141,7 +517,7 @@ class DatabaseManager:
     
     async def get_user_prompts(self, user_id: str) -> List[Dict[str, Any]]:
         """獲取用戶所有 Prompt"""
-        async with self.pool.acquire() as conn:
+        async with self._acquire() as conn:
             results = await conn.fetch("""
                 SELECT id, user_id, name, content, is_active, created_at, updated_at
                 FROM user_prompts 
@@ -153,7 +529,7 @@ class DatabaseManager:
     
     async def delete_prompt(self, user_id: str, prompt_id: int) -> bool:
         """刪除 Prompt"""
-        async with self.pool.acquire() as conn:
+        async with self._acquire() as conn:
             try:
                 result = await conn.execute("""
                     DELETE FROM user_prompts 
@@ -165,130 +541,1065 @@ class DatabaseManager:
                 logger.error(f"刪除 Prompt 失敗: {e}")
                 return False
     
+    async def _check_contact_cache(self):
+        """定期確認聯絡人快取是否仍有效（只有需要確認版本時才取用連線）"""
+        if not self.contact_cache.needs_version_check():
+            return
+        async with self._acquire() as conn:
+            with self.metrics.timer("get_cache_version"):
+                statement = await self._statement(conn, "get_cache_version")
+                version = await statement.fetchval(CONTACT_CACHE_NAME)
+        self.contact_cache.apply_version(version or 0)
+    
     async def get_contact_priority(self, user_id: str, sender_id: str) -> Dict[str, Any]:
-        """獲取聯絡人優先級設定"""
-        async with self.pool.acquire() as conn:
-            result = await conn.fetchrow("""
-                SELECT priority_boost, is_starred
-                FROM contact_priorities 
-                WHERE user_id = $1 AND sender_id = $2
-            """, user_id, sender_id)
-            
-            if result:
-                return dict(result)
-            return {"priority_boost": 0, "is_starred": False}
+        """獲取聯絡人優先級設定（經由行程內快取，命中時不取用連線）"""
+        await self._check_contact_cache()
+        cached = self.contact_cache.get(user_id, sender_id)
+        if cached is not None:
+            return as_contact_priority(cached)
+        
+        generation = self.contact_cache.generation
+        async with self._acquire() as conn:
+            with self.metrics.timer("get_contact_priority"):
+                statement = await self._statement(conn, "get_contact_priority")
+                result = await statement.fetchrow(user_id, sender_id)
+        
+        value = (result["priority_boost"], result["is_starred"]) if result else DEFAULT_CONTACT_PRIORITY
+        self.contact_cache.fill(user_id, sender_id, *value, generation)
+        return as_contact_priority(value)
+    
+    async def get_contact_priorities(self, user_id: str, sender_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """批次獲取多位聯絡人的優先級設定（未設定者填入預設值）"""
+        await self._check_contact_cache()
+        result = {}
+        missing = []
+        for sender_id in dict.fromkeys(sender_ids):
+            cached = self.contact_cache.get(user_id, sender_id)
+            if cached is not None:
+                result[sender_id] = as_contact_priority(cached)
+            else:
+                missing.append(sender_id)
+        if not missing:
+            return result
+        
+        generation = self.contact_cache.generation
+        async with self._acquire() as conn:
+            rows = await conn.fetch("""
+                SELECT sender_id, priority_boost, is_starred
+                FROM contact_priorities
+                WHERE user_id = $1 AND sender_id = ANY($2)
+            """, user_id, missing)
+        
+        found = {row["sender_id"]: (row["priority_boost"], row["is_starred"]) for row in rows}
+        for sender_id in missing:
+            value = found.get(sender_id, DEFAULT_CONTACT_PRIORITY)
+            self.contact_cache.fill(user_id, sender_id, *value, generation)
+            result[sender_id] = as_contact_priority(value)
+        return result
     
     async def set_contact_priority(self, user_id: str, sender_id: str, 
                                  priority_boost: int, is_starred: bool) -> bool:
         """設定聯絡人優先級"""
-        async with self.pool.acquire() as conn:
+        async with self._acquire() as conn:
             try:
-                await conn.execute("""
-                    INSERT INTO contact_priorities (user_id, sender_id, priority_boost, is_starred, updated_at)
-                    VALUES ($1, $2, $3, $4, NOW())
-                    ON CONFLICT (user_id, sender_id) 
-                    DO UPDATE SET 
-                        priority_boost = $3, 
-                        is_starred = $4, 
-                        updated_at = NOW()
-                """, user_id, sender_id, priority_boost, is_starred)
+                async with conn.transaction():
+                    await conn.execute("""
+                        INSERT INTO contact_priorities (user_id, sender_id, priority_boost, is_starred, updated_at)
+                        VALUES ($1, $2, $3, $4, NOW())
+                        ON CONFLICT (user_id, sender_id) 
+                        DO UPDATE SET 
+                            priority_boost = $3, 
+                            is_starred = $4, 
+                            updated_at = NOW()
+                    """, user_id, sender_id, priority_boost, is_starred)
+                    # 通知其他 worker 快取失效
+                    version = await conn.fetchval("""
+                        INSERT INTO cache_versions (name, version) VALUES ($1, 1)
+                        ON CONFLICT (name) DO UPDATE SET version = cache_versions.version + 1
+                        RETURNING version
+                    """, CONTACT_CACHE_NAME)
+                    await conn.execute("SELECT pg_notify('cache_versions', $1)", CONTACT_CACHE_NAME)
+                self.contact_cache.note_own_write(version)
+                self.contact_cache.put(user_id, sender_id, priority_boost, is_starred)
                 return True
             except Exception as e:
                 logger.error(f"設定聯絡人優先級失敗: {e}")
+                self.contact_cache.invalidate(user_id, sender_id)
                 return False
     
+    async def _ensure_log_partition(self, conn, timestamp: datetime):
+        """確保 timestamp 所屬月份的日誌分區存在（已知分區不再查詢資料庫）"""
+        name = log_partition_name(timestamp)
+        if name in self._log_partitions:
+            return
+        month = _month_start(timestamp)
+        try:
+            await conn.execute(pg_partition_ddl(month))
+        except (asyncpg.exceptions.DuplicateTableError, asyncpg.exceptions.UniqueViolationError):
+            # 其他 worker 同時建立了相同分區
+            pass
+        self._log_partitions.add(name)
+    
     async def log_agent_execution(self, log_data: Dict[str, Any]) -> bool:
-        """記錄 Agent 執行日誌"""
-        async with self.pool.acquire() as conn:
+        """
+        記錄 Agent 執行日誌（同一交易內更新每小時 / 每日彙總）
+        
+        Prompt 內容寫入 prompts_seen（相同內容只寫一次），日誌列只存雜湊
+        """
+        timestamp = datetime.now()
+        total_tokens = int((log_data.get('token_usage') or {}).get('total_tokens', 0) or 0)
+        prompt = log_data.get('prompt_used') or ''
+        digest = prompt_hash(prompt)
+        async with self._acquire() as conn:
             try:
-                await conn.execute("""
-                    INSERT INTO agent_execution_logs 
-                    (user_id, message_text, prompt_used, tool_results, 
-                     final_response, total_execution_time, token_usage)
-                    VALUES ($1, $2, $3, $4, $5, $6, $7)
-                """, 
-                    log_data['user_id'],
-                    log_data['message_text'],
-                    log_data['prompt_used'],
-                    log_data['tool_results'],
-                    log_data['final_response'],
-                    log_data['total_execution_time'],
-                    log_data['token_usage']
-                )
+                await self._ensure_log_partition(conn, timestamp)
+                with self.metrics.timer("log_agent_execution"):
+                    async with conn.transaction():
+                        if digest not in self._seen_prompts:
+                            statement = await self._statement(conn, "insert_prompt_seen")
+                            await statement.fetch(digest, prompt)
+                        statement = await self._statement(conn, "insert_execution_log")
+                        await statement.fetch(
+                            log_data['user_id'],
+                            log_data['message_text'],
+                            digest,
+                            json.dumps(log_data['tool_results'], ensure_ascii=False, default=str),
+                            json.dumps(log_data['final_response'], ensure_ascii=False, default=str),
+                            log_data['total_execution_time'],
+                            json.dumps(log_data['token_usage'], ensure_ascii=False, default=str),
+                            log_data.get('rule_version'),
+                            timestamp
+                        )
+                        for bucket, name in ((_truncate_hour(timestamp), "upsert_rollup_hour"),
+                                             (_truncate_day(timestamp), "upsert_rollup_day")):
+                            statement = await self._statement(conn, name)
+                            await statement.fetch(log_data['user_id'], bucket,
+                                                  log_data['total_execution_time'], total_tokens)
+                self._seen_prompts.put(digest, True)
                 return True
             except Exception as e:
                 logger.error(f"記錄執行日誌失敗: {e}")
                 return False
     
-    async def get_execution_stats(self, user_id: str, days: int = 30) -> Dict[str, Any]:
-        """獲取執行統計"""
-        async with self.pool.acquire() as conn:
-            result = await conn.fetchrow("""
-                SELECT 
-                    COUNT(*) as total_executions,
-                    AVG(total_execution_time) as avg_execution_time,
-                    SUM((token_usage->>'total_tokens')::int) as total_tokens
-                FROM agent_execution_logs 
-                WHERE user_id = $1 
-                AND timestamp >= NOW() - INTERVAL '%s days'
-            """, user_id, days)
+    async def get_seen_prompt(self, digest: str) -> Optional[str]:
+        """以雜湊取得執行日誌參照的 Prompt 內容"""
+        async with self._acquire() as conn:
+            return await conn.fetchval("SELECT content FROM prompts_seen WHERE hash = $1", digest)
+    
+    async def purge_execution_logs(self, retain_days: int = 30) -> int:
+        """
+        刪除超過保留天數的執行日誌（彙總表不受影響）
+        
+        以整個月份分區為單位 DROP，不逐筆 DELETE；跨越保留界線的月份會保留到整月過期為止。
+        回傳刪除的分區數。
+        """
+        cutoff = datetime.now() - timedelta(days=retain_days)
+        async with self._acquire() as conn:
+            rows = await conn.fetch("""
+                SELECT child.relname AS name
+                FROM pg_inherits
+                JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+                JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+                WHERE parent.relname = 'agent_execution_logs'
+            """)
+            expired = expired_log_partitions([row["name"] for row in rows], cutoff)
+            for name in expired:
+                await conn.execute(f"DROP TABLE IF EXISTS {name}")
+                self._log_partitions.discard(name)
+        logger.info(f"已清除 {len(expired)} 個過期執行日誌分區")
+        return len(expired)
+    
+    async def rebuild_execution_rollups(self, since: datetime) -> None:
+        """由原始執行日誌重建 since 之後的彙總（回補或定期校正用）"""
+        async with self._acquire() as conn:
+            async with conn.transaction():
+                for unit, table in ROLLUP_TABLES.items():
+                    bucket_start = _truncate_hour(since) if unit == "hour" else _truncate_day(since)
+                    await conn.execute(f"DELETE FROM {table} WHERE bucket >= $1", bucket_start)
+                    await conn.execute(f"""
+                        INSERT INTO {table} (user_id, bucket, executions, total_execution_time, total_tokens)
+                        SELECT
+                            user_id,
+                            date_trunc('{unit}', timestamp),
+                            COUNT(*),
+                            SUM(total_execution_time),
+                            COALESCE(SUM((token_usage->>'total_tokens')::int), 0)
+                        FROM agent_execution_logs
+                        WHERE timestamp >= $1
+                        GROUP BY user_id, date_trunc('{unit}', timestamp)
+                    """, bucket_start)
+        logger.info(f"已重建 {since.isoformat()} 之後的執行統計彙總")
+    
+    async def get_execution_stats(self, user_id: str, days: int = 30,
+                                  start: Optional[datetime] = None,
+                                  end: Optional[datetime] = None) -> Dict[str, Any]:
+        """
+        獲取執行統計（讀取彙總表，不掃描原始日誌）
+        
+        預設為最近 days 天；也可指定任意區間 [start, end)
+        """
+        end = end or datetime.now()
+        start = start or end - timedelta(days=days)
+        ranges = rollup_query_ranges(start, end)
+        (day_from, day_to), hourly = ranges["daily"], ranges["hourly"]
+        hour_conditions = " OR ".join(
+            f"(bucket >= ${3 + i * 2} AND bucket < ${4 + i * 2})" for i in range(len(hourly))
+        )
+        
+        async with self._acquire() as conn:
+            result = await conn.fetchrow(f"""
+                SELECT SUM(executions) AS executions,
+                       SUM(total_execution_time) AS total_time,
+                       SUM(total_tokens) AS total_tokens
+                FROM (
+                    SELECT executions, total_execution_time, total_tokens
+                    FROM {ROLLUP_TABLES["day"]}
+                    WHERE user_id = $1 AND bucket >= $2 AND bucket < ${3 + len(hourly) * 2}
+                    UNION ALL
+                    SELECT executions, total_execution_time, total_tokens
+                    FROM {ROLLUP_TABLES["hour"]}
+                    WHERE user_id = $1 AND ({hour_conditions})
+                ) AS buckets
+            """, user_id, day_from, *[value for pair in hourly for value in pair], day_to)
             
             if result:
-                return dict(result)
-            return {"total_executions": 0, "avg_execution_time": 0, "total_tokens": 0}
+                return _stats_from_totals(result["executions"], result["total_time"], result["total_tokens"])
+            return _empty_stats()
 
 
-# 同步版本的簡化介面（為了相容性）
-class SyncDatabaseManager:
-    """同步版本的資料庫管理器（簡化版）"""
+# 同步版本的介面（工具與 PromptManager 使用）
+class _SQLitePool:
+    """與 psycopg2 連接池介面相同的 SQLite 連接池（本機開發用）"""
     
-    def __init__(self, database_url: str = None):
-        self.database_url = database_url or os.getenv("DATABASE_URL")
-        # 在實際實作中，這裡會使用 psycopg2 或其他同步驅動
-        # 目前先提供介面定義
+    def __init__(self, minconn: int, maxconn: int, path: str,
+                 cached_statements: int = 128, timeout: float = 5.0):
+        self.maxconn = maxconn
+        self._path = path
+        self._cached_statements = cached_statements
+        self._timeout = timeout
+        # 記憶體資料庫需使用共享快取，讓池中所有連接看到同一份資料
+        self._uri = path == ":memory:"
+        if self._uri:
+            self._path = f"file:ai_line_{id(self)}?mode=memory&cache=shared"
+        self._idle = queue.LifoQueue()
+        for _ in range(max(1, minconn)):
+            self._idle.put(self._connect())
+    
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite3 以每個連接的語句快取重用已編譯的查詢
+        conn = sqlite3.connect(self._path, uri=self._uri, check_same_thread=False,
+                               timeout=self._timeout, cached_statements=self._cached_statements)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+    
+    def getconn(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+    
+    def putconn(self, conn: sqlite3.Connection):
+        self._idle.put(conn)
+    
+    def closeall(self):
+        while not self._idle.empty():
+            self._idle.get_nowait().close()
+
+
+# 各資料庫方言的 SQL 片段
+_SQL_DIALECTS = {
+    "postgres": {
+        "id_column": "SERIAL PRIMARY KEY",
+        "json_type": "JSONB",
+        "true": "true",
+        "false": "false",
+        "now": "NOW()",
+        "total_tokens": "(token_usage->>'total_tokens')::int",
+        "hour_bucket": "date_trunc('hour', timestamp)",
+        "day_bucket": "date_trunc('day', timestamp)",
+    },
+    "sqlite": {
+        "id_column": "INTEGER PRIMARY KEY AUTOINCREMENT",
+        "json_type": "TEXT",
+        "true": "1",
+        "false": "0",
+        "now": "CURRENT_TIMESTAMP",
+        "total_tokens": "CAST(json_extract(token_usage, '$.total_tokens') AS INTEGER)",
+        "hour_bucket": "strftime('%Y-%m-%d %H:00:00', timestamp)",
+        "day_bucket": "strftime('%Y-%m-%d 00:00:00', timestamp)",
+    },
+}
+
+
+class SyncDatabaseManager(StorageBackend):
+    """
+    同步版本的資料庫管理器（StorageBackend 的 SQLite / PostgreSQL 實作）
+    
+    以執行緒安全的共用連接池存取資料庫：DATABASE_URL 為 postgres 時使用 psycopg2 連接池，
+    未設定或為 sqlite:/// 時使用本機 SQLite 檔案。連接池於第一次查詢時建立。
+    """
+    
+    def __init__(self, database_url: str = None, min_size: int = 1, max_size: int = 10,
+                 contact_cache_size: int = 10000, version_check_interval: float = 1.0,
+                 listen_notify: bool = False, statement_cache_size: int = 100,
+                 acquire_timeout: float = 10.0, command_timeout: float = 30.0,
+                 init_retry_interval: float = 30.0):
+        self.database_url = database_url or os.getenv("DATABASE_URL") or DEFAULT_SQLITE_URL
+        self.min_size = min_size
+        self.max_size = max_size
+        self.statement_cache_size = statement_cache_size
+        self.acquire_timeout = acquire_timeout
+        self.command_timeout = command_timeout
+        # 連接池初始化失敗後，此期間內的查詢直接回報同一個錯誤，不再重新連線
+        self.init_retry_interval = init_retry_interval
+        self._init_error: Optional[Exception] = None
+        self._init_failed_at = 0.0
+        self.metrics = QueryMetrics()
+        self.dialect = "postgres" if self.database_url.startswith(("postgres://", "postgresql://")) else "sqlite"
+        if self.dialect == "postgres" and psycopg2 is None:
+            logger.warning("未安裝 psycopg2，改用本機 SQLite 資料庫")
+            self.database_url = DEFAULT_SQLITE_URL
+            self.dialect = "sqlite"
+        self._sql = _SQL_DIALECTS[self.dialect]
+        self.contact_cache = ContactPriorityCache(contact_cache_size, version_check_interval)
+        # postgres 可改用 LISTEN/NOTIFY 偵測其他 worker 的修改，省去版本查詢
+        self.listen_notify = listen_notify and self.dialect == "postgres"
+        self._listen_conn = None
+        self._log_partitions = set()
+        self._seen_prompts = LRUCache(SEEN_PROMPT_CACHE_SIZE)
+        self.pool = None
+        self._slots = None
+        self._pool_lock = threading.Lock()
+        self._in_use = 0
+        self._usage_lock = threading.Lock()
+    
+    @classmethod
+    def from_settings(cls, settings) -> "SyncDatabaseManager":
+        """以系統設定（config.Settings）的連接池參數建立"""
+        return cls(
+            settings.database_url,
+            min_size=settings.db_pool_min_size,
+            max_size=settings.db_pool_max_size,
+            statement_cache_size=settings.db_statement_cache_size,
+            acquire_timeout=settings.db_acquire_timeout,
+            command_timeout=settings.db_command_timeout,
+            init_retry_interval=settings.db_init_retry_interval,
+        )
+    
+    def init_pool(self):
+        """
+        初始化連接池並確保資料表存在
+
+        失敗後 init_retry_interval 秒內不再重試，直接拋出 RuntimeError（避免每次工具呼叫都重新連線）
+        """
+        with self._pool_lock:
+            if self.pool is not None:
+                return
+            if self._init_error is not None:
+                remaining = self.init_retry_interval - (time.monotonic() - self._init_failed_at)
+                if remaining > 0:
+                    raise RuntimeError(f"同步資料庫連接池初始化失敗，{remaining:.0f} 秒後重試: "
+                                       f"{self._init_error}") from self._init_error
+            try:
+                if self.dialect == "postgres":
+                    pool = psycopg2.pool.ThreadedConnectionPool(
+                        self.min_size, self.max_size, self.database_url,
+                        options=f"-c statement_timeout={int(self.command_timeout * 1000)}")
+                else:
+                    path = self.database_url[len("sqlite:///"):] if self.database_url.startswith("sqlite:///") else ":memory:"
+                    if path != ":memory:" and os.path.dirname(path):
+                        os.makedirs(os.path.dirname(path), exist_ok=True)
+                    pool = _SQLitePool(self.min_size, self.max_size, path,
+                                       cached_statements=self.statement_cache_size,
+                                       timeout=self.command_timeout)
+                # psycopg2 連接池用盡時會直接丟錯，以號誌讓呼叫端等待
+                self._slots = threading.BoundedSemaphore(self.max_size)
+                self.pool = pool
+                self._init_error = None
+                logger.info(f"同步資料庫連接池初始化成功 ({self.dialect})")
+            except Exception as e:
+                self._init_error = e
+                self._init_failed_at = time.monotonic()
+                logger.error(f"同步資料庫連接池初始化失敗，{self.init_retry_interval:.0f} 秒內不再重試: {e}")
+                raise
+        self.create_tables()
+    
+    def close(self):
+        """關閉連接池（StorageBackend 介面）"""
+        self.close_pool()
+    
+    def close_pool(self):
+        """關閉連接池"""
+        with self._pool_lock:
+            if self._listen_conn is not None:
+                self._listen_conn.close()
+                self._listen_conn = None
+            if self.pool is not None:
+                self.pool.closeall()
+                self.pool = None
+                logger.info("同步資料庫連接池已關閉")
+    
+    @contextmanager
+    def connection(self):
+        """從連接池取得連接，區塊結束時提交（發生例外則回滾）並歸還"""
+        if self.pool is None:
+            self.init_pool()
+        started = time.perf_counter()
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            raise TimeoutError(f"等待資料庫連接逾時 ({self.acquire_timeout}s)")
+        try:
+            conn = self.pool.getconn()
+            self.metrics.record(POOL_WAIT, time.perf_counter() - started)
+            with self._usage_lock:
+                self._in_use += 1
+            try:
+                yield conn
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                with self._usage_lock:
+                    self._in_use -= 1
+                self.pool.putconn(conn)
+        finally:
+            self._slots.release()
+    
+    def pool_stats(self) -> Dict[str, Any]:
+        """連接池使用狀況"""
+        if self.pool is None:
+            return {"initialized": False}
+        return {
+            "initialized": True,
+            "dialect": self.dialect,
+            "in_use": self._in_use,
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+        }
+    
+    def get_metrics(self) -> Dict[str, Any]:
+        """查詢延遲、連接池等待與快取統計"""
+        return {
+            "queries": self.metrics.snapshot(),
+            "pool": self.pool_stats(),
+            "contact_cache": self.contact_cache.stats(),
+        }
+    
+    def _q(self, sql: str) -> str:
+        """套用方言片段與參數佔位符"""
+        sql = sql.format(**self._sql)
+        return sql.replace("%s", "?") if self.dialect == "sqlite" else sql
+    
+    def _execute(self, conn, sql: str, params: tuple = ()):
+        cursor = conn.cursor()
+        cursor.execute(self._q(sql), params)
+        return cursor
+    
+    def _ts(self, value: datetime):
+        """時間參數（SQLite 以與 CURRENT_TIMESTAMP 相同格式的字串比較）"""
+        return value.strftime("%Y-%m-%d %H:%M:%S") if self.dialect == "sqlite" else value
+    
+    @staticmethod
+    def _row_to_dict(cursor, row) -> Dict[str, Any]:
+        return {column[0]: value for column, value in zip(cursor.description, row)}
+    
+    def create_tables(self):
+        """建立資料表（同步版本）"""
+        with self.connection() as conn:
+            self._execute(conn, """
+                CREATE TABLE IF NOT EXISTS user_prompts (
+                    id {id_column},
+                    user_id VARCHAR(50) NOT NULL,
+                    name VARCHAR(100) NOT NULL,
+                    content TEXT NOT NULL,
+                    is_active BOOLEAN DEFAULT false,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    UNIQUE(user_id, name)
+                )
+            """)
+            self._execute(conn, """
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_user_active_prompt
+                ON user_prompts (user_id)
+                WHERE is_active = {true}
+            """)
+            self._execute(conn, """
+                CREATE TABLE IF NOT EXISTS contact_priorities (
+                    id {id_column},
+                    user_id VARCHAR(50) NOT NULL,
+                    sender_id VARCHAR(50) NOT NULL,
+                    priority_boost INTEGER DEFAULT 0,
+                    is_starred BOOLEAN DEFAULT false,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    UNIQUE(user_id, sender_id)
+                )
+            """)
+            self._execute(conn, """
+                CREATE TABLE IF NOT EXISTS messages (
+                    id {id_column},
+                    text TEXT NOT NULL,
+                    sender_id VARCHAR(50) NOT NULL,
+                    sender_name VARCHAR(100) NOT NULL,
+                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    processed BOOLEAN DEFAULT false,
+                    processing_result {json_type},
+                    processed_at TIMESTAMP
+                )
+            """)
+            self._execute(conn, """
+                CREATE INDEX IF NOT EXISTS idx_messages_unprocessed
+                ON messages (id)
+                WHERE processed = {false}
+            """)
+            self._execute(conn, """
+                CREATE TABLE IF NOT EXISTS prompts_seen (
+                    hash CHAR(64) PRIMARY KEY,
+                    content TEXT NOT NULL,
+                    first_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            migrated_since = None
+            if self.dialect == "postgres":
+                # SQLite 沒有分區表，每月的日誌表於寫入時建立；postgres 的舊版未分區表先遷移
+                migrated_since = self._migrate_log_table(conn)
+                self._execute(conn, PG_LOG_TABLE_DDL)
+                self._execute(conn, PG_LOG_ADD_RULE_VERSION)
+                self._execute(conn, """
+                    CREATE INDEX IF NOT EXISTS idx_agent_logs_user_ts
+                    ON agent_execution_logs (user_id, timestamp)
+                """)
+            for table in ROLLUP_TABLES.values():
+                self._execute(conn, f"""
+                    CREATE TABLE IF NOT EXISTS {table} (
+                        user_id VARCHAR(50) NOT NULL,
+                        bucket TIMESTAMP NOT NULL,
+                        executions INTEGER NOT NULL DEFAULT 0,
+                        total_execution_time FLOAT NOT NULL DEFAULT 0,
+                        total_tokens BIGINT NOT NULL DEFAULT 0,
+                        PRIMARY KEY (user_id, bucket)
+                    )
+                """)
+            self._execute(conn, """
+                CREATE TABLE IF NOT EXISTS cache_versions (
+                    name VARCHAR(50) PRIMARY KEY,
+                    version BIGINT NOT NULL DEFAULT 0
+                )
+            """)
+        
+        if migrated_since is not None:
+            self.rebuild_execution_rollups(migrated_since)
+    
+    def _migrate_log_table(self, conn) -> Optional[datetime]:
+        """
+        將舊版未分區的執行日誌表遷移為月份分區表（postgres，與 create_tables 同一交易）
+
+        回傳遷移資料的最早時間（供重建彙總），不需遷移或沒有資料時回傳 None
+        """
+        cursor = self._execute(conn, PG_LOG_TABLE_STATE)
+        row = cursor.fetchone()
+        if not log_table_needs_migration(self._row_to_dict(cursor, row) if row else None):
+            return None
+        logger.warning(f"偵測到未分區的 {LOG_TABLE}，開始遷移為月份分區表")
+        self._execute(conn, f"ALTER TABLE {LOG_TABLE} RENAME TO {LEGACY_LOG_TABLE}")
+        self._execute(conn, "DROP INDEX IF EXISTS idx_agent_logs_user_ts")
+        self._execute(conn, PG_LOG_TABLE_DDL)
+        cursor = self._execute(conn, PG_LEGACY_LOG_MONTHS)
+        months = [self._row_to_dict(cursor, row) for row in cursor.fetchall()]
+        for month in months:
+            self._execute(conn, pg_partition_ddl(month["month"]))
+        for statement in PG_LEGACY_LOG_COPY:
+            self._execute(conn, statement)
+        logger.warning(f"{LOG_TABLE} 遷移完成，共 {len(months)} 個月份分區")
+        return months[0]["since"] if months else None
+    
+    def _bump_cache_version(self, conn, name: str) -> int:
+        """遞增快取版本（於同一交易內）並回傳新版本，postgres 另發出 NOTIFY"""
+        self._execute(conn, """
+            INSERT INTO cache_versions (name, version) VALUES (%s, 1)
+            ON CONFLICT (name) DO UPDATE SET version = cache_versions.version + 1
+        """, (name,))
+        if self.dialect == "postgres":
+            self._execute(conn, "SELECT pg_notify('cache_versions', %s)", (name,))
+        cursor = self._execute(conn, "SELECT version FROM cache_versions WHERE name = %s", (name,))
+        return cursor.fetchone()[0]
+    
+    def _check_contact_cache(self):
+        """定期確認聯絡人快取是否仍有效"""
+        if not self.contact_cache.needs_version_check():
+            return
+        if self.listen_notify:
+            if self._listen_conn is None:
+                self._listen_conn = psycopg2.connect(self.database_url)
+                self._listen_conn.autocommit = True
+                self._listen_conn.cursor().execute("LISTEN cache_versions")
+            self._listen_conn.poll()
+            notified = any(n.payload == CONTACT_CACHE_NAME for n in self._listen_conn.notifies)
+            self._listen_conn.notifies.clear()
+            if notified:
+                self.contact_cache.clear()
+            self.contact_cache.apply_version(self.contact_cache.version or 0)
+            return
+        with self.connection() as conn:
+            cursor = self._execute(conn, """
+                SELECT version FROM cache_versions WHERE name = %s
+            """, (CONTACT_CACHE_NAME,))
+            row = cursor.fetchone()
+        self.contact_cache.apply_version(row[0] if row else 0)
     
     def get_active_prompt(self, user_id: str) -> Optional[Dict[str, Any]]:
         """獲取用戶活躍的 Prompt（同步版本）"""
-        # TODO: 實作同步版本
-        return None
+        with self.connection() as conn, self.metrics.timer("get_active_prompt"):
+            cursor = self._execute(conn, """
+                SELECT id, name, content, created_at, updated_at
+                FROM user_prompts
+                WHERE user_id = %s AND is_active = {true}
+            """, (user_id,))
+            row = cursor.fetchone()
+            return self._row_to_dict(cursor, row) if row else None
     
     def save_user_prompt(self, user_id: str, name: str, content: str) -> bool:
         """儲存用戶 Prompt（同步版本）"""
-        # TODO: 實作同步版本
-        return True
+        try:
+            with self.connection() as conn:
+                self._execute(conn, """
+                    INSERT INTO user_prompts (user_id, name, content, updated_at)
+                    VALUES (%s, %s, %s, {now})
+                    ON CONFLICT (user_id, name)
+                    DO UPDATE SET content = excluded.content, updated_at = {now}
+                """, (user_id, name, content))
+            return True
+        except Exception as e:
+            logger.error(f"儲存 Prompt 失敗: {e}")
+            return False
     
     def activate_prompt(self, user_id: str, prompt_id: int) -> bool:
         """啟用特定 Prompt（同步版本）"""
-        # TODO: 實作同步版本
-        return True
+        try:
+            with self.connection() as conn:
+                # 先停用所有 prompt
+                self._execute(conn, """
+                    UPDATE user_prompts SET is_active = false WHERE user_id = %s
+                """, (user_id,))
+                # 啟用指定 prompt
+                cursor = self._execute(conn, """
+                    UPDATE user_prompts
+                    SET is_active = {true}, updated_at = {now}
+                    WHERE user_id = %s AND id = %s
+                """, (user_id, prompt_id))
+                if cursor.rowcount == 0:
+                    raise LookupError(f"找不到 prompt ID: {prompt_id}")
+            return True
+        except Exception as e:
+            logger.error(f"啟用 Prompt 失敗: {e}")
+            return False
     
     def get_user_prompts(self, user_id: str) -> List[Dict[str, Any]]:
         """獲取用戶所有 Prompt（同步版本）"""
-        # TODO: 實作同步版本
-        return []
+        with self.connection() as conn:
+            cursor = self._execute(conn, """
+                SELECT id, user_id, name, content, is_active, created_at, updated_at
+                FROM user_prompts
+                WHERE user_id = %s
+                ORDER BY created_at DESC
+            """, (user_id,))
+            prompts = [self._row_to_dict(cursor, row) for row in cursor.fetchall()]
+            for prompt in prompts:
+                prompt["is_active"] = bool(prompt["is_active"])
+            return prompts
     
     def delete_prompt(self, user_id: str, prompt_id: int) -> bool:
         """刪除 Prompt（同步版本）"""
-        # TODO: 實作同步版本
-        return True
+        try:
+            with self.connection() as conn:
+                cursor = self._execute(conn, """
+                    DELETE FROM user_prompts WHERE user_id = %s AND id = %s
+                """, (user_id, prompt_id))
+                return cursor.rowcount > 0
+        except Exception as e:
+            logger.error(f"刪除 Prompt 失敗: {e}")
+            return False
     
     def get_contact_priority(self, user_id: str, sender_id: str) -> Dict[str, Any]:
-        """獲取聯絡人優先級設定（同步版本）"""
-        # TODO: 實作同步版本
-        return {"priority_boost": 0, "is_starred": False}
+        """獲取聯絡人優先級設定（同步版本，經由行程內快取）"""
+        self._check_contact_cache()
+        cached = self.contact_cache.get(user_id, sender_id)
+        if cached is not None:
+            return as_contact_priority(cached)
+        
+        generation = self.contact_cache.generation
+        with self.connection() as conn, self.metrics.timer("get_contact_priority"):
+            cursor = self._execute(conn, """
+                SELECT priority_boost, is_starred
+                FROM contact_priorities
+                WHERE user_id = %s AND sender_id = %s
+            """, (user_id, sender_id))
+            row = cursor.fetchone()
+        value = (row[0], bool(row[1])) if row else DEFAULT_CONTACT_PRIORITY
+        self.contact_cache.fill(user_id, sender_id, *value, generation)
+        return as_contact_priority(value)
+    
+    def get_contact_priorities(self, user_id: str, sender_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """批次獲取多位聯絡人的優先級設定（同步版本，未設定者填入預設值）"""
+        self._check_contact_cache()
+        result = {}
+        missing = []
+        for sender_id in dict.fromkeys(sender_ids):
+            cached = self.contact_cache.get(user_id, sender_id)
+            if cached is not None:
+                result[sender_id] = as_contact_priority(cached)
+            else:
+                missing.append(sender_id)
+        if not missing:
+            return result
+        
+        found = {}
+        generation = self.contact_cache.generation
+        with self.connection() as conn, self.metrics.timer("get_contact_priorities"):
+            if self.dialect == "postgres":
+                chunks = [missing]
+            else:
+                # SQLite 單一查詢的參數數量有限，分批查詢
+                chunks = [missing[i:i + SQLITE_MAX_IN_PARAMS] for i in range(0, len(missing), SQLITE_MAX_IN_PARAMS)]
+            for chunk in chunks:
+                if self.dialect == "postgres":
+                    condition, params = "sender_id = ANY(%s)", (user_id, chunk)
+                else:
+                    condition, params = f"sender_id IN ({', '.join(['%s'] * len(chunk))})", (user_id, *chunk)
+                cursor = self._execute(conn, f"""
+                    SELECT sender_id, priority_boost, is_starred
+                    FROM contact_priorities
+                    WHERE user_id = %s AND {condition}
+                """, params)
+                for sender_id, priority_boost, is_starred in cursor.fetchall():
+                    found[sender_id] = (priority_boost, bool(is_starred))
+        
+        for sender_id in missing:
+            value = found.get(sender_id, DEFAULT_CONTACT_PRIORITY)
+            self.contact_cache.fill(user_id, sender_id, *value, generation)
+            result[sender_id] = as_contact_priority(value)
+        return result
     
     def set_contact_priority(self, user_id: str, sender_id: str, 
                            priority_boost: int, is_starred: bool) -> bool:
         """設定聯絡人優先級（同步版本）"""
-        # TODO: 實作同步版本
-        return True
+        try:
+            with self.connection() as conn:
+                self._execute(conn, """
+                    INSERT INTO contact_priorities (user_id, sender_id, priority_boost, is_starred, updated_at)
+                    VALUES (%s, %s, %s, %s, {now})
+                    ON CONFLICT (user_id, sender_id)
+                    DO UPDATE SET
+                        priority_boost = excluded.priority_boost,
+                        is_starred = excluded.is_starred,
+                        updated_at = {now}
+                """, (user_id, sender_id, priority_boost, is_starred))
+                version = self._bump_cache_version(conn, CONTACT_CACHE_NAME)
+            self.contact_cache.note_own_write(version)
+            self.contact_cache.put(user_id, sender_id, priority_boost, is_starred)
+            return True
+        except Exception as e:
+            logger.error(f"設定聯絡人優先級失敗: {e}")
+            self.contact_cache.invalidate(user_id, sender_id)
+            return False
+    
+    def _ensure_log_partition(self, timestamp: datetime) -> str:
+        """
+        確保 timestamp 所屬月份的日誌分區存在，回傳寫入用的資料表名稱
+        
+        postgres 寫入父表（由分區路由），SQLite 直接寫入當月資料表
+        """
+        name = log_partition_name(timestamp)
+        if name not in self._log_partitions:
+            month = _month_start(timestamp)
+            try:
+                with self.connection() as conn:
+                    if self.dialect == "postgres":
+                        self._execute(conn, pg_partition_ddl(month))
+                    else:
+                        self._execute(conn, f"""
+                            CREATE TABLE IF NOT EXISTS {name} (
+                                id {{id_column}},
+                                user_id VARCHAR(50) NOT NULL,
+                                message_text TEXT NOT NULL,
+                                prompt_hash CHAR(64) NOT NULL,
+                                tool_results {{json_type}} NOT NULL,
+                                final_response {{json_type}} NOT NULL,
+                                total_execution_time FLOAT NOT NULL,
+                                token_usage {{json_type}} NOT NULL,
+                                rule_version VARCHAR(64),
+                                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                            )
+                        """)
+                        # 規則集版本欄位加入前建立的月份表（SQLite 沒有 ADD COLUMN IF NOT EXISTS）
+                        columns = {row[1] for row in self._execute(conn, f"PRAGMA table_info({name})").fetchall()}
+                        if "rule_version" not in columns:
+                            self._execute(conn, f"ALTER TABLE {name} ADD COLUMN rule_version VARCHAR(64)")
+                        self._execute(conn, f"""
+                            CREATE INDEX IF NOT EXISTS idx_{name}_user_ts
+                            ON {name} (user_id, timestamp)
+                        """)
+            except Exception as e:
+                # 通常是其他 worker 同時建立了相同分區；分區確實不存在時後續寫入會回報錯誤
+                logger.warning(f"建立執行日誌分區 {name} 失敗: {e}")
+                return LOG_TABLE if self.dialect == "postgres" else name
+            self._log_partitions.add(name)
+        return LOG_TABLE if self.dialect == "postgres" else name
+    
+    def _list_log_partitions(self, conn) -> List[str]:
+        """列出目前存在的日誌分區"""
+        if self.dialect == "postgres":
+            cursor = self._execute(conn, """
+                SELECT child.relname
+                FROM pg_inherits
+                JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+                JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+                WHERE parent.relname = 'agent_execution_logs'
+            """)
+        else:
+            cursor = self._execute(conn, """
+                SELECT name FROM sqlite_master
+                WHERE type = 'table' AND name LIKE 'agent_execution_logs_p%'
+            """)
+        return [row[0] for row in cursor.fetchall() if partition_month(row[0]) is not None]
     
     def log_agent_execution(self, log_data: Dict[str, Any]) -> bool:
-        """記錄 Agent 執行日誌（同步版本）"""
-        # TODO: 實作同步版本
-        return True
-    
-    def get_execution_stats(self, user_id: str, days: int = 30) -> Dict[str, Any]:
-        """獲取執行統計（同步版本）"""
-        # TODO: 實作同步版本
-        return {"total_executions": 0, "avg_execution_time": 0, "total_tokens": 0} 
\ No newline at end of file
+        """
+        記錄 Agent 執行日誌（同步版本，同一交易內更新每小時 / 每日彙總）
+        
+        Prompt 內容寫入 prompts_seen（相同內容只寫一次），日誌列只存雜湊
+        """
+        timestamp = datetime.now()
+        total_tokens = int((log_data.get('token_usage') or {}).get('total_tokens', 0) or 0)
+        prompt = log_data.get('prompt_used') or ''
+        digest = prompt_hash(prompt)
+        try:
+            table = self._ensure_log_partition(timestamp)
+            with self.connection() as conn, self.metrics.timer("log_agent_execution"):
+                if digest not in self._seen_prompts:
+                    self._execute(conn, """
+                        INSERT INTO prompts_seen (hash, content) VALUES (%s, %s)
+                        ON CONFLICT (hash) DO NOTHING
+                    """, (digest, prompt))
+                self._execute(conn, f"""
+                    INSERT INTO {table}
+                    (user_id, message_text, prompt_hash, tool_results,
+                     final_response, total_execution_time, token_usage, rule_version, timestamp)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                """, (
+                    log_data['user_id'],
+                    log_data['message_text'],
+                    digest,
+                    json.dumps(log_data['tool_results'], ensure_ascii=False, default=str),
+                    json.dumps(log_data['final_response'], ensure_ascii=False, default=str),
+                    log_data['total_execution_time'],
+                    json.dumps(log_data['token_usage'], ensure_ascii=False, default=str),
+                    log_data.get('rule_version'),
+                    self._ts(timestamp)
+                ))
+                for bucket, rollup in ((_truncate_hour(timestamp), ROLLUP_TABLES["hour"]),
+                                       (_truncate_day(timestamp), ROLLUP_TABLES["day"])):
+                    self._execute(conn, f"""
+                        INSERT INTO {rollup} (user_id, bucket, executions, total_execution_time, total_tokens)
+                        VALUES (%s, %s, 1, %s, %s)
+                        ON CONFLICT (user_id, bucket) DO UPDATE SET
+                            executions = {rollup}.executions + 1,
+                            total_execution_time = {rollup}.total_execution_time + excluded.total_execution_time,
+                            total_tokens = {rollup}.total_tokens + excluded.total_tokens
+                    """, (log_data['user_id'], self._ts(bucket), log_data['total_execution_time'], total_tokens))
+            self._seen_prompts.put(digest, True)
+            return True
+        except Exception as e:
+            logger.error(f"記錄執行日誌失敗: {e}")
+            return False
+    
+    def get_seen_prompt(self, digest: str) -> Optional[str]:
+        """以雜湊取得執行日誌參照的 Prompt 內容（同步版本）"""
+        with self.connection() as conn:
+            cursor = self._execute(conn, "SELECT content FROM prompts_seen WHERE hash = %s", (digest,))
+            row = cursor.fetchone()
+            return row[0] if row else None
+    
+    def purge_execution_logs(self, retain_days: int = 30) -> int:
+        """
+        刪除超過保留天數的執行日誌（同步版本，彙總表不受影響）
+        
+        以整個月份分區為單位 DROP，回傳刪除的分區數
+        """
+        cutoff = datetime.now() - timedelta(days=retain_days)
+        with self.connection() as conn:
+            expired = expired_log_partitions(self._list_log_partitions(conn), cutoff)
+            for name in expired:
+                self._execute(conn, f"DROP TABLE IF EXISTS {name}")
+                self._log_partitions.discard(name)
+        logger.info(f"已清除 {len(expired)} 個過期執行日誌分區")
+        return len(expired)
+    
+    def rebuild_execution_rollups(self, since: datetime) -> None:
+        """由原始執行日誌重建 since 之後的彙總（同步版本）"""
+        with self.connection() as conn:
+            if self.dialect == "postgres":
+                sources = [LOG_TABLE]
+            else:
+                # 每月資料表的時間互不重疊，小時 / 日彙總桶不會跨表
+                sources = [name for name in self._list_log_partitions(conn)
+                           if _next_month(partition_month(name)) > since]
+            for unit, table in ROLLUP_TABLES.items():
+                bucket_start = _truncate_hour(since) if unit == "hour" else _truncate_day(since)
+                bucket_sql = "{hour_bucket}" if unit == "hour" else "{day_bucket}"
+                self._execute(conn, f"DELETE FROM {table} WHERE bucket >= %s", (self._ts(bucket_start),))
+                for source in sources:
+                    self._execute(conn, f"""
+                        INSERT INTO {table} (user_id, bucket, executions, total_execution_time, total_tokens)
+                        SELECT
+                            user_id,
+                            {bucket_sql},
+                            COUNT(*),
+                            SUM(total_execution_time),
+                            COALESCE(SUM({{total_tokens}}), 0)
+                        FROM {source}
+                        WHERE timestamp >= %s
+                        GROUP BY user_id, {bucket_sql}
+                    """, (self._ts(bucket_start),))
+        logger.info(f"已重建 {since.isoformat()} 之後的執行統計彙總")
+    
+    def get_execution_stats(self, user_id: str, days: int = 30,
+                            start: Optional[datetime] = None,
+                            end: Optional[datetime] = None) -> Dict[str, Any]:
+        """獲取執行統計（同步版本，讀取彙總表）"""
+        end = end or datetime.now()
+        start = start or end - timedelta(days=days)
+        ranges = rollup_query_ranges(start, end)
+        (day_from, day_to), hourly = ranges["daily"], ranges["hourly"]
+        hour_conditions = " OR ".join(["(bucket >= %s AND bucket < %s)"] * len(hourly))
+        
+        with self.connection() as conn:
+            cursor = self._execute(conn, f"""
+                SELECT SUM(executions), SUM(total_execution_time), SUM(total_tokens)
+                FROM (
+                    SELECT executions, total_execution_time, total_tokens
+                    FROM {ROLLUP_TABLES["day"]}
+                    WHERE user_id = %s AND bucket >= %s AND bucket < %s
+                    UNION ALL
+                    SELECT executions, total_execution_time, total_tokens
+                    FROM {ROLLUP_TABLES["hour"]}
+                    WHERE user_id = %s AND ({hour_conditions})
+                ) AS buckets
+            """, (user_id, self._ts(day_from), self._ts(day_to), user_id,
+                  *[self._ts(value) for pair in hourly for value in pair]))
+            return _stats_from_totals(*cursor.fetchone())
+
+
+    # 訊息相關（StorageBackend 介面）
+    def _message_to_dict(self, cursor, row) -> Dict[str, Any]:
+        """將訊息列轉為與 DemoStorage 相同格式的 dict"""
+        message = self._row_to_dict(cursor, row)
+        for key in ("timestamp", "processed_at"):
+            value = message.get(key)
+            if isinstance(value, datetime):
+                message[key] = value.isoformat()
+            elif value is not None:
+                message[key] = str(value).replace(" ", "T")
+        message["processed"] = bool(message["processed"])
+        result = message.pop("processing_result")
+        if isinstance(result, str):
+            result = json.loads(result)
+        if result is not None:
+            message["processing_result"] = result
+        if message.get("processed_at") is None:
+            message.pop("processed_at", None)
+        return message
+    
+    def add_message(self, text: str, sender_id: str, sender_name: str) -> int:
+        """新增訊息，回傳訊息 ID（同步版本）"""
+        with self.connection() as conn:
+            params = (text, sender_id, sender_name, self._ts(datetime.now()))
+            if self.dialect == "postgres":
+                cursor = self._execute(conn, """
+                    INSERT INTO messages (text, sender_id, sender_name, timestamp)
+                    VALUES (%s, %s, %s, %s)
+                    RETURNING id
+                """, params)
+                return cursor.fetchone()[0]
+            cursor = self._execute(conn, """
+                INSERT INTO messages (text, sender_id, sender_name, timestamp)
+                VALUES (%s, %s, %s, %s)
+            """, params)
+            return cursor.lastrowid
+    
+    def get_message(self, message_id: int) -> Optional[Dict[str, Any]]:
+        """根據 ID 取得訊息（同步版本）"""
+        with self.connection() as conn:
+            cursor = self._execute(conn, """
+                SELECT id, text, sender_id, sender_name, timestamp,
+                       processed, processing_result, processed_at
+                FROM messages WHERE id = %s
+            """, (message_id,))
+            row = cursor.fetchone()
+            return self._message_to_dict(cursor, row) if row else None
+    
+    def list_messages(self, cursor: Optional[int] = None, limit: int = 50,
+                      unprocessed_only: bool = False, fields: Optional[List[str]] = None,
+                      exclude: Optional[List[str]] = None) -> Dict[str, Any]:
+        """以訊息 ID 游標分頁列出訊息，可只回傳指定欄位或排除欄位（同步版本）"""
+        condition = "AND processed = {false}" if unprocessed_only else ""
+        with self.connection() as conn:
+            # 多取一筆判斷是否還有下一頁
+            db_cursor = self._execute(conn, f"""
+                SELECT id, text, sender_id, sender_name, timestamp,
+                       processed, processing_result, processed_at
+                FROM messages
+                WHERE id > %s {condition}
+                ORDER BY id
+                LIMIT %s
+            """, (cursor if cursor is not None else 0, limit + 1))
+            messages = [self._message_to_dict(db_cursor, row) for row in db_cursor.fetchall()]
+        next_cursor = None
+        if len(messages) > limit:
+            messages = messages[:limit]
+            next_cursor = messages[-1]["id"]
+        if fields is not None or exclude:
+            messages = [project_message(message, fields, exclude) for message in messages]
+        return {"messages": messages, "next_cursor": next_cursor}
+    
+    def mark_message_processed(self, message_id: int, result: Dict[str, Any]) -> bool:
+        """標記訊息為已處理（同步版本）"""
+        with self.connection() as conn:
+            cursor = self._execute(conn, """
+                UPDATE messages
+                SET processed = {true}, processing_result = %s, processed_at = %s
+                WHERE id = %s
+            """, (json.dumps(result, ensure_ascii=False, default=str),
+                  self._ts(datetime.now()), message_id))
+            return cursor.rowcount > 0
+    
+    def count_messages(self) -> Dict[str, int]:
+        """訊息計數（同步版本）"""
+        with self.connection() as conn:
+            cursor = self._execute(conn, """
+                SELECT COUNT(*), COUNT(CASE WHEN processed = {false} THEN 1 END)
+                FROM messages
+            """)
+            total, unprocessed = cursor.fetchone()
+        return {"total_messages": int(total), "unprocessed_count": int(unprocessed or 0)}
+
+
+_sync_db_manager: Optional[SyncDatabaseManager] = None
+_sync_db_lock = threading.Lock()
+
+
+def set_sync_database_manager(db_manager: SyncDatabaseManager):
+    """替換行程內共用的同步資料庫管理器（例如以設定檔參數建立）"""
+    global _sync_db_manager
+    with _sync_db_lock:
+        _sync_db_manager = db_manager
+
+
+def get_sync_database_manager() -> SyncDatabaseManager:
+    """取得行程內共用的同步資料庫管理器（共用同一個連接池）"""
+    global _sync_db_manager
+    if _sync_db_manager is None:
+        with _sync_db_lock:
+            if _sync_db_manager is None:
+                _sync_db_manager = SyncDatabaseManager()
+    return _sync_db_manager
@@ -3,18 +3,55 @@ Demo 專用的簡單 JSON 檔案儲存系統
 不需要資料庫，適合快速展示和測試
 """
 import json
+import logging
 import os
+import time
 from typing import Dict, List, Any, Optional
-from datetime import datetime
+from datetime import datetime, timedelta
 import uuid
+from bisect import bisect_left, bisect_right, insort
 
-class DemoStorage:
-    """Demo 用的資料儲存類別"""
+from .archive import ArchiveTable
+from .dependencies import DependencyIndex
+from .message_store import MessageStore
+from .retention import compact_processing_history, intern_request
+from .search_index import MessageSearchIndex
+from .storage import StorageBackend
+from .snapshot import (
+    JOURNAL_ADD, JOURNAL_HEADER_SIZE, JOURNAL_PROCESSED, SnapshotError,
+    append_journal, file_fingerprint, read_journal, read_snapshot,
+    reset_journal, write_snapshot,
+)
+from .threads import ThreadIndex
+
+logger = logging.getLogger(__name__)
+
+class DemoStorage(StorageBackend):
+    """
+    Demo 用的資料儲存類別（以 JSON 檔案實作 StorageBackend，網址為 json://目錄）
+
+    聯絡人優先級取自 contacts.json（Demo 只有單一使用者，user_id 不區分），
+    Prompt 與 Agent 執行日誌分別存於 prompts.json / execution_logs.json
+    """
     
-    def __init__(self, data_dir: str = "data"):
+    def __init__(self, data_dir: str = "data", snapshot_every: int = 1000,
+                 snapshot_interval: float = 60.0):
         self.data_dir = data_dir
+        # 累積多少筆異動或經過多少秒後寫出快照與 JSON
+        self.snapshot_every = snapshot_every
+        self.snapshot_interval = snapshot_interval
+        self.snapshot_path = os.path.join(data_dir, "demo_messages.snap")
+        self.journal_path = os.path.join(data_dir, "demo_messages.journal")
+        self._pending_changes = 0
+        self._last_flush = time.monotonic()
         self.ensure_data_dir()
         self.init_demo_data()
+        self.messages = self.load_messages()
+        self.search_index = MessageSearchIndex.from_store(self.messages)
+        self.threads = ThreadIndex.from_store(self.messages)
+        self.dependencies = DependencyIndex.from_store(self.messages)
+        self.contacts = self.load_json("contacts")
+        self._contact_ids = sorted(self.contacts)
     
     def ensure_data_dir(self):
         """確保資料目錄存在"""
@@ -73,38 +110,201 @@ class DemoStorage:
             self.save_json("processing_history", processing_history)
     
     # 訊息相關方法
+    def load_messages(self) -> MessageStore:
+        """
+        載入訊息到欄式儲存
+        
+        優先讀取與目前 JSON 對應的二進位快照，沒有快照（或 JSON 已被外部修改）時退回解析 JSON，
+        最後重播快照之後的日誌紀錄。
+        """
+        json_path = os.path.join(self.data_dir, "demo_messages.json")
+        source = file_fingerprint(json_path)
+        store = None
+        from_snapshot = False
+        
+        if source and os.path.exists(self.snapshot_path):
+            try:
+                snapshot_store, snapshot_source = read_snapshot(self.snapshot_path)
+                if snapshot_source == source:
+                    store = snapshot_store
+                    from_snapshot = True
+                else:
+                    logger.info("demo_messages.json 已變更，忽略舊快照")
+            except (OSError, SnapshotError) as e:
+                logger.warning(f"讀取訊息快照失敗，改用 JSON: {e}")
+        
+        if store is None:
+            store = MessageStore.from_records(self.load_json("demo_messages").get("messages", []))
+        
+        journal_source, records = read_journal(self.journal_path)
+        replayed = 0
+        if journal_source is not None and journal_source == source:
+            for op, payload in records:
+                if op == JOURNAL_ADD:
+                    store.append(payload)
+                elif op == JOURNAL_PROCESSED:
+                    store.mark_processed(payload["id"], payload["result"], payload["processed_at"])
+                replayed += 1
+        
+        self.messages = store
+        journal_size = os.path.getsize(self.journal_path) if os.path.exists(self.journal_path) else 0
+        if replayed:
+            self.flush()
+        elif journal_source == source and journal_size > JOURNAL_HEADER_SIZE:
+            # 日誌有內容卻無法重播任何紀錄（第一筆即損毀），重寫快照並清空日誌，避免之後的異動接在損毀紀錄後面
+            self.write_snapshot()
+        elif not (from_snapshot and journal_source == source):
+            # JSON 本身已是最新狀態，只需補寫快照
+            self.write_snapshot()
+        return store
+    
+    def save_messages(self):
+        """將欄式儲存的訊息寫回 JSON"""
+        self.save_json("demo_messages", {"messages": self.messages.to_records()})
+    
+    def flush(self):
+        """寫出 JSON 與二進位快照，並清空日誌"""
+        self.save_messages()
+        self.write_snapshot()
+    
+    def write_snapshot(self):
+        """依目前的 JSON 寫出二進位快照，並清空日誌"""
+        source = file_fingerprint(os.path.join(self.data_dir, "demo_messages.json"))
+        write_snapshot(self.snapshot_path, self.messages, source)
+        reset_journal(self.journal_path, source)
+        self._pending_changes = 0
+        self._last_flush = time.monotonic()
+    
+    def _record_change(self, op: int, payload: Dict):
+        """將異動寫入日誌，累積到門檻時寫出快照"""
+        append_journal(self.journal_path, op, payload)
+        self._pending_changes += 1
+        if (self._pending_changes >= self.snapshot_every
+                or time.monotonic() - self._last_flush >= self.snapshot_interval):
+            self.flush()
+    
+    # 對話串（以發送者分組）
+    def get_inbox(self, cursor: Optional[str] = None, limit: int = 50) -> Dict[str, Any]:
+        """
+        依 (優先級, 最新訊息時間, 未讀數) 分頁列出對話串
+        
+        cursor 為上一頁最後一個對話串的 sender_id
+        """
+        threads, next_cursor = self.threads.page(cursor, limit)
+        return {"threads": [thread.to_dict() for thread in threads], "next_cursor": next_cursor}
+    
+    def get_thread(self, thread_id: str, cursor: Optional[int] = None, limit: int = 50) -> Optional[Dict[str, Any]]:
+        """
+        對話串彙總與訊息（新訊息在前）
+        
+        cursor 為上一頁最後一則訊息的 ID
+        """
+        thread = self.threads.get(thread_id)
+        if thread is None:
+            return None
+        ids = thread.message_ids
+        end = len(ids)
+        if cursor is not None:
+            end = bisect_left(ids, cursor)
+        page_ids = ids[max(0, end - limit):end][::-1]
+        return {
+            **thread.to_dict(),
+            "messages": [self.messages.get(message_id) for message_id in page_ids],
+            "next_cursor": page_ids[-1] if end > limit and page_ids else None
+        }
+    
     def get_all_messages(self) -> List[Dict]:
         """獲取所有 demo 訊息"""
-        return self.load_json("demo_messages").get("messages", [])
+        return self.messages.to_records()
     
     def get_unprocessed_messages(self) -> List[Dict]:
         """獲取未處理的訊息"""
-        messages = self.get_all_messages()
-        return [msg for msg in messages if not msg.get("processed", False)]
+        return list(self.messages.iter_dicts(unprocessed_only=True))
     
     def get_message_by_id(self, message_id: int) -> Optional[Dict]:
         """根據 ID 獲取訊息"""
-        messages = self.get_all_messages()
-        for msg in messages:
-            if msg["id"] == message_id:
-                return msg
-        return None
+        return self.messages.get(message_id)
     
-    def mark_message_processed(self, message_id: int, result: Dict):
-        """標記訊息為已處理"""
-        data = self.load_json("demo_messages")
-        for msg in data["messages"]:
-            if msg["id"] == message_id:
-                msg["processed"] = True
-                msg["processing_result"] = result
-                msg["processed_at"] = datetime.now().isoformat()
-                break
-        self.save_json("demo_messages", data)
+    def get_message(self, message_id: int) -> Optional[Dict[str, Any]]:
+        """根據 ID 取得訊息（StorageBackend 介面）"""
+        return self.messages.get(message_id)
+    
+    def mark_message_processed(self, message_id: int, result: Dict) -> bool:
+        """標記訊息為已處理，找不到訊息時回傳 False"""
+        processed_at = datetime.now().isoformat()
+        row = self.messages.row_of(message_id)
+        if row is None:
+            return False
+        was_processed = self.messages.is_processed(row)
+        previous_result = self.messages.result_at(row)
+        if self.messages.mark_processed(message_id, result, processed_at):
+            sender_id = self.messages.sender_at(row)[0]
+            self.threads.mark_processed(sender_id, result, was_processed, previous_result)
+            self.dependencies.update(message_id, sender_id, result)
+            self._record_change(JOURNAL_PROCESSED, {
+                "id": message_id, "result": result, "processed_at": processed_at
+            })
+        return True
+    
+    def rearchive(self, table: ArchiveTable, dry_run: bool = False,
+                  rule_version: Optional[str] = None,
+                  previous_rule_version: Optional[str] = None) -> Dict[str, int]:
+        """
+        以封存規則查詢表重新決定所有已處理訊息的封存狀態
+        
+        只寫回決定改變的訊息（保留原 processed_at），dry_run 時只回傳計數；
+        封存規則寫入規則集後版本會改變，傳入新舊版本時，依賴舊版本的結果也改記為新版本，
+        避免重新處理把只換了封存規則的訊息全部視為過期
+        """
+        evaluated, rows = table.changed_rows(self.messages.archive_columns())
+        updates: Dict[int, Dict[str, Any]] = {}
+        archived = 0
+        for row in rows:
+            # 決定改變的訊息必然是翻轉目前的封存狀態
+            result = self.messages.result_at(row)
+            decision = not result.get('should_archive')
+            archived += decision
+            updates[row] = {**result, 'should_archive': decision}
+        
+        restamped = []
+        if rule_version is not None and previous_rule_version not in (None, rule_version):
+            for message_id in self.dependencies.with_rule_version(previous_rule_version):
+                row = self.messages.row_of(message_id)
+                result = updates.get(row) or self.messages.result_at(row)
+                updates[row] = {**result, 'depends_on': {**result['depends_on'], 'rule_version': rule_version}}
+                restamped.append(row)
+        
+        if not dry_run:
+            for row, result in updates.items():
+                message_id = self.messages.id_at(row)
+                processed_at = self.messages.processed_time_at(row)
+                self.messages.mark_processed(message_id, result, processed_at)
+                self.dependencies.update(message_id, self.messages.sender_at(row)[0], result)
+                self._record_change(JOURNAL_PROCESSED, {
+                    "id": message_id, "result": result, "processed_at": processed_at
+                })
+        return {
+            "evaluated": evaluated,
+            "archived": archived,
+            "unarchived": len(rows) - archived,
+            "changed": len(rows),
+            "rule_version_updated": len(restamped)
+        }
+    
+    def find_stale_messages(self, rule_version: str, prompt_version: str,
+                            contacts: Optional[Dict[str, Dict[str, Any]]] = None,
+                            sender_ids: Optional[List[str]] = None) -> Dict[int, str]:
+        """
+        依相依索引找出處理結果已過期的訊息（訊息 ID -> 原因）
+        
+        只走訪依賴舊輸入的分組；sender_ids 限定只檢查這些發送者的訊息
+        """
+        return self.dependencies.stale(rule_version, prompt_version,
+                                       contacts=contacts, sender_ids=sender_ids)
     
     def add_message(self, text: str, sender_id: str, sender_name: str) -> int:
         """新增新訊息"""
-        data = self.load_json("demo_messages")
-        new_id = max([msg["id"] for msg in data["messages"]], default=0) + 1
+        new_id = self.messages.max_id + 1
         
         new_message = {
             "id": new_id,
@@ -115,15 +315,46 @@ class DemoStorage:
             "processed": False
         }
         
-        data["messages"].append(new_message)
-        self.save_json("demo_messages", data)
+        row = self.messages.append(new_message)
+        self.search_index.add(row, text)
+        self.threads.add_message(new_id, sender_id, sender_name, self.messages.timestamp_micros_at(row))
+        self._record_change(JOURNAL_ADD, new_message)
         return new_id
     
+    def list_messages(self, cursor: Optional[int] = None, limit: int = 50,
+                      unprocessed_only: bool = False, fields: Optional[List[str]] = None,
+                      exclude: Optional[List[str]] = None) -> Dict[str, Any]:
+        """以游標分頁列出訊息，可只回傳指定欄位或排除欄位"""
+        rows, next_cursor = self.messages.page(cursor, limit, unprocessed_only)
+        return {
+            "messages": [self.messages.get_projected(row, fields, exclude) for row in rows],
+            "next_cursor": next_cursor
+        }
+    
+    def count_messages(self) -> Dict[str, int]:
+        """訊息計數（由儲存即時維護，不需掃描）"""
+        return {
+            "total_messages": len(self.messages),
+            "unprocessed_count": self.messages.unprocessed_count
+        }
+    
+    def search_messages(self, query: str, category: Optional[str] = None,
+                        sender_id: Optional[str] = None, offset: int = 0,
+                        limit: int = 20) -> Dict[str, Any]:
+        """全文搜尋訊息（新訊息在前）"""
+        total, rows = self.search_index.search(
+            query, self.messages, category=category, sender_id=sender_id,
+            offset=offset, limit=limit
+        )
+        return {
+            "total": total,
+            "messages": [self.messages.get_dict(row) for row in rows]
+        }
+    
     # 聯絡人相關方法
     def get_contact_info(self, sender_id: str) -> Dict:
         """獲取聯絡人資訊"""
-        contacts = self.load_json("contacts")
-        return contacts.get(sender_id, {
+        return self.contacts.get(sender_id, {
             "name": sender_id,
             "priority_boost": 0,
             "is_starred": False,
@@ -132,14 +363,44 @@ class DemoStorage:
     
     def update_contact(self, sender_id: str, **kwargs):
         """更新聯絡人資料"""
-        contacts = self.load_json("contacts")
+        contacts = self.contacts
         if sender_id not in contacts:
             contacts[sender_id] = {"name": sender_id}
+            insort(self._contact_ids, sender_id)
         
         contacts[sender_id].update(kwargs)
         contacts[sender_id]["updated_at"] = datetime.now().isoformat()
         self.save_json("contacts", contacts)
     
+    def get_contact_priority(self, user_id: str, sender_id: str) -> Dict[str, Any]:
+        """聯絡人優先級設定（StorageBackend 介面，未設定者為預設值）"""
+        contact = self.contacts.get(sender_id, {})
+        return {
+            "priority_boost": contact.get("priority_boost", 0),
+            "is_starred": bool(contact.get("is_starred", False))
+        }
+    
+    def get_contact_priorities(self, user_id: str, sender_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """批次獲取多位聯絡人的優先級設定"""
+        return {sender_id: self.get_contact_priority(user_id, sender_id)
+                for sender_id in dict.fromkeys(sender_ids)}
+    
+    def set_contact_priority(self, user_id: str, sender_id: str,
+                             priority_boost: int, is_starred: bool) -> bool:
+        """設定聯絡人優先級"""
+        self.update_contact(sender_id, priority_boost=priority_boost, is_starred=bool(is_starred))
+        return True
+    
+    def list_contacts(self, cursor: Optional[str] = None, limit: int = 50) -> Dict[str, Any]:
+        """以 sender_id 游標分頁列出聯絡人"""
+        start = bisect_right(self._contact_ids, cursor) if cursor is not None else 0
+        page_ids = self._contact_ids[start:start + limit]
+        has_more = start + limit < len(self._contact_ids)
+        return {
+            "contacts": {sender_id: self.contacts[sender_id] for sender_id in page_ids},
+            "next_cursor": page_ids[-1] if has_more and page_ids else None
+        }
+    
     # 用戶設定檔相關
     def get_user_profile(self, user_id: str = "demo_user") -> Dict:
         """獲取用戶設定檔"""
@@ -163,6 +424,104 @@ class DemoStorage:
         profiles[user_id]["updated_at"] = datetime.now().isoformat()
         self.save_json("user_profiles", profiles)
     
+    # Prompt（StorageBackend 介面）
+    def _load_prompts(self) -> Dict[str, List[Dict[str, Any]]]:
+        return self.load_json("prompts")
+    
+    def get_active_prompt(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """獲取用戶活躍的 Prompt"""
+        for prompt in self._load_prompts().get(user_id, []):
+            if prompt["is_active"]:
+                return {key: prompt[key] for key in ("id", "name", "content", "created_at", "updated_at")}
+        return None
+    
+    def save_user_prompt(self, user_id: str, name: str, content: str) -> bool:
+        """儲存用戶 Prompt（同名則覆寫內容）"""
+        prompts = self._load_prompts()
+        now = datetime.now().isoformat()
+        user_prompts = prompts.setdefault(user_id, [])
+        for prompt in user_prompts:
+            if prompt["name"] == name:
+                prompt.update(content=content, updated_at=now)
+                break
+        else:
+            next_id = max((prompt["id"] for entries in prompts.values() for prompt in entries), default=0) + 1
+            user_prompts.append({
+                "id": next_id,
+                "user_id": user_id,
+                "name": name,
+                "content": content,
+                "is_active": False,
+                "created_at": now,
+                "updated_at": now
+            })
+        self.save_json("prompts", prompts)
+        return True
+    
+    def activate_prompt(self, user_id: str, prompt_id: int) -> bool:
+        """啟用特定 Prompt"""
+        prompts = self._load_prompts()
+        user_prompts = prompts.get(user_id, [])
+        if not any(prompt["id"] == prompt_id for prompt in user_prompts):
+            return False
+        for prompt in user_prompts:
+            prompt["is_active"] = prompt["id"] == prompt_id
+            if prompt["is_active"]:
+                prompt["updated_at"] = datetime.now().isoformat()
+        self.save_json("prompts", prompts)
+        return True
+    
+    def get_user_prompts(self, user_id: str) -> List[Dict[str, Any]]:
+        """獲取用戶所有 Prompt（新的在前）"""
+        return sorted(self._load_prompts().get(user_id, []), key=lambda p: p["created_at"], reverse=True)
+    
+    def delete_prompt(self, user_id: str, prompt_id: int) -> bool:
+        """刪除 Prompt"""
+        prompts = self._load_prompts()
+        user_prompts = prompts.get(user_id, [])
+        remaining = [prompt for prompt in user_prompts if prompt["id"] != prompt_id]
+        if len(remaining) == len(user_prompts):
+            return False
+        prompts[user_id] = remaining
+        self.save_json("prompts", prompts)
+        return True
+    
+    # Agent 執行日誌（StorageBackend 介面，只保存統計需要的欄位）
+    def log_agent_execution(self, log_data: Dict[str, Any]) -> bool:
+        """記錄 Agent 執行日誌"""
+        logs = self.load_json("execution_logs")
+        logs.setdefault("logs", []).append({
+            "user_id": log_data["user_id"],
+            "timestamp": datetime.now().isoformat(),
+            "total_execution_time": log_data["total_execution_time"],
+            "total_tokens": int((log_data.get("token_usage") or {}).get("total_tokens", 0) or 0),
+            "rule_version": log_data.get("rule_version")
+        })
+        self.save_json("execution_logs", logs)
+        return True
+    
+    def get_execution_stats(self, user_id: str, days: int = 30,
+                            start: Optional[datetime] = None,
+                            end: Optional[datetime] = None) -> Dict[str, Any]:
+        """獲取執行統計"""
+        end = end or datetime.now()
+        start = start or end - timedelta(days=days)
+        matched = [
+            log for log in self.load_json("execution_logs").get("logs", [])
+            if log["user_id"] == user_id and start <= datetime.fromisoformat(log["timestamp"]) < end
+        ]
+        if not matched:
+            return {"total_executions": 0, "avg_execution_time": 0, "total_tokens": 0}
+        return {
+            "total_executions": len(matched),
+            "avg_execution_time": sum(log["total_execution_time"] for log in matched) / len(matched),
+            "total_tokens": sum(log["total_tokens"] for log in matched)
+        }
+    
+    def close(self):
+        """寫出訊息快照（StorageBackend 介面）"""
+        self.flush()
+    
     # 處理記錄相關
     def log_processing(self, message_id: int, processing_data: Dict):
         """記錄處理過程"""
@@ -174,38 +533,66 @@ class DemoStorage:
             "timestamp": datetime.now().isoformat(),
             **processing_data
         }
+        # 重複的語調設定檔只存一份
+        if isinstance(log_entry.get("request"), dict):
+            log_entry["request"] = intern_request(history, log_entry["request"])
         
-        history["logs"].append(log_entry)
+        history.setdefault("logs", []).append(log_entry)
         self.save_json("processing_history", history)
     
+    def compact_processing_history(self, retain_days: int = 30,
+                                   max_hot_logs: Optional[int] = None) -> Dict[str, int]:
+        """將過期的處理紀錄降採樣為每日彙總並移入壓縮封存檔"""
+        history = self.load_json("processing_history")
+        result = compact_processing_history(
+            history,
+            archive_dir=os.path.join(self.data_dir, "archive"),
+            retain_days=retain_days,
+            max_hot_logs=max_hot_logs
+        )
+        self.save_json("processing_history", history)
+        return result
+    
     def get_processing_stats(self) -> Dict:
-        """獲取處理統計"""
+        """
+        獲取處理統計（原始紀錄 + 已壓縮的每日彙總）
+        
+        重新處理的紀錄只計入 total_reprocessed，不重複計入處理數與分類分佈
+        """
         history = self.load_json("processing_history")
         logs = history.get("logs", [])
+        total_reprocessed = sum(1 for log in logs if log.get("reprocess"))
+        logs = [log for log in logs if not log.get("reprocess")]
+        
+        # 先計入已封存的每日彙總
+        categories = {}
+        total_processed = 0
+        total_execution_time = 0
+        for bucket in history.get("daily", {}).values():
+            total_processed += bucket["count"]
+            total_reprocessed += bucket.get("reprocessed", 0)
+            total_execution_time += bucket["total_execution_time"]
+            for category, count in bucket["categories"].items():
+                categories[category] = categories.get(category, 0) + count
         
-        total_processed = len(logs)
+        total_processed += len(logs)
         if total_processed == 0:
-            return {"total_processed": 0}
+            return {"total_processed": 0, "total_reprocessed": total_reprocessed}
         
         # 統計分類分佈
-        categories = {}
-        avg_execution_time = 0
-        
         for log in logs:
             result = log.get("final_response", {})
             category = result.get("category", "未知")
             categories[category] = categories.get(category, 0) + 1
             
             exec_time = log.get("total_execution_time", 0)
-            avg_execution_time += exec_time
+            total_execution_time += exec_time
         
-        avg_execution_time = avg_execution_time / total_processed if total_processed > 0 else 0
+        avg_execution_time = total_execution_time / total_processed if total_processed > 0 else 0
         
         return {
             "total_processed": total_processed,
+            "total_reprocessed": total_reprocessed,
             "category_distribution": categories,
             "avg_execution_time": avg_execution_time
         }
-
-# 全域實例
-demo_storage = DemoStorage() 
\ No newline at end of file
@@ -0,0 +1,164 @@
+"""
+處理結果的相依追蹤
+每筆處理結果記錄它依賴的輸入（發送者的聯絡人設定、規則集版本、語調設定版本），
+索引依輸入分組保存訊息 ID；任一輸入改變時只需取出依賴舊值的訊息重新處理，不必掃描全部結果
+"""
+import hashlib
+import json
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from .message_store import MessageStore
+
+# 重新處理的原因
+STALE_CONTACT = "contact"
+STALE_RULES = "rule_version"
+STALE_PROMPT = "prompt_version"
+STALE_UNTRACKED = "untracked"
+STALE_REASONS = [STALE_CONTACT, STALE_RULES, STALE_PROMPT, STALE_UNTRACKED]
+
+
+def prompt_version(tone_profile: Dict[str, Any]) -> str:
+    """語調設定的版本（內容雜湊），設定改變即換版本"""
+    payload = json.dumps(tone_profile, ensure_ascii=False, sort_keys=True)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def contact_key(contact: Optional[Dict[str, Any]]) -> Optional[Tuple[int, bool]]:
+    """聯絡人設定中影響優先級的部分 (priority_boost, is_starred)"""
+    if not isinstance(contact, dict):
+        return None
+    return (contact.get("priority_boost", 0), bool(contact.get("is_starred", False)))
+
+
+def build_depends_on(sender_id: str, contact: Optional[Dict[str, Any]],
+                     rule_version: Optional[str], tone_profile: Dict[str, Any]) -> Dict[str, Any]:
+    """組成寫入 processing_result 的 depends_on"""
+    key = contact_key(contact)
+    return {
+        "sender_id": sender_id,
+        "contact": {"priority_boost": key[0], "is_starred": key[1]} if key is not None else None,
+        "rule_version": rule_version,
+        "prompt_version": prompt_version(tone_profile),
+    }
+
+
+def _add(groups: Dict[Any, Set[int]], key: Any, message_id: int):
+    groups.setdefault(key, set()).add(message_id)
+
+
+def _discard(groups: Dict[Any, Set[int]], key: Any, message_id: int):
+    ids = groups.get(key)
+    if ids is not None:
+        ids.discard(message_id)
+        if not ids:
+            del groups[key]
+
+
+class DependencyIndex:
+    """依輸入值分組的已處理訊息索引"""
+
+    def __init__(self):
+        # 訊息 ID -> (sender_id, 聯絡人設定, 規則版本, 語調版本)
+        self._deps: Dict[int, Tuple[str, Optional[Tuple[int, bool]], Optional[str], Optional[str]]] = {}
+        # sender_id -> 聯絡人設定 -> 訊息 ID
+        self._by_contact: Dict[str, Dict[Optional[Tuple[int, bool]], Set[int]]] = {}
+        self._by_rules: Dict[Optional[str], Set[int]] = {}
+        self._by_prompt: Dict[Optional[str], Set[int]] = {}
+        # 沒有 depends_on 的舊處理結果（無法判斷是否過期）: 訊息 ID -> sender_id
+        self._untracked: Dict[int, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._deps) + len(self._untracked)
+
+    @classmethod
+    def from_store(cls, store: MessageStore) -> "DependencyIndex":
+        """掃描一次訊息儲存建立索引"""
+        index = cls()
+        for row in store.iter_rows():
+            if store.is_processed(row):
+                index.update(store.id_at(row), store.sender_at(row)[0], store.result_at(row))
+        return index
+
+    def discard(self, message_id: int):
+        """移除訊息的相依紀錄"""
+        self._untracked.pop(message_id, None)
+        deps = self._deps.pop(message_id, None)
+        if deps is None:
+            return
+        sender_id, contact, rule_version, prompt = deps
+        by_sender = self._by_contact.get(sender_id)
+        if by_sender is not None:
+            _discard(by_sender, contact, message_id)
+            if not by_sender:
+                del self._by_contact[sender_id]
+        _discard(self._by_rules, rule_version, message_id)
+        _discard(self._by_prompt, prompt, message_id)
+
+    def update(self, message_id: int, sender_id: str, result: Optional[Dict[str, Any]]):
+        """記錄（或取代）訊息處理結果的相依輸入"""
+        self.discard(message_id)
+        depends_on = result.get("depends_on") if isinstance(result, dict) else None
+        if not isinstance(depends_on, dict):
+            self._untracked[message_id] = sender_id
+            return
+        contact = contact_key(depends_on.get("contact"))
+        rule_version = depends_on.get("rule_version")
+        prompt = depends_on.get("prompt_version")
+        self._deps[message_id] = (sender_id, contact, rule_version, prompt)
+        _add(self._by_contact.setdefault(sender_id, {}), contact, message_id)
+        _add(self._by_rules, rule_version, message_id)
+        _add(self._by_prompt, prompt, message_id)
+
+    def with_rule_version(self, rule_version: Optional[str]) -> List[int]:
+        """依賴指定規則集版本的訊息 ID"""
+        return sorted(self._by_rules.get(rule_version, ()))
+
+    def senders(self) -> List[str]:
+        """有已處理訊息的發送者"""
+        return list(dict.fromkeys([*self._by_contact, *self._untracked.values()]))
+
+    def stale(self, rule_version: str, prompt: str,
+              contacts: Optional[Dict[str, Dict[str, Any]]] = None,
+              sender_ids: Optional[Iterable[str]] = None) -> Dict[int, str]:
+        """
+        找出依賴舊輸入的訊息
+
+        Args:
+            rule_version: 目前的規則集版本
+            prompt: 目前的語調設定版本
+            contacts: sender_id -> 目前的聯絡人設定（未提供的發送者不檢查聯絡人）
+            sender_ids: 只檢查這些發送者的訊息（None 時檢查全部）
+
+        Returns:
+            訊息 ID -> 重新處理的原因（同時符合多個原因時取第一個）
+        """
+        scope = set(sender_ids) if sender_ids is not None else None
+        stale: Dict[int, str] = {}
+
+        def collect(ids: Iterable[int], reason: str):
+            for message_id in ids:
+                if message_id in stale:
+                    continue
+                if scope is not None and self._deps[message_id][0] not in scope:
+                    continue
+                stale[message_id] = reason
+
+        # 聯絡人：只走訪該發送者下設定值與目前不同的分組
+        for sender_id, current in (contacts or {}).items():
+            if scope is not None and sender_id not in scope:
+                continue
+            current_key = contact_key(current)
+            for key, ids in self._by_contact.get(sender_id, {}).items():
+                if key != current_key:
+                    collect(ids, STALE_CONTACT)
+        # 規則集 / 語調設定：版本數量很少，只走訪舊版本的分組
+        for version, ids in self._by_rules.items():
+            if version != rule_version:
+                collect(ids, STALE_RULES)
+        for version, ids in self._by_prompt.items():
+            if version != prompt:
+                collect(ids, STALE_PROMPT)
+        for message_id, sender_id in self._untracked.items():
+            if scope is None or sender_id in scope:
+                stale.setdefault(message_id, STALE_UNTRACKED)
+        return stale
@@ -0,0 +1,142 @@
+"""
+延遲產生回覆草稿
+低優先級或將被封存的訊息只回傳草稿 token，需要時再以 token 產生草稿；
+草稿依「訊息內容 + 語調設定」快取，同一訊息以相同設定重複要求時不會重新產生；
+設定串流 LLM 時可逐段輸出草稿（SSE），簽名在最後附加
+"""
+import hashlib
+import json
+import logging
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+from .cache import LRUCache
+from .constants import DRAFT_STREAM_PROMPT, DRAFTS
+from .toolbox import draft_reply_tool
+
+logger = logging.getLogger(__name__)
+
+# 草稿來源（快取鍵的一部分）
+DRAFT_SOURCE_RULES = "rules"
+DRAFT_SOURCE_LLM = "llm"
+
+
+def draft_token(text: str, tone_profile: Dict[str, Any]) -> str:
+    """訊息內容與語調設定的雜湊，作為草稿 token 與快取鍵"""
+    payload = json.dumps([text, tone_profile], ensure_ascii=False, sort_keys=True)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class DraftService:
+    """回覆草稿的延遲產生與快取"""
+
+    def __init__(self, eager_max_priority: int = DRAFTS["EAGER_MAX_PRIORITY"],
+                 max_pending: int = DRAFTS["MAX_PENDING"], max_cached: int = DRAFTS["MAX_CACHED"],
+                 llm: Optional[Any] = None):
+        self.eager_max_priority = eager_max_priority
+        # 支援 astream() 的聊天模型（例如 ChatOpenAI），None 時串流改用規則式草稿
+        self.llm = llm
+        # token -> (訊息內容, 語調設定)，產生草稿時需要原始輸入（產生後仍保留，供串流重新要求）
+        self._pending = LRUCache(max_pending)
+        # (草稿來源, token) -> 草稿；規則式與 LLM 串流的草稿內容不同，分開快取
+        self._drafts = LRUCache(max_cached)
+
+    @property
+    def stream_source(self) -> str:
+        """串流草稿的來源（設定 LLM 時為 llm，否則與 generate() 相同為 rules）"""
+        return DRAFT_SOURCE_LLM if self.llm is not None else DRAFT_SOURCE_RULES
+
+    def should_defer(self, priority: int, should_archive: bool) -> bool:
+        """是否延後產生草稿（優先級數字越大越不重要）"""
+        return should_archive or priority > self.eager_max_priority
+
+    def defer(self, text: str, tone_profile: Dict[str, Any]) -> str:
+        """登記待產生的草稿並回傳 token"""
+        token = draft_token(text, tone_profile)
+        self._pending.put(token, (text, tone_profile))
+        return token
+
+    def generate(self, text: str, tone_profile: Dict[str, Any]) -> Tuple[Optional[str], bool]:
+        """
+        產生草稿（優先讀快取）
+
+        Returns:
+            (草稿, 是否命中快取)
+        """
+        key = (DRAFT_SOURCE_RULES, draft_token(text, tone_profile))
+        draft = self._drafts.get(key)
+        if draft is not None:
+            return draft, True
+        draft = draft_reply_tool(text, tone_profile).get("draft")
+        if draft is not None:
+            self._drafts.put(key, draft)
+        return draft, False
+
+    def generate_for_token(self, token: str) -> Optional[Tuple[Optional[str], bool]]:
+        """
+        以 token 產生草稿
+
+        Returns:
+            (草稿, 是否命中快取)；token 不存在或已過期時回傳 None
+        """
+        draft = self._drafts.get((DRAFT_SOURCE_RULES, token))
+        if draft is not None:
+            return draft, True
+        pending = self._pending.get(token)
+        if pending is None:
+            return None
+        return self.generate(*pending)
+
+    def pending_input(self, token: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """token 對應的 (訊息內容, 語調設定)，不存在或已過期時回傳 None"""
+        return self._pending.get(token)
+
+    async def _stream_body(self, text: str, tone_profile: Dict[str, Any]) -> AsyncIterator[str]:
+        """逐段產生不含簽名的草稿"""
+        if self.llm is None:
+            # 規則式草稿一次完成，以不含簽名的設定產生後整段輸出
+            body = draft_reply_tool(text, {**tone_profile, "signature": ""}).get("draft")
+            if body:
+                yield body
+            return
+
+        system_prompt = DRAFT_STREAM_PROMPT.format(
+            name=tone_profile.get("name", ""),
+            style=tone_profile.get("style", "正式"),
+            reply_length=tone_profile.get("reply_length", "簡短"),
+            language=tone_profile.get("language", "zh-tw"),
+        )
+        async for chunk in self.llm.astream([("system", system_prompt), ("human", text)]):
+            content = getattr(chunk, "content", chunk)
+            if content:
+                yield content
+
+    async def stream(self, text: str, tone_profile: Dict[str, Any]) -> AsyncIterator[str]:
+        """
+        逐段輸出草稿，最後附加簽名
+
+        快取命中時一次輸出完整草稿；串流完整結束後才寫入快取（LLM 草稿與規則式草稿分開快取），
+        中途取消（例如用戶端斷線）時丟棄已產生的部分
+        """
+        key = (self.stream_source, draft_token(text, tone_profile))
+        cached = self._drafts.get(key)
+        if cached is not None:
+            yield cached
+            return
+
+        parts = []
+        async for chunk in self._stream_body(text, tone_profile):
+            parts.append(chunk)
+            yield chunk
+
+        signature = tone_profile.get("signature", "")
+        if signature and signature.strip():
+            suffix = f" {signature}"
+            parts.append(suffix)
+            yield suffix
+
+        if parts:
+            self._drafts.put(key, "".join(parts))
+
+    def stats(self) -> Dict[str, Any]:
+        """待產生與已快取草稿的統計"""
+        return {"pending": self._pending.stats(), "drafts": self._drafts.stats()}
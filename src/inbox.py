@@ -0,0 +1,125 @@
+"""
+增量維護的優先收件匣索引
+項目依 (priority, -last_message_at, -unread_count, id) 排序：優先級數字越小越前面，
+同優先級時新的在前、未讀多的在前。以分桶排序串列存放，
+新增 / 更新為 O(log n + 桶大小)，前 k 筆與游標分頁為 O(log n + k)
+"""
+from bisect import bisect_left, bisect_right, insort
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# (priority, -last_message_at_micros, -unread_count, item_id)
+InboxKey = Tuple[int, int, int, str]
+
+# 每個桶的目標大小，超過兩倍時分裂
+_BUCKET_SIZE = 512
+
+
+def inbox_key(item_id: str, priority: int, last_message_at: int, unread_count: int) -> InboxKey:
+    """建立排序鍵（last_message_at 為微秒整數）"""
+    return (priority, -last_message_at, -unread_count, item_id)
+
+
+class PriorityInbox:
+    """分桶排序的收件匣索引（item_id 唯一）"""
+
+    def __init__(self, bucket_size: int = _BUCKET_SIZE):
+        self.bucket_size = bucket_size
+        self._buckets: List[List[InboxKey]] = []
+        # 每個桶的最大鍵，用來二分搜尋桶的位置
+        self._maxes: List[InboxKey] = []
+        self._keys: Dict[str, InboxKey] = {}
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, item_id: str) -> bool:
+        return item_id in self._keys
+
+    def key_of(self, item_id: str) -> Optional[InboxKey]:
+        """目前的排序鍵"""
+        return self._keys.get(item_id)
+
+    def _insert(self, key: InboxKey):
+        if not self._buckets:
+            self._buckets.append([key])
+            self._maxes.append(key)
+            return
+        pos = bisect_left(self._maxes, key)
+        if pos == len(self._buckets):
+            pos -= 1
+        bucket = self._buckets[pos]
+        insort(bucket, key)
+        self._maxes[pos] = bucket[-1]
+        if len(bucket) > self.bucket_size * 2:
+            half = len(bucket) // 2
+            self._buckets[pos:pos + 1] = [bucket[:half], bucket[half:]]
+            self._maxes[pos:pos + 1] = [bucket[half - 1], bucket[-1]]
+
+    def _remove(self, key: InboxKey):
+        pos = bisect_left(self._maxes, key)
+        bucket = self._buckets[pos]
+        del bucket[bisect_left(bucket, key)]
+        if bucket:
+            self._maxes[pos] = bucket[-1]
+        else:
+            del self._buckets[pos]
+            del self._maxes[pos]
+
+    def upsert(self, item_id: str, priority: int, last_message_at: int, unread_count: int):
+        """新增或更新項目"""
+        key = inbox_key(item_id, priority, last_message_at, unread_count)
+        old_key = self._keys.get(item_id)
+        if old_key == key:
+            return
+        if old_key is not None:
+            self._remove(old_key)
+        self._insert(key)
+        self._keys[item_id] = key
+
+    def remove(self, item_id: str) -> bool:
+        """移除項目，不存在時回傳 False"""
+        key = self._keys.pop(item_id, None)
+        if key is None:
+            return False
+        self._remove(key)
+        return True
+
+    def _iter_from(self, after: Optional[InboxKey]) -> Iterator[InboxKey]:
+        if after is None:
+            pos, offset = 0, 0
+        else:
+            pos = bisect_right(self._maxes, after)
+            if pos == len(self._buckets):
+                return
+            offset = bisect_right(self._buckets[pos], after)
+        for bucket in self._buckets[pos:]:
+            yield from bucket[offset:] if offset else bucket
+            offset = 0
+
+    def top(self, k: int) -> List[str]:
+        """最重要的前 k 筆 item_id"""
+        return self.page(limit=k)[0]
+
+    def page(self, after_id: Optional[str] = None, limit: int = 50) -> Tuple[List[str], Optional[str]]:
+        """
+        以游標分頁
+
+        Args:
+            after_id: 上一頁最後一筆的 item_id，None 表示從頭開始
+            limit: 每頁筆數
+
+        Returns:
+            (本頁 item_id, 下一頁游標；沒有下一頁時為 None)
+        """
+        after = None
+        if after_id is not None:
+            after = self._keys.get(after_id)
+            if after is None:
+                return [], None
+
+        ids = []
+        for key in self._iter_from(after):
+            if len(ids) == limit:
+                return ids, ids[-1]
+            ids.append(key[3])
+        return ids, None
@@ -0,0 +1,114 @@
+"""
+訊息關鍵字掃描
+分類、標籤與回覆意圖共用同一次掃描：所有關鍵字編譯成單一正規表示式，
+每則訊息只走訪一次，之後的判斷都是集合運算；
+掃描結果與逐一以 `keyword in text` 比對相同（包含互相重疊的關鍵字）
+"""
+import re
+from typing import Dict, FrozenSet, List, Tuple
+
+from .cache import LRUCache
+
+# 內建分類關鍵字（依序比對，先符合者優先；可由規則集覆寫）
+CATEGORY_KEYWORDS: List[Tuple[str, Tuple[str, ...]]] = [
+    ("工作", ('會議', '工作', '專案', '客戶', '報告', '截止', '任務')),
+    ("家人", ('媽', '爸', '爸爸', '媽媽', '家人', '回家', '家裡')),
+    ("廣告", ('促銷', '優惠', '購買', '限時', '特價', '廣告', '推廣')),
+]
+
+# 內建標籤關鍵字
+TAG_KEYWORDS: Dict[str, List[str]] = {
+    '會議': ['會議', '工作'],
+    '電影': ['電影', '娛樂'],
+    '吃飯': ['聚餐', '美食'],
+    '生日': ['生日', '慶祝'],
+    '旅行': ['旅遊', '出遊'],
+    '購物': ['購物', '消費'],
+    '運動': ['運動', '健身'],
+    '學習': ['學習', '教育'],
+    '醫院': ['健康', '醫療'],
+    '緊急': ['緊急', '重要']
+}
+
+# 回覆意圖關鍵字（依序比對，先符合者優先；英文以小寫比對）
+INTENT_KEYWORDS: List[Tuple[str, Tuple[str, ...]]] = [
+    ("question", ('?', '？', '嗎', '吗', 'か？', '까')),
+    ("thanks", ('謝謝', '感謝', '谢谢', '感谢', 'thank', 'ありがとう', '감사', '고마워')),
+    ("meeting", ('會議', '開會', '会议', '开会', 'meeting', '会議', '회의')),
+]
+GENERAL_INTENT = "general"
+INTENTS = [intent for intent, _ in INTENT_KEYWORDS] + [GENERAL_INTENT]
+
+
+class KeywordMatcher:
+    """
+    編譯後的關鍵字比對器
+
+    分類、標籤、意圖關鍵字合併為單一正規表示式；同一則訊息會依序經過分類、標籤、
+    草稿工具，掃描結果以訊息內容快取，整個處理流程只掃描一次
+    """
+
+    def __init__(self, category_keywords: List[Tuple[str, Tuple[str, ...]]] = CATEGORY_KEYWORDS,
+                 tag_keywords: Dict[str, List[str]] = TAG_KEYWORDS,
+                 intent_keywords: List[Tuple[str, Tuple[str, ...]]] = INTENT_KEYWORDS,
+                 cache_size: int = 1024):
+        # 英文一律以小寫比對
+        self.category_keywords = [(category, tuple(keyword.lower() for keyword in group))
+                                  for category, group in category_keywords]
+        self.tag_keywords = {keyword.lower(): list(tags) for keyword, tags in tag_keywords.items()}
+        self.intent_keywords = [(intent, tuple(keyword.lower() for keyword in group))
+                                for intent, group in intent_keywords]
+
+        keywords = {keyword for _, group in self.category_keywords for keyword in group}
+        keywords.update(self.tag_keywords)
+        keywords.update(keyword for _, group in self.intent_keywords for keyword in group)
+        keywords.discard("")
+        # 以零寬度的前瞻比對每個位置，重疊的關鍵字（例如「開會議」中的「開會」與「會議」）都會被找到；
+        # 長的關鍵字優先，同一位置開始的較短關鍵字與其中包含的關鍵字由 _contained 補上
+        alternatives = sorted(keywords)
+        alternatives.sort(key=len, reverse=True)
+        self._pattern = (re.compile("(?=(" + "|".join(re.escape(keyword) for keyword in alternatives) + "))")
+                         if alternatives else None)
+        # 關鍵字 -> 它包含的所有關鍵字（含自身）
+        self._contained: Dict[str, FrozenSet[str]] = {
+            keyword: frozenset(other for other in keywords if other in keyword) for keyword in keywords
+        }
+        self._scans = LRUCache(cache_size)
+
+    def scan(self, text: str) -> FrozenSet[str]:
+        """單次掃描訊息，回傳出現的關鍵字"""
+        found = self._scans.get(text)
+        if found is not None:
+            return found
+        if self._pattern is None:
+            found = frozenset()
+        else:
+            found = frozenset().union(*(self._contained[keyword]
+                                        for keyword in set(self._pattern.findall(text.lower()))))
+        self._scans.put(text, found)
+        return found
+
+    def category(self, text: str, default: str = "朋友") -> str:
+        """依關鍵字判斷分類（依序比對，先符合者優先）"""
+        found = self.scan(text)
+        for category, group in self.category_keywords:
+            if not found.isdisjoint(group):
+                return category
+        return default
+
+    def tags(self, text: str) -> List[str]:
+        """依關鍵字產生標籤（依關鍵字表順序，不重複）"""
+        found = self.scan(text)
+        tags = []
+        for keyword, related_tags in self.tag_keywords.items():
+            if keyword in found:
+                tags.extend(tag for tag in related_tags if tag not in tags)
+        return tags
+
+    def intent(self, text: str) -> str:
+        """判斷回覆意圖：question / thanks / meeting / general"""
+        found = self.scan(text)
+        for intent, group in self.intent_keywords:
+            if not found.isdisjoint(group):
+                return intent
+        return GENERAL_INTENT
@@ -0,0 +1,391 @@
+"""
+訊息的緊湊欄式（columnar）記憶體儲存
+以陣列存放 id / 時間戳，發送者字串共用（interning），processed 以位元組集合表示，
+對外仍透過 dict 介面提供，與既有 DemoStorage API 相容
+"""
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Any, Optional, Iterator, Iterable, Tuple
+
+# 時間戳以「自 1970-01-01 起的微秒數」整數儲存
+_EPOCH = datetime(1970, 1, 1)
+
+# 由欄位直接提供的訊息鍵，其他鍵一律放入 extras
+_CORE_FIELDS = ("id", "text", "sender_id", "sender_name", "timestamp",
+                "processed", "processing_result", "processed_at")
+
+
+def timestamp_to_micros(value: str) -> Optional[int]:
+    """將 ISO 時間字串轉為微秒整數，無法解析時回傳 None"""
+    try:
+        dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return (dt - _EPOCH) // timedelta(microseconds=1)
+
+
+def micros_to_timestamp(value: int) -> str:
+    """將微秒整數轉回 ISO 時間字串"""
+    return (_EPOCH + timedelta(microseconds=value)).isoformat()
+
+
+def project_message(message: Dict[str, Any], fields: Optional[Iterable[str]] = None,
+                    exclude: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+    """只保留訊息 dict 的指定欄位 / 去除排除欄位（各儲存後端的 list_messages 共用）"""
+    if fields is not None:
+        message = {key: message[key] for key in fields if key in message}
+    for key in exclude or ():
+        message.pop(key, None)
+    return message
+
+
+class MessageStore:
+    """
+    欄式訊息儲存
+
+    - ids / timestamps: array('q')
+    - 發送者: (sender_id, sender_name) 組合只存一次，每列只存索引 array('I')
+    - processed: bytearray 位元集合
+    - processing_result / processed_at / 其他欄位: 稀疏 dict（只有已處理的列才有）
+    - 處理結果的分類 / 優先級 / 封存狀態另存為欄位（由 processing_result 衍生，供整欄評估封存規則）
+    """
+
+    __slots__ = (
+        "_ids", "_timestamps", "_sender_idx", "_processed", "_texts",
+        "_senders", "_sender_lookup", "_results", "_processed_at",
+        "_raw_timestamps", "_extras", "_id_to_row", "_max_id",
+        "_unprocessed_count", "_category_idx", "_categories", "_category_lookup",
+        "_priorities", "_archived",
+    )
+
+    def __init__(self):
+        self._ids = array("q")
+        self._timestamps = array("q")
+        self._sender_idx = array("I")
+        self._processed = bytearray()
+        self._texts: List[str] = []
+        self._senders: List[Tuple[str, str]] = []
+        self._sender_lookup: Dict[Tuple[str, str], int] = {}
+        self._results: Dict[int, Dict[str, Any]] = {}
+        self._processed_at: Dict[int, str] = {}
+        # 無法以微秒整數完整還原的原始時間字串（例如帶時區）
+        self._raw_timestamps: Dict[int, str] = {}
+        self._extras: Dict[int, Dict[str, Any]] = {}
+        # ids 遞增時以二分搜尋定位，否則才建立 id -> row 對照表
+        self._id_to_row: Optional[Dict[int, int]] = None
+        self._max_id = 0
+        self._unprocessed_count = 0
+        # 處理結果衍生欄位：分類字串共用（索引 0 為無分類），優先級不在 1-127 時存 0，
+        # 封存狀態 -1 表示沒有 dict 形式的處理結果
+        self._category_idx = array("I")
+        self._categories: List[Optional[str]] = [None]
+        self._category_lookup: Dict[str, int] = {}
+        self._priorities = array("b")
+        self._archived = array("b")
+
+    @classmethod
+    def from_records(cls, records: Iterable[Dict[str, Any]]) -> "MessageStore":
+        """由訊息 dict 列表建立儲存"""
+        store = cls()
+        for record in records:
+            store.append(record)
+        return store
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    @property
+    def max_id(self) -> int:
+        """目前最大的訊息 ID"""
+        return self._max_id
+
+    @property
+    def unprocessed_count(self) -> int:
+        """未處理訊息數量（隨寫入即時維護）"""
+        return self._unprocessed_count
+
+    # 位元集合操作
+    def is_processed(self, row: int) -> bool:
+        """該列是否已處理"""
+        return bool(self._processed[row >> 3] & (1 << (row & 7)))
+
+    def _set_processed_bit(self, row: int):
+        self._processed[row >> 3] |= 1 << (row & 7)
+
+    def _intern_sender(self, sender_id: str, sender_name: str) -> int:
+        key = (sender_id, sender_name)
+        idx = self._sender_lookup.get(key)
+        if idx is None:
+            idx = len(self._senders)
+            self._senders.append(key)
+            self._sender_lookup[key] = idx
+        return idx
+
+    def _intern_category(self, category: Any) -> int:
+        if not isinstance(category, str):
+            return 0
+        idx = self._category_lookup.get(category)
+        if idx is None:
+            idx = len(self._categories)
+            self._categories.append(category)
+            self._category_lookup[category] = idx
+        return idx
+
+    def _result_columns(self, result: Any) -> Tuple[int, int, int]:
+        """處理結果對應的 (分類索引, 優先級, 封存狀態)"""
+        if not isinstance(result, dict):
+            return 0, 0, -1
+        priority = result.get("priority")
+        if not (isinstance(priority, int) and 0 < priority < 128):
+            priority = 0
+        return self._intern_category(result.get("category")), priority, int(bool(result.get("should_archive")))
+
+    def _set_result_columns(self, row: int, result: Any):
+        self._category_idx[row], self._priorities[row], self._archived[row] = self._result_columns(result)
+
+    def _rebuild_result_columns(self):
+        """由稀疏的處理結果重建衍生欄位"""
+        total = len(self._ids)
+        self._category_idx = array("I", bytes(4 * total))
+        self._priorities = array("b", bytes(total))
+        self._archived = array("b", b"\xff" * total)
+        for row, result in self._results.items():
+            self._set_result_columns(row, result)
+
+    def append(self, record: Dict[str, Any]) -> int:
+        """新增一筆訊息，回傳列號"""
+        row = len(self._ids)
+        message_id = int(record["id"])
+
+        if self._id_to_row is None and row and message_id <= self._ids[-1]:
+            # 出現非遞增 ID，改用對照表
+            self._id_to_row = {mid: r for r, mid in enumerate(self._ids)}
+        if self._id_to_row is not None:
+            self._id_to_row[message_id] = row
+
+        raw_ts = str(record.get("timestamp", ""))
+        micros = timestamp_to_micros(raw_ts)
+        if micros is None or micros_to_timestamp(micros) != raw_ts:
+            self._raw_timestamps[row] = raw_ts
+        self._ids.append(message_id)
+        self._timestamps.append(micros if micros is not None else 0)
+        self._sender_idx.append(self._intern_sender(
+            str(record.get("sender_id", "")), str(record.get("sender_name", ""))))
+        self._texts.append(str(record.get("text", "")))
+
+        if row & 7 == 0:
+            self._processed.append(0)
+        if record.get("processed", False):
+            self._set_processed_bit(row)
+        else:
+            self._unprocessed_count += 1
+
+        category_idx, priority, archived = self._result_columns(record.get("processing_result"))
+        self._category_idx.append(category_idx)
+        self._priorities.append(priority)
+        self._archived.append(archived)
+        if "processing_result" in record:
+            self._results[row] = record["processing_result"]
+        if "processed_at" in record:
+            self._processed_at[row] = record["processed_at"]
+        extras = {k: v for k, v in record.items() if k not in _CORE_FIELDS}
+        if extras:
+            self._extras[row] = extras
+
+        self._max_id = max(self._max_id, message_id)
+        return row
+
+    def row_of(self, message_id: int) -> Optional[int]:
+        """由訊息 ID 找出列號"""
+        if self._id_to_row is not None:
+            return self._id_to_row.get(message_id)
+        row = bisect_left(self._ids, message_id)
+        if row < len(self._ids) and self._ids[row] == message_id:
+            return row
+        return None
+
+    def id_at(self, row: int) -> int:
+        """列號對應的訊息 ID"""
+        return self._ids[row]
+
+    def timestamp_micros_at(self, row: int) -> int:
+        """列號對應的時間戳（微秒）"""
+        return self._timestamps[row]
+
+    def text_at(self, row: int) -> str:
+        """列號對應的訊息內容"""
+        return self._texts[row]
+
+    def sender_at(self, row: int) -> Tuple[str, str]:
+        """列號對應的 (sender_id, sender_name)"""
+        return self._senders[self._sender_idx[row]]
+
+    def result_at(self, row: int) -> Optional[Dict[str, Any]]:
+        """列號對應的處理結果"""
+        return self._results.get(row)
+
+    def processed_time_at(self, row: int) -> Optional[str]:
+        """列號對應的處理時間"""
+        return self._processed_at.get(row)
+
+    def get_dict(self, row: int) -> Dict[str, Any]:
+        """將單列還原為訊息 dict"""
+        sender_id, sender_name = self._senders[self._sender_idx[row]]
+        timestamp = self._raw_timestamps.get(row)
+        if timestamp is None:
+            timestamp = micros_to_timestamp(self._timestamps[row])
+
+        message = {
+            "id": self._ids[row],
+            "text": self._texts[row],
+            "sender_id": sender_id,
+            "sender_name": sender_name,
+            "timestamp": timestamp,
+            "processed": self.is_processed(row),
+        }
+        if row in self._results:
+            message["processing_result"] = self._results[row]
+        if row in self._processed_at:
+            message["processed_at"] = self._processed_at[row]
+        if row in self._extras:
+            message.update(self._extras[row])
+        return message
+
+    def get_projected(self, row: int, fields: Optional[Iterable[str]] = None,
+                      exclude: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        """還原單列並只保留指定欄位 / 去除排除欄位"""
+        return project_message(self.get_dict(row), fields, exclude)
+
+    def get(self, message_id: int) -> Optional[Dict[str, Any]]:
+        """根據 ID 取得訊息 dict"""
+        row = self.row_of(message_id)
+        return self.get_dict(row) if row is not None else None
+
+    def iter_rows(self, unprocessed_only: bool = False) -> Iterator[int]:
+        """依儲存順序走訪列號"""
+        for row in range(len(self._ids)):
+            if unprocessed_only and self.is_processed(row):
+                continue
+            yield row
+
+    def page(self, after_id: Optional[int] = None, limit: int = 50,
+             unprocessed_only: bool = False) -> Tuple[List[int], Optional[int]]:
+        """
+        以游標分頁（依儲存順序）
+
+        Args:
+            after_id: 上一頁最後一筆的訊息 ID，None 表示從頭開始
+            limit: 每頁筆數
+            unprocessed_only: 只列出未處理訊息
+
+        Returns:
+            (本頁列號, 下一頁游標；沒有下一頁時為 None)
+        """
+        if after_id is None:
+            row = 0
+        elif self._id_to_row is None:
+            row = bisect_right(self._ids, after_id)
+        else:
+            found = self._id_to_row.get(after_id)
+            row = found + 1 if found is not None else len(self._ids)
+
+        total = len(self._ids)
+        rows = []
+        while row < total and len(rows) <= limit:
+            if unprocessed_only and self._processed[row >> 3] == 0xFF and row & 7 == 0:
+                # 整個位元組都已處理，一次跳過 8 列
+                row += 8
+                continue
+            if not (unprocessed_only and self.is_processed(row)):
+                rows.append(row)
+            row += 1
+
+        if len(rows) > limit:
+            return rows[:limit], self._ids[rows[limit - 1]]
+        return rows, None
+
+    def iter_dicts(self, unprocessed_only: bool = False) -> Iterator[Dict[str, Any]]:
+        """依儲存順序走訪訊息 dict"""
+        for row in self.iter_rows(unprocessed_only):
+            yield self.get_dict(row)
+
+    def to_records(self) -> List[Dict[str, Any]]:
+        """匯出為訊息 dict 列表（JSON 持久化用）"""
+        return list(self.iter_dicts())
+
+    def mark_processed(self, message_id: int, result: Dict[str, Any], processed_at: str) -> bool:
+        """標記訊息為已處理，找不到訊息時回傳 False"""
+        row = self.row_of(message_id)
+        if row is None:
+            return False
+        if not self.is_processed(row):
+            self._set_processed_bit(row)
+            self._unprocessed_count -= 1
+        self._results[row] = result
+        self._processed_at[row] = processed_at
+        self._set_result_columns(row, result)
+        return True
+
+    def archive_columns(self) -> Dict[str, Any]:
+        """
+        封存規則整欄評估用的欄位
+
+        Returns:
+            {"processed" (位元集合), "category_idx", "categories" (索引 -> 分類),
+             "priority", "archived" (-1 表示沒有處理結果)}
+        """
+        return {
+            "processed": self._processed,
+            "category_idx": self._category_idx,
+            "categories": self._categories,
+            "priority": self._priorities,
+            "archived": self._archived,
+        }
+
+    # 快照序列化
+    def dump_columns(self) -> Dict[str, Any]:
+        """匯出內部欄位（供二進位快照使用）"""
+        return {
+            "ids": self._ids,
+            "timestamps": self._timestamps,
+            "sender_idx": self._sender_idx,
+            "processed": self._processed,
+            "texts": self._texts,
+            "senders": self._senders,
+            "sparse": {
+                "results": self._results,
+                "processed_at": self._processed_at,
+                "raw_timestamps": self._raw_timestamps,
+                "extras": self._extras,
+            },
+        }
+
+    @classmethod
+    def from_columns(cls, ids: array, timestamps: array, sender_idx: array,
+                     processed: bytearray, texts: List[str],
+                     senders: List[Tuple[str, str]], sparse: Dict[str, Dict[int, Any]]) -> "MessageStore":
+        """由快照欄位還原儲存"""
+        store = cls()
+        store._ids = ids
+        store._timestamps = timestamps
+        store._sender_idx = sender_idx
+        store._processed = processed
+        store._texts = texts
+        store._senders = senders
+        store._sender_lookup = {key: idx for idx, key in enumerate(senders)}
+        store._results = sparse.get("results", {})
+        store._processed_at = sparse.get("processed_at", {})
+        store._raw_timestamps = sparse.get("raw_timestamps", {})
+        store._extras = sparse.get("extras", {})
+        store._rebuild_result_columns()
+
+        if ids:
+            store._max_id = max(ids)
+            if any(ids[i] >= ids[i + 1] for i in range(len(ids) - 1)):
+                store._id_to_row = {mid: r for r, mid in enumerate(ids)}
+        processed_rows = sum(bin(byte).count("1") for byte in processed)
+        store._unprocessed_count = len(ids) - processed_rows
+        return store
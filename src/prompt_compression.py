@@ -0,0 +1,114 @@
+"""
+Prompt 壓縮
+移除多餘空白、範例區段與同一區段內重複的條列限制，保留 Jinja 語法與其餘內容不變
+"""
+import re
+from typing import Any, Dict, List
+
+from jinja2 import Environment, TemplateError
+
+from .token_estimator import estimate_tokens
+
+# 視為範例的 Markdown 標題
+_EXAMPLE_HEADING = re.compile(r"^#+\s*(example|examples|範例|示例|例子)\b", re.IGNORECASE)
+_HEADING = re.compile(r"^#+\s")
+_LIST_ITEM = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s+(.*)$")
+_INLINE_SPACES = re.compile(r"[ \t]{2,}")
+
+_syntax_env = Environment()
+
+
+def _drop_examples(lines: List[str]) -> List[str]:
+    kept = []
+    skipping = False
+    for line in lines:
+        if _HEADING.match(line.strip()):
+            skipping = bool(_EXAMPLE_HEADING.match(line.strip()))
+        if not skipping:
+            kept.append(line)
+    return kept
+
+
+def _drop_duplicate_items(lines: List[str]) -> List[str]:
+    """移除同一區段內重複的條列項目（標題或空行即為區段邊界，不同區段的相同指示各自保留）"""
+    kept = []
+    seen = set()
+    for line in lines:
+        if not line.strip() or _HEADING.match(line.strip()):
+            seen = set()
+        item = _LIST_ITEM.match(line)
+        if item:
+            key = item.group(1).strip().lower()
+            if key in seen:
+                continue
+            seen.add(key)
+        kept.append(line)
+    return kept
+
+
+def _normalize_whitespace(lines: List[str]) -> List[str]:
+    kept = []
+    for line in lines:
+        line = _INLINE_SPACES.sub(" ", line.rstrip())
+        if not line.strip():
+            # 連續空行合併為一行（空行仍是段落 / 區段的分隔），開頭的空行移除
+            if kept and kept[-1]:
+                kept.append("")
+            continue
+        kept.append(line)
+    while kept and not kept[-1]:
+        kept.pop()
+    return kept
+
+
+def _drop_empty_sections(lines: List[str]) -> List[str]:
+    kept = []
+    for i, line in enumerate(lines):
+        next_line = next((other for other in lines[i + 1:] if other.strip()), None)
+        if _HEADING.match(line.strip()) and (next_line is None or _HEADING.match(next_line.strip())):
+            # 內容全部被移除的標題
+            continue
+        kept.append(line)
+    return kept
+
+
+def _is_valid_template(template: str) -> bool:
+    try:
+        _syntax_env.parse(template)
+        return True
+    except TemplateError:
+        return False
+
+
+def compress_prompt(template: str, drop_examples: bool = True) -> Dict[str, Any]:
+    """
+    壓縮 Prompt 模板
+
+    Args:
+        template: Prompt 模板
+        drop_examples: 是否移除範例區段
+
+    Returns:
+        {"content": 壓縮後模板, "tokens_before", "tokens_after", "saved_tokens"}
+        移除範例會破壞模板語法（例如範例位於 {% if %} 區塊內）時保留範例，
+        仍無法維持語法時回傳原模板
+    """
+    lines = template.split("\n")
+    content = template
+    for remove_examples in ([True, False] if drop_examples else [False]):
+        candidate = _drop_examples(lines) if remove_examples else lines
+        candidate = _drop_empty_sections(_normalize_whitespace(_drop_duplicate_items(candidate)))
+        # 移除空標題後可能留下相鄰的空行
+        candidate = _normalize_whitespace(candidate)
+        if _is_valid_template("\n".join(candidate)):
+            content = "\n".join(candidate)
+            break
+
+    tokens_before = estimate_tokens(template)
+    tokens_after = estimate_tokens(content)
+    return {
+        "content": content,
+        "tokens_before": tokens_before,
+        "tokens_after": tokens_after,
+        "saved_tokens": tokens_before - tokens_after
+    }
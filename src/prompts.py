@@ -1,23 +1,98 @@
 """
 System Prompt 管理模組
 """
+import hashlib
 import logging
-from typing import Optional, Dict, Any
-from jinja2 import Template, TemplateError
-from .constants import DEFAULT_PROMPT_TEMPLATE
-from .database import SyncDatabaseManager as DatabaseManager
+import time
+from typing import Optional, Dict, Any, Tuple
+from jinja2 import Environment, Template, TemplateError, meta
+from .cache import LRUCache
+from .constants import API_LIMITS, PERFORMANCE_THRESHOLDS, PROMPT_CACHE, PROMPT_LAYOUTS
+from .prompt_compression import compress_prompt
+from .storage import StorageBackend
 from .schemas import ToneProfile
+from .token_estimator import estimate_tokens
 
 logger = logging.getLogger(__name__)
 
+# 所有 PromptManager 共用的 Jinja 環境（設定與 jinja2.Template 預設值相同，渲染結果不變）
+_jinja_env = Environment(auto_reload=False)
+
+
+def template_key(template: str) -> bytes:
+    """模板內容雜湊，作為編譯與渲染快取的鍵"""
+    return hashlib.blake2b(template.encode("utf-8"), digest_size=16).digest()
+
+
+def profile_key(tone_profile: ToneProfile) -> Tuple[str, ...]:
+    """語調設定檔的快取鍵（與渲染變數一一對應）"""
+    return (tone_profile.name, tone_profile.profile, tone_profile.style,
+            tone_profile.reply_length, tone_profile.signature, tone_profile.language)
+
+
+class _ActivePrompt:
+    """快取中的活躍 Prompt（version 來自 Prompt ID 與 updated_at，預設模板為 None）"""
+    
+    __slots__ = ("content", "version", "expires_at")
+    
+    def __init__(self, content: str, version: Optional[str], expires_at: Optional[float]):
+        self.content = content
+        self.version = version
+        self.expires_at = expires_at
+
 
 class PromptManager:
-    """System Prompt 管理器"""
+    """
+    System Prompt 管理器
     
-    def __init__(self, db_manager: DatabaseManager):
+    layout 決定沒有自定 Prompt 時使用的預設模板：
+    - "default": 原本的版面（使用者名稱在第一行）
+    - "cache_friendly": 靜態指示在前、個人化區塊在最後，所有使用者共用同一段前綴，
+      可被 LLM 供應商的 prompt 前綴快取重用（自定 Prompt 維持使用者自己的版面）
+    """
+    
+    def __init__(self, db_manager: StorageBackend, layout: str = "default",
+                 active_ttl: Optional[float] = PROMPT_CACHE["ACTIVE_PROMPT_TTL"],
+                 max_users: int = PROMPT_CACHE["MAX_USERS"],
+                 max_rendered: int = PROMPT_CACHE["MAX_RENDERED"],
+                 max_compiled: int = PROMPT_CACHE["MAX_COMPILED"]):
+        if layout not in PROMPT_LAYOUTS:
+            raise ValueError(f"未知的 prompt 版面: {layout}，可用: {list(PROMPT_LAYOUTS)}")
         self.db = db_manager
-        self.default_template = DEFAULT_PROMPT_TEMPLATE
-        self._template_cache = {}
+        self.layout = layout
+        self.default_template = PROMPT_LAYOUTS[layout]
+        self.env = _jinja_env
+        # 每位使用者的活躍 Prompt；TTL 到期後重新讀取並比對版本（涵蓋其他 worker 的修改）
+        self.active_ttl = active_ttl
+        self._active_cache = LRUCache(max_users)
+        # 已編譯模板，鍵為 template_key(模板內容)
+        self._compiled_cache = LRUCache(max_compiled)
+        # 渲染結果，鍵為 (template_key, profile_key)；內容改變即換鍵，不需主動失效，
+        # 使用相同模板（例如預設模板）與相同語調設定的使用者共用同一份結果
+        self._rendered_cache = LRUCache(max_rendered)
+    
+    def _load_active_prompt(self, user_id: str) -> _ActivePrompt:
+        """取得使用者的活躍 Prompt（優先讀快取，資料庫錯誤時向上拋出）"""
+        now = time.monotonic()
+        cached = self._active_cache.get(user_id)
+        if cached is not None and (cached.expires_at is None or now < cached.expires_at):
+            return cached
+        
+        active_prompt = self.db.get_active_prompt(user_id)
+        if active_prompt:
+            logger.info(f"載入用戶 {user_id} 的自定 prompt: {active_prompt['name']}")
+            content = active_prompt['content']
+            version = f"{active_prompt['id']}:{active_prompt['updated_at']}"
+        else:
+            logger.info(f"用戶 {user_id} 無自定 prompt，使用預設模板")
+            content = self.default_template
+            version = None
+        
+        if cached is not None and cached.version != version:
+            logger.info(f"用戶 {user_id} 的 prompt 已在其他程序更新 (版本 {cached.version} -> {version})")
+        entry = _ActivePrompt(content, version, now + self.active_ttl if self.active_ttl else None)
+        self._active_cache.put(user_id, entry)
+        return entry
     
     def get_user_prompt(self, user_id: str) -> str:
         """
@@ -30,18 +105,75 @@ class PromptManager:
             Prompt 模板字串
         """
         try:
-            active_prompt = self.db.get_active_prompt(user_id)
-            if active_prompt:
-                logger.info(f"載入用戶 {user_id} 的自定 prompt: {active_prompt['name']}")
-                return active_prompt['content']
-            else:
-                logger.info(f"用戶 {user_id} 無自定 prompt，使用預設模板")
-                return self.default_template
+            return self._load_active_prompt(user_id).content
         except Exception as e:
             logger.error(f"載入用戶 prompt 失敗: {e}")
             return self.default_template
     
-    def save_user_prompt(self, user_id: str, name: str, content: str) -> bool:
+    def get_rendered_prompt(self, user_id: str, tone_profile: ToneProfile) -> str:
+        """
+        獲取用戶渲染後的 System Prompt（活躍 Prompt 與渲染結果皆經由快取）
+        
+        Args:
+            user_id: 使用者ID
+            tone_profile: 語調設定檔
+            
+        Returns:
+            渲染後的 Prompt
+        """
+        try:
+            template = self._load_active_prompt(user_id).content
+        except Exception as e:
+            logger.error(f"載入用戶 prompt 失敗: {e}")
+            template = self.default_template
+        return self.render_prompt(template, tone_profile)
+    
+    def invalidate_user(self, user_id: str):
+        """使單一使用者的活躍 Prompt 失效，不影響其他使用者"""
+        self._active_cache.pop(user_id)
+        logger.debug(f"已清除用戶 {user_id} 的 prompt 快取")
+    
+    def cache_stats(self) -> Dict[str, Any]:
+        """Prompt 快取統計（含命中率與淘汰次數）"""
+        return {
+            "active_prompts": self._active_cache.stats(),
+            "compiled_templates": self._compiled_cache.stats(),
+            "rendered_prompts": self._rendered_cache.stats()
+        }
+    
+    def _compile(self, template: str, key: Optional[bytes] = None) -> Template:
+        """取得已編譯模板（語法錯誤時拋出 TemplateError）"""
+        key = key or template_key(template)
+        compiled = self._compiled_cache.get(key)
+        if compiled is None:
+            compiled = self.env.from_string(template)
+            self._compiled_cache.put(key, compiled)
+        return compiled
+    
+    def estimate_prompt_tokens(self, content: str) -> int:
+        """估算 Prompt 的 token 數"""
+        return estimate_tokens(content)
+    
+    def compress_prompt(self, content: str, drop_examples: bool = True) -> Dict[str, Any]:
+        """
+        壓縮 Prompt（移除多餘空白、範例區段與重複限制）
+        
+        Args:
+            content: Prompt 內容
+            drop_examples: 是否移除範例區段
+            
+        Returns:
+            {"content", "tokens_before", "tokens_after", "saved_tokens"}
+        """
+        return compress_prompt(content, drop_examples=drop_examples)
+    
+    def _warn_if_over_budget(self, tokens: int, context: str):
+        threshold = PERFORMANCE_THRESHOLDS["TOKEN_WARNING_THRESHOLD"]
+        if tokens > threshold:
+            logger.warning(f"{context} 約 {tokens} tokens，超過警告閾值 {threshold}")
+    
+    def save_user_prompt(self, user_id: str, name: str, content: str,
+                         compress: bool = False) -> bool:
         """
         儲存用戶自定 Prompt
         
@@ -49,6 +181,7 @@ class PromptManager:
             user_id: 使用者ID
             name: Prompt 名稱
             content: Prompt 內容
+            compress: 儲存前先壓縮 Prompt
             
         Returns:
             是否儲存成功
@@ -59,6 +192,16 @@ class PromptManager:
                 logger.error("Prompt 內容驗證失敗")
                 return False
             
+            if compress:
+                result = self.compress_prompt(content)
+                content = result["content"]
+                logger.info(f"已壓縮用戶 {user_id} 的 prompt: {name}，"
+                            f"{result['tokens_before']} -> {result['tokens_after']} tokens")
+                tokens = result["tokens_after"]
+            else:
+                tokens = self.estimate_prompt_tokens(content)
+            self._warn_if_over_budget(tokens, f"用戶 {user_id} 的 prompt「{name}」")
+            
             # 儲存到資料庫
             success = self.db.save_user_prompt(user_id, name, content)
             if success:
@@ -104,9 +247,11 @@ class PromptManager:
         """
         try:
             # 檢查快取
-            cache_key = hash(template + str(tone_profile.dict()))
-            if cache_key in self._template_cache:
-                return self._template_cache[cache_key]
+            content_key = template_key(template)
+            cache_key = (content_key, profile_key(tone_profile))
+            rendered = self._rendered_cache.get(cache_key)
+            if rendered is not None:
+                return rendered
             
             # 準備渲染變數
             render_vars = {
@@ -119,12 +264,14 @@ class PromptManager:
             }
             
             # 渲染模板
-            jinja_template = Template(template)
+            jinja_template = self._compile(template, content_key)
             rendered = jinja_template.render(**render_vars)
             
             # 快取結果
-            self._template_cache[cache_key] = rendered
+            self._rendered_cache.put(cache_key, rendered)
             
+            # 每份渲染結果只在第一次產生時估算，之後由快取回傳
+            self._warn_if_over_budget(estimate_tokens(rendered), "渲染後的 prompt")
             logger.debug(f"成功渲染 prompt 模板，長度: {len(rendered)}")
             return rendered
             
@@ -147,9 +294,7 @@ class PromptManager:
             變數名稱列表
         """
         try:
-            from jinja2 import meta, Environment
-            env = Environment()
-            ast = env.parse(template)
+            ast = self.env.parse(template)
             variables = meta.find_undeclared_variables(ast)
             return list(variables)
         except Exception as e:
@@ -167,7 +312,7 @@ class PromptManager:
             (是否有效, 錯誤訊息)
         """
         try:
-            Template(template)
+            self._compile(template)
             return True, ""
         except TemplateError as e:
             return False, str(e)
@@ -222,7 +367,7 @@ class PromptManager:
             是否有效
         """
         # 基本長度檢查
-        if len(content) < 10 or len(content) > 10000:
+        if len(content) < 10 or len(content) > API_LIMITS["MAX_PROMPT_LENGTH"]:
             return False
         
         # 檢查是否包含基本結構
@@ -261,7 +406,5 @@ class PromptManager:
         return fallback
     
     def _clear_cache(self, user_id: str):
-        """清除特定用戶的快取"""
-        # 簡單清除所有快取，可以後續優化為更精確的清除
-        self._template_cache.clear()
-        logger.debug(f"已清除用戶 {user_id} 的 prompt 快取") 
\ No newline at end of file
+        """清除特定用戶的快取（以內容為鍵的編譯 / 渲染快取不需清除，舊內容不會再被查到）"""
+        self.invalidate_user(user_id) 
\ No newline at end of file
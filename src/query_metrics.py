@@ -0,0 +1,79 @@
+"""
+資料庫查詢延遲與連接池等待時間統計
+"""
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict
+
+# 連接池等待時間在統計中的名稱
+POOL_WAIT = "pool_wait"
+
+
+class _Series:
+    """單一查詢的累計值與最近樣本（用於百分位數）"""
+
+    __slots__ = ("count", "total", "max", "samples")
+
+    def __init__(self, sample_size: int):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples: Deque[float] = deque(maxlen=sample_size)
+
+
+class QueryMetrics:
+    """
+    以查詢名稱彙總執行時間（執行緒安全）
+
+    - count / avg / max 為啟動以來的累計值
+    - p50 / p95 由最近 sample_size 筆樣本計算
+    """
+
+    def __init__(self, sample_size: int = 1024):
+        self.sample_size = sample_size
+        self._series: Dict[str, _Series] = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float):
+        """記錄一次耗時（秒）"""
+        with self._lock:
+            series = self._series.get(name)
+            if series is None:
+                series = self._series[name] = _Series(self.sample_size)
+            series.count += 1
+            series.total += seconds
+            series.max = max(series.max, seconds)
+            series.samples.append(seconds)
+
+    @contextmanager
+    def timer(self, name: str):
+        """計時區塊（可包住 await，發生例外時同樣記錄）"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """目前統計（毫秒）"""
+        with self._lock:
+            series_items = [(name, series.count, series.total, series.max, sorted(series.samples))
+                            for name, series in self._series.items()]
+
+        result = {}
+        for name, count, total, longest, samples in series_items:
+            result[name] = {
+                "count": count,
+                "avg_ms": total / count * 1000 if count else 0.0,
+                "p50_ms": samples[len(samples) // 2] * 1000 if samples else 0.0,
+                "p95_ms": samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000 if samples else 0.0,
+                "max_ms": longest * 1000,
+            }
+        return result
+
+    def reset(self):
+        """清空統計"""
+        with self._lock:
+            self._series.clear()
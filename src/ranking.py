@@ -0,0 +1,141 @@
+"""
+對話串加權排序引擎
+分數 = 優先級 + 時間衰減 + 未讀數 + 星號聯絡人 的加權和，
+以欄式陣列批次計算，前 k 筆使用 argpartition（未安裝 NumPy 時改用純 Python 實作）
+"""
+import heapq
+import math
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .constants import RANKING, RANKING_WEIGHTS
+from .message_store import timestamp_to_micros
+
+_LN2 = math.log(2)
+
+
+class ThreadBatch:
+    """
+    欄式的對話串屬性
+
+    時間戳在建立時一次轉為微秒整數，之後每次評分都直接使用陣列
+    """
+
+    __slots__ = ("ids", "priority", "last_message_at", "unread_count", "is_starred")
+
+    def __init__(self, ids: Sequence[str], priority: Sequence[int], last_message_at: Sequence[int],
+                 unread_count: Sequence[int], is_starred: Sequence[bool]):
+        self.ids = list(ids)
+        if np is not None:
+            self.priority = np.asarray(priority, dtype=np.float64)
+            self.last_message_at = np.asarray(last_message_at, dtype=np.int64)
+            self.unread_count = np.asarray(unread_count, dtype=np.float64)
+            self.is_starred = np.asarray(is_starred, dtype=np.float64)
+        else:
+            self.priority = list(priority)
+            self.last_message_at = list(last_message_at)
+            self.unread_count = list(unread_count)
+            self.is_starred = [1.0 if starred else 0.0 for starred in is_starred]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def from_threads(cls, threads: List[Dict[str, Any]]) -> "ThreadBatch":
+        """由 sort_tool 格式的對話串 dict 建立（無法解析的時間戳視為 1970-01-01）"""
+        return cls(
+            ids=[thread['id'] for thread in threads],
+            priority=[thread.get('priority', 3) for thread in threads],
+            last_message_at=[timestamp_to_micros(thread.get('last_message_at', '')) or 0 for thread in threads],
+            unread_count=[thread.get('unread_count', 0) for thread in threads],
+            is_starred=[bool(thread.get('is_starred', False)) for thread in threads],
+        )
+
+
+def _merge_numeric(defaults: Dict[str, float], overrides: Optional[Dict[str, float]],
+                   kind: str) -> Dict[str, float]:
+    """以預設值補齊設定，拒絕未知的鍵與非數值"""
+    merged = {**defaults, **(overrides or {})}
+    unknown = set(merged) - set(defaults)
+    if unknown:
+        raise ValueError(f"未知的{kind}: {', '.join(sorted(unknown))}（可用: {', '.join(defaults)}）")
+    for key, value in merged.items():
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f"{kind} {key} 必須是數值")
+    return merged
+
+
+class RankingEngine:
+    """依 RANKING_WEIGHTS 各因子權重與 RANKING 因子參數計算對話串分數並排序"""
+
+    def __init__(self, weights: Optional[Dict[str, float]] = None,
+                 config: Optional[Dict[str, float]] = None):
+        self.weights = _merge_numeric(RANKING_WEIGHTS, weights, "排序權重")
+        self.config = _merge_numeric(RANKING, config, "排序參數")
+        if self.config["RECENCY_HALF_LIFE_HOURS"] <= 0 or self.config["UNREAD_CAP"] <= 0:
+            raise ValueError("RECENCY_HALF_LIFE_HOURS 與 UNREAD_CAP 必須大於 0")
+        # 每微秒的衰減率
+        self._decay = _LN2 / (self.config["RECENCY_HALF_LIFE_HOURS"] * 3600 * 1_000_000)
+
+    def scores(self, batch: ThreadBatch, now: Optional[int] = None):
+        """
+        計算每個對話串的分數
+
+        Args:
+            batch: 對話串屬性
+            now: 目前時間（微秒），預設為系統時間；未來的時間戳視為剛收到
+
+        Returns:
+            與 batch 同順序的分數（NumPy 陣列或 list）
+        """
+        now = int(time.time() * 1_000_000) if now is None else now
+        w = self.weights
+        cap = self.config["UNREAD_CAP"]
+
+        if np is not None:
+            age = np.maximum(now - batch.last_message_at, 0).astype(np.float64)
+            return (w["priority"] * (6.0 - batch.priority) / 5.0
+                    + w["recency"] * np.exp(-self._decay * age)
+                    + w["unread"] * np.minimum(batch.unread_count, cap) / cap
+                    + w["starred"] * batch.is_starred)
+
+        return [
+            w["priority"] * (6.0 - priority) / 5.0
+            + w["recency"] * math.exp(-self._decay * max(now - ts, 0))
+            + w["unread"] * min(unread, cap) / cap
+            + w["starred"] * starred
+            for priority, ts, unread, starred in zip(
+                batch.priority, batch.last_message_at, batch.unread_count, batch.is_starred
+            )
+        ]
+
+    def top_k(self, batch: ThreadBatch, k: int, now: Optional[int] = None) -> List[str]:
+        """分數最高的前 k 個 thread_id（同分時維持原順序）"""
+        n = len(batch)
+        k = min(k, n)
+        if k <= 0:
+            return []
+        scores = self.scores(batch, now)
+
+        if np is not None:
+            if k < n:
+                # 第 k 高的分數；與它同分的也列入候選，確保同分時結果固定
+                threshold = scores[np.argpartition(-scores, k - 1)[k - 1]]
+                candidates = np.flatnonzero(scores >= threshold)
+            else:
+                candidates = np.arange(n)
+            # 只排序候選：分數由高到低，同分依原索引
+            order = candidates[np.lexsort((candidates, -scores[candidates]))][:k]
+            return [batch.ids[i] for i in order]
+
+        order = heapq.nsmallest(k, range(n), key=lambda i: (-scores[i], i))
+        return [batch.ids[i] for i in order]
+
+    def rank(self, batch: ThreadBatch, now: Optional[int] = None) -> List[str]:
+        """完整排序的 thread_id"""
+        return self.top_k(batch, len(batch), now)
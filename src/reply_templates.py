@@ -0,0 +1,64 @@
+"""
+預先編譯的回覆模板表
+每組 (語調風格, 回覆長度, 語言, 簽名) 只編譯一次「意圖 -> 完整回覆（含簽名）」的對照表並快取，
+產生草稿時只需判斷意圖再查表
+"""
+from typing import Any, Dict, Tuple
+
+from .cache import LRUCache
+from .constants import DRAFTS, REPLY_LENGTH_STYLE, REPLY_STYLE_FALLBACK, REPLY_TEMPLATES
+from .keywords import INTENTS
+from .rules import get_rule_set
+
+DEFAULT_LANGUAGE = "zh-tw"
+
+_tables = LRUCache(DRAFTS["MAX_REPLY_TABLES"])
+
+
+def _style_chain(style: str, reply_length: str) -> Tuple[str, ...]:
+    chain = list(REPLY_STYLE_FALLBACK.get(style, REPLY_STYLE_FALLBACK["正式"]))
+    length_style = REPLY_LENGTH_STYLE.get(reply_length)
+    if length_style is not None:
+        chain.insert(0, length_style)
+    return tuple(chain)
+
+
+def compile_reply_table(style: str, reply_length: str, language: str, signature: str = "") -> Dict[str, str]:
+    """編譯單組語調設定的回覆表（意圖 -> 回覆）"""
+    templates = REPLY_TEMPLATES.get(language, REPLY_TEMPLATES[DEFAULT_LANGUAGE])
+    chain = _style_chain(style, reply_length)
+    suffix = f" {signature}" if signature and signature.strip() else ""
+
+    table = {}
+    for intent in INTENTS:
+        replies = templates[intent]
+        reply = next((replies[name] for name in chain if name in replies), None)
+        if reply is None:
+            reply = REPLY_TEMPLATES[DEFAULT_LANGUAGE][intent]["正式"]
+        table[intent] = reply + suffix
+    return table
+
+
+def get_reply_table(tone_profile: Dict[str, Any]) -> Dict[str, str]:
+    """取得語調設定對應的回覆表（快取）"""
+    key = (
+        tone_profile.get('style', '正式'),
+        tone_profile.get('reply_length', '簡短'),
+        tone_profile.get('language', DEFAULT_LANGUAGE),
+        tone_profile.get('signature', '') or "",
+    )
+    table = _tables.get(key)
+    if table is None:
+        table = compile_reply_table(*key)
+        _tables.put(key, table)
+    return table
+
+
+def draft_reply(text: str, tone_profile: Dict[str, Any]) -> str:
+    """依訊息意圖查表產生回覆（含簽名）"""
+    return get_reply_table(tone_profile)[get_rule_set().matcher.intent(text)]
+
+
+def reply_table_stats() -> Dict[str, Any]:
+    """回覆表快取統計"""
+    return _tables.stats()
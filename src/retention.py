@@ -0,0 +1,155 @@
+"""
+處理歷史的保留與壓縮
+- 超過保留天數的原始紀錄降採樣為每日彙總，原始內容移入 gzip 封存檔
+- 重複的請求內容（語調設定檔）只存一份，紀錄中以雜湊參照
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def payload_hash(payload: Dict[str, Any]) -> str:
+    """計算請求內容的穩定雜湊"""
+    canonical = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()[:16]
+
+
+def intern_request(history: Dict[str, Any], request: Dict[str, Any]) -> Dict[str, Any]:
+    """將請求中的 tone_profile 移到共用表，回傳改以參照表示的請求"""
+    if "tone_profile" not in request:
+        return request
+    tone_profile = request["tone_profile"]
+    ref = payload_hash(tone_profile)
+    history.setdefault("request_payloads", {})[ref] = tone_profile
+    interned = {key: value for key, value in request.items() if key != "tone_profile"}
+    interned["tone_profile_ref"] = ref
+    return interned
+
+
+def resolve_request(history: Dict[str, Any], request: Dict[str, Any]) -> Dict[str, Any]:
+    """還原以參照表示的請求"""
+    ref = request.get("tone_profile_ref")
+    if ref is None:
+        return request
+    resolved = {key: value for key, value in request.items() if key != "tone_profile_ref"}
+    resolved["tone_profile"] = history.get("request_payloads", {}).get(ref, {})
+    return resolved
+
+
+def add_to_daily(daily: Dict[str, Dict[str, Any]], log: Dict[str, Any]):
+    """將單筆紀錄累加到每日彙總（重新處理的紀錄只累加 reprocessed，不重複計入處理數）"""
+    day = str(log.get("timestamp", ""))[:10] or "unknown"
+    bucket = daily.setdefault(day, {"count": 0, "categories": {}, "total_execution_time": 0})
+    if log.get("reprocess"):
+        bucket["reprocessed"] = bucket.get("reprocessed", 0) + 1
+        return
+    category = log.get("final_response", {}).get("category", "未知")
+    bucket["count"] += 1
+    bucket["categories"][category] = bucket["categories"].get(category, 0) + 1
+    bucket["total_execution_time"] += log.get("total_execution_time", 0)
+
+
+def _parse_timestamp(value: Any) -> Optional[datetime]:
+    try:
+        dt = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return dt.replace(tzinfo=None) if dt.tzinfo else dt
+
+
+def _archive_entries(archive_dir: str, entries: List[Dict[str, Any]],
+                     history: Dict[str, Any]) -> List[str]:
+    """依月份將原始紀錄追加到 gzip 封存檔（每次追加為一個 gzip member）"""
+    os.makedirs(archive_dir, exist_ok=True)
+    by_month: Dict[str, List[str]] = {}
+    for entry in entries:
+        month = str(entry.get("timestamp", ""))[:7] or "unknown"
+        record = dict(entry)
+        if isinstance(record.get("request"), dict):
+            record["request"] = resolve_request(history, record["request"])
+        by_month.setdefault(month, []).append(
+            json.dumps(record, ensure_ascii=False, separators=(",", ":"), default=str))
+
+    written = []
+    for month, lines in sorted(by_month.items()):
+        path = os.path.join(archive_dir, f"processing_history-{month}.jsonl.gz")
+        with gzip.open(path, "at", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        written.append(path)
+    return written
+
+
+def read_archive(path: str) -> List[Dict[str, Any]]:
+    """讀取封存檔中的原始紀錄"""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def compact_processing_history(history: Dict[str, Any], archive_dir: str,
+                               retain_days: int = 30, max_hot_logs: Optional[int] = None,
+                               now: Optional[datetime] = None) -> Dict[str, int]:
+    """
+    壓縮處理歷史（就地修改 history）
+
+    Args:
+        history: processing_history 資料
+        archive_dir: 封存檔目錄
+        retain_days: 原始紀錄保留天數
+        max_hot_logs: 保留的原始紀錄上限（超過時最舊的也會被封存）
+        now: 目前時間（預設為 datetime.now()）
+
+    Returns:
+        壓縮結果統計
+    """
+    cutoff = (now or datetime.now()) - timedelta(days=retain_days)
+    logs = history.get("logs", [])
+
+    hot, expired = [], []
+    for log in logs:
+        timestamp = _parse_timestamp(log.get("timestamp"))
+        (expired if timestamp is not None and timestamp < cutoff else hot).append(log)
+
+    if max_hot_logs is not None and len(hot) > max_hot_logs:
+        hot.sort(key=lambda log: str(log.get("timestamp", "")))
+        overflow = len(hot) - max_hot_logs
+        expired.extend(hot[:overflow])
+        hot = hot[overflow:]
+
+    daily = history.setdefault("daily", {})
+    for log in expired:
+        add_to_daily(daily, log)
+    archives = _archive_entries(archive_dir, expired, history) if expired else []
+
+    # 舊格式紀錄的請求改為參照，並清掉不再被引用的共用內容
+    interned = 0
+    for log in hot:
+        request = log.get("request")
+        if isinstance(request, dict) and "tone_profile" in request:
+            log["request"] = intern_request(history, request)
+            interned += 1
+    referenced = {log["request"].get("tone_profile_ref") for log in hot if isinstance(log.get("request"), dict)}
+    payloads = history.get("request_payloads", {})
+    for ref in [ref for ref in payloads if ref not in referenced]:
+        del payloads[ref]
+
+    history["logs"] = hot
+    known_archives = history.setdefault("archives", [])
+    for path in archives:
+        name = os.path.basename(path)
+        if name not in known_archives:
+            known_archives.append(name)
+
+    logger.info(f"處理歷史壓縮完成: 封存 {len(expired)} 筆，保留 {len(hot)} 筆")
+    return {
+        "archived": len(expired),
+        "retained": len(hot),
+        "interned_requests": interned,
+        "daily_buckets": len(daily),
+        "request_payloads": len(payloads)
+    }
@@ -0,0 +1,244 @@
+"""
+版本化、可熱重載的規則集
+分類、預設優先級、自動封存規則與關鍵字表由 JSON 規則檔載入，驗證後編譯為關鍵字比對器與封存查詢表；
+重載時先完整建立新規則集再一次替換參照，處理中的請求繼續使用開始時取得的規則集
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+from .archive import ArchiveTable
+from .constants import AUTO_ARCHIVE_RULES, CATEGORIES, DEFAULT_PRIORITY, PRIORITY_LEVELS
+from .keywords import CATEGORY_KEYWORDS, INTENT_KEYWORDS, KeywordMatcher, TAG_KEYWORDS
+
+logger = logging.getLogger(__name__)
+
+BUILTIN_VERSION = "builtin"
+# 以 API 更新封存規則後的版本格式: <規則檔版本>+archive.<封存規則雜湊>
+_ARCHIVE_VERSION_SEPARATOR = "+archive."
+
+
+class RuleSetError(ValueError):
+    """規則檔格式錯誤"""
+
+
+def _require(condition: bool, message: str):
+    if not condition:
+        raise RuleSetError(message)
+
+
+def _keyword_groups(value: Any, field: str) -> List[tuple]:
+    """驗證 {名稱: [關鍵字...]} 並轉為保留順序的 [(名稱, (關鍵字...))]"""
+    _require(isinstance(value, dict), f"{field} 必須是物件")
+    groups = []
+    for name, keywords in value.items():
+        _require(isinstance(keywords, list) and all(isinstance(k, str) and k for k in keywords),
+                 f"{field}.{name} 必須是非空字串陣列")
+        groups.append((name, tuple(keywords)))
+    return groups
+
+
+class RuleSet:
+    """驗證並編譯後的規則集（建立後不再修改）"""
+
+    def __init__(self, version: str, categories: List[str], default_category: str,
+                 default_priority: Dict[str, int], auto_archive_rules: Dict[str, Dict[str, Any]],
+                 category_keywords: List[tuple], tag_keywords: Dict[str, List[str]],
+                 intent_keywords: List[tuple] = INTENT_KEYWORDS):
+        self.version = version
+        self.categories = list(categories)
+        self.default_category = default_category
+        self.default_priority = dict(default_priority)
+        self.auto_archive_rules = {category: dict(rule) for category, rule in auto_archive_rules.items()}
+        self.matcher = KeywordMatcher(category_keywords, tag_keywords, intent_keywords)
+        self.archive_table = ArchiveTable(self.auto_archive_rules)
+
+    @classmethod
+    def builtin(cls) -> "RuleSet":
+        """由 constants / keywords 模組的內建值建立"""
+        return cls(
+            version=BUILTIN_VERSION,
+            categories=CATEGORIES,
+            default_category="朋友",
+            default_priority=DEFAULT_PRIORITY,
+            auto_archive_rules=AUTO_ARCHIVE_RULES,
+            category_keywords=CATEGORY_KEYWORDS,
+            tag_keywords=TAG_KEYWORDS,
+        )
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "RuleSet":
+        """
+        驗證規則檔內容並建立規則集，格式錯誤時拋出 RuleSetError
+
+        未提供的欄位（除 version 外）沿用內建值
+        """
+        _require(isinstance(data, dict), "規則檔必須是 JSON 物件")
+        version = data.get("version")
+        _require(isinstance(version, (str, int)) and str(version).strip() != "", "缺少 version")
+
+        categories = data.get("categories", CATEGORIES)
+        _require(isinstance(categories, list) and categories
+                 and all(isinstance(c, str) and c for c in categories)
+                 and len(set(categories)) == len(categories), "categories 必須是不重複的非空字串陣列")
+        known = set(categories)
+
+        default_category = data.get("default_category", "朋友")
+        _require(default_category in known, f"default_category 不在 categories 中: {default_category}")
+
+        default_priority = data.get("default_priority", DEFAULT_PRIORITY)
+        _require(isinstance(default_priority, dict), "default_priority 必須是物件")
+        for category, priority in default_priority.items():
+            _require(category in known, f"default_priority 含未知分類: {category}")
+            _require(not isinstance(priority, bool) and priority in PRIORITY_LEVELS,
+                     f"default_priority.{category} 必須是 1-5")
+
+        archive_rules = data.get("auto_archive_rules", AUTO_ARCHIVE_RULES)
+        _require(isinstance(archive_rules, dict), "auto_archive_rules 必須是物件")
+        for category, rule in archive_rules.items():
+            _require(category in known, f"auto_archive_rules 含未知分類: {category}")
+            _require(isinstance(rule, dict) and not isinstance(rule.get("priority_threshold"), bool)
+                     and rule.get("priority_threshold") in PRIORITY_LEVELS
+                     and isinstance(rule.get("enabled", True), bool),
+                     f"auto_archive_rules.{category} 需要 1-5 的 priority_threshold 與布林 enabled")
+
+        if "category_keywords" in data:
+            category_keywords = _keyword_groups(data["category_keywords"], "category_keywords")
+        else:
+            category_keywords = CATEGORY_KEYWORDS
+        for category, _ in category_keywords:
+            _require(category in known, f"category_keywords 含未知分類: {category}")
+
+        if "tag_keywords" in data:
+            tag_keywords = dict(_keyword_groups(data["tag_keywords"], "tag_keywords"))
+        else:
+            tag_keywords = TAG_KEYWORDS
+
+        if "intent_keywords" in data:
+            intent_keywords = _keyword_groups(data["intent_keywords"], "intent_keywords")
+            _require([intent for intent, _ in intent_keywords] == [intent for intent, _ in INTENT_KEYWORDS],
+                     f"intent_keywords 必須依序包含 {', '.join(intent for intent, _ in INTENT_KEYWORDS)}")
+        else:
+            intent_keywords = INTENT_KEYWORDS
+
+        return cls(
+            version=str(version),
+            categories=categories,
+            default_category=default_category,
+            default_priority=default_priority,
+            auto_archive_rules={category: {"priority_threshold": rule["priority_threshold"],
+                                           "enabled": rule.get("enabled", True)}
+                                for category, rule in archive_rules.items()},
+            category_keywords=category_keywords,
+            tag_keywords=tag_keywords,
+            intent_keywords=intent_keywords,
+        )
+
+    def info(self) -> Dict[str, Any]:
+        """規則集摘要（API 用）"""
+        return {
+            "version": self.version,
+            "categories": self.categories,
+            "default_category": self.default_category,
+            "default_priority": self.default_priority,
+            "auto_archive_rules": self.auto_archive_rules,
+            "category_keyword_count": sum(len(group) for _, group in self.matcher.category_keywords),
+            "tag_keyword_count": len(self.matcher.tag_keywords),
+        }
+
+
+def load_rule_set(path: str) -> RuleSet:
+    """讀取並驗證規則檔"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except json.JSONDecodeError as e:
+        raise RuleSetError(f"規則檔不是有效的 JSON: {e}") from e
+    return RuleSet.from_dict(data)
+
+
+# 目前生效的規則集；替換只是一次參照賦值，讀取端不需加鎖
+_active: RuleSet = RuleSet.builtin()
+_reload_lock = threading.Lock()
+# 單一請求固定使用的規則集（見 pinned_rule_set）
+_pinned: ContextVar[Optional[RuleSet]] = ContextVar("pinned_rule_set", default=None)
+
+
+def get_rule_set() -> RuleSet:
+    """取得規則集（請求中已固定時回傳固定的版本）"""
+    pinned = _pinned.get()
+    return pinned if pinned is not None else _active
+
+
+def set_rule_set(rule_set: RuleSet):
+    """替換目前生效的規則集"""
+    global _active
+    _active = rule_set
+
+
+@contextmanager
+def pinned_rule_set() -> Iterator[RuleSet]:
+    """在區塊內固定使用同一版規則集，避免單一請求途中遇到重載而混用兩個版本"""
+    token = _pinned.set(get_rule_set())
+    try:
+        yield _pinned.get()
+    finally:
+        _pinned.reset(token)
+
+
+def reload_rules(path: str) -> RuleSet:
+    """
+    重新載入規則檔並替換
+
+    驗證失敗時拋出 RuleSetError（或 OSError），目前的規則集保持不變
+    """
+    with _reload_lock:
+        rule_set = load_rule_set(path)
+        previous = _active.version
+        set_rule_set(rule_set)
+    logger.info(f"規則集已更新: {previous} → {rule_set.version}")
+    return rule_set
+
+
+def update_archive_rules(path: str, archive_rules: Dict[str, Dict[str, Any]]) -> RuleSet:
+    """
+    以新的自動封存規則更新規則檔並替換目前的規則集
+
+    規則檔其他欄位保持不變（檔案不存在時以內建值建立），版本加上封存規則的雜湊，
+    讓依賴舊規則版本的處理結果能被判斷為過期；驗證失敗時拋出 RuleSetError，規則檔與規則集都不變
+    """
+    with _reload_lock:
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                try:
+                    data = json.load(f)
+                except json.JSONDecodeError as e:
+                    raise RuleSetError(f"規則檔不是有效的 JSON: {e}") from e
+            _require(isinstance(data, dict), "規則檔必須是 JSON 物件")
+        else:
+            data = {"version": BUILTIN_VERSION}
+        payload = json.dumps(archive_rules, ensure_ascii=False, sort_keys=True)
+        digest = hashlib.blake2b(payload.encode("utf-8"), digest_size=4).hexdigest()
+        base_version = str(data.get("version", BUILTIN_VERSION)).split(_ARCHIVE_VERSION_SEPARATOR, 1)[0]
+        data = {**data, "version": f"{base_version}{_ARCHIVE_VERSION_SEPARATOR}{digest}",
+                "auto_archive_rules": archive_rules}
+        rule_set = RuleSet.from_dict(data)
+
+        # 先寫入暫存檔再替換，避免寫到一半時重載讀到不完整的規則檔
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+        previous = _active.version
+        set_rule_set(rule_set)
+    logger.info(f"封存規則已更新: {previous} → {rule_set.version}")
+    return rule_set
@@ -30,6 +30,14 @@ class OrganizeResponse(BaseModel):
     priority: int = Field(..., ge=1, le=5, description="優先級 (1-5)")
     should_archive: bool = Field(..., description="是否應該封存")
     draft: Optional[str] = Field(None, description="回覆草稿")
+    draft_token: Optional[str] = Field(None, description="延後產生草稿時，以此 token 呼叫 POST /drafts/{token}")
+    rule_version: Optional[str] = Field(None, description="處理時使用的規則集版本")
+
+
+class ArchiveRule(BaseModel):
+    """單一分類的自動封存規則"""
+    priority_threshold: int = Field(..., ge=1, le=5, description="優先級數字大於等於此值時封存")
+    enabled: bool = Field(True, description="是否啟用")
 
 
 class PromptData(BaseModel):
@@ -87,6 +95,7 @@ class AgentExecutionLog(BaseModel):
     final_response: OrganizeResponse = Field(..., description="最終回應")
     total_execution_time: float = Field(..., description="總執行時間")
     token_usage: Dict[str, int] = Field(..., description="Token 使用量")
+    rule_version: Optional[str] = Field(None, description="使用的規則集版本")
     timestamp: datetime = Field(..., description="執行時間戳")
 
 
@@ -0,0 +1,159 @@
+"""
+訊息全文檢索的增量反向索引
+中日韓文字切成字元 bigram（另為每個字建立 unigram，供單字查詢），拉丁文字與數字以單字為單位（轉小寫），
+posting list 以列號差值的 varint 編碼壓縮儲存
+"""
+import re
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .message_store import MessageStore
+
+# 中日韓表意文字、日文假名、韓文字母連續區段
+_CJK_RUN = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]+")
+_LATIN_WORD = re.compile(r"[0-9a-z]+")
+
+
+def tokenize(text: str) -> Set[str]:
+    """將文字切成索引詞彙（CJK bigram + 拉丁單字）"""
+    tokens = set(_LATIN_WORD.findall(text.lower()))
+    for run in _CJK_RUN.findall(text):
+        if len(run) == 1:
+            tokens.add(run)
+        else:
+            tokens.update(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def index_tokens(text: str) -> Set[str]:
+    """建立索引用的詞彙：查詢詞彙之外再加上每個中日韓字元（單字查詢需要所有含該字的訊息）"""
+    tokens = tokenize(text)
+    for run in _CJK_RUN.findall(text):
+        tokens.update(run)
+    return tokens
+
+
+def _encode_varint(value: int, out: bytearray):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _decode_postings(data: bytearray) -> List[int]:
+    rows = []
+    current = 0
+    value = 0
+    shift = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        current += value
+        rows.append(current)
+        value = 0
+        shift = 0
+    return rows
+
+
+class _Posting:
+    """單一詞彙的壓縮 posting list"""
+
+    __slots__ = ("data", "last_row", "count")
+
+    def __init__(self):
+        self.data = bytearray()
+        self.last_row = 0
+        self.count = 0
+
+    def add(self, row: int):
+        # 列號只會遞增，差值從第一筆的 row 本身開始
+        _encode_varint(row - self.last_row if self.count else row, self.data)
+        self.last_row = row
+        self.count += 1
+
+
+class MessageSearchIndex:
+    """訊息反向索引（以 MessageStore 的列號為文件編號）"""
+
+    def __init__(self):
+        self._postings: Dict[str, _Posting] = {}
+        self._last_row = -1
+
+    @classmethod
+    def from_store(cls, store: MessageStore) -> "MessageSearchIndex":
+        """為既有訊息建立索引"""
+        index = cls()
+        for row in range(len(store)):
+            index.add(row, store.text_at(row))
+        return index
+
+    @property
+    def term_count(self) -> int:
+        """詞彙數量"""
+        return len(self._postings)
+
+    def add(self, row: int, text: str):
+        """加入一則訊息（列號必須遞增）"""
+        if row <= self._last_row:
+            raise ValueError(f"索引列號必須遞增: {row} <= {self._last_row}")
+        self._last_row = row
+        for token in index_tokens(text):
+            posting = self._postings.get(token)
+            if posting is None:
+                posting = self._postings[token] = _Posting()
+            posting.add(row)
+
+    def _match_rows(self, tokens: Iterable[str]) -> List[int]:
+        """AND 查詢，回傳遞增列號"""
+        postings = []
+        for token in tokens:
+            posting = self._postings.get(token)
+            if posting is None:
+                return []
+            postings.append(posting)
+        # 從最短的 posting list 開始交集
+        postings.sort(key=lambda posting: posting.count)
+        result: Optional[Set[int]] = None
+        for posting in postings:
+            rows = _decode_postings(posting.data)
+            if result is None:
+                result = set(rows)
+            else:
+                result.intersection_update(rows)
+            if not result:
+                return []
+        return sorted(result or ())
+
+    def search(self, query: str, store: MessageStore, category: Optional[str] = None,
+               sender_id: Optional[str] = None, offset: int = 0,
+               limit: int = 20) -> Tuple[int, List[int]]:
+        """
+        搜尋訊息
+
+        Args:
+            query: 查詢字串（所有詞彙都必須出現）
+            store: 訊息儲存（用於分類與發送者過濾）
+            category: 只保留處理結果為此分類的訊息
+            sender_id: 只保留此發送者的訊息
+            offset: 分頁起點
+            limit: 每頁筆數
+
+        Returns:
+            (符合總數, 本頁列號，新訊息在前)
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return 0, []
+
+        matched = []
+        for row in reversed(self._match_rows(tokens)):
+            if sender_id is not None and store.sender_at(row)[0] != sender_id:
+                continue
+            if category is not None:
+                result = store.result_at(row)
+                if not result or result.get("category") != category:
+                    continue
+            matched.append(row)
+
+        return len(matched), matched[offset:offset + limit]
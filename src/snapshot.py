@@ -0,0 +1,222 @@
+"""
+訊息儲存的二進位快照與寫入日誌（journal）
+快照: 版本化檔頭 + 長度前綴區段，欄位陣列直接以原生位元組寫入，啟動時免逐筆解析 JSON
+日誌: 兩次快照之間的異動，以長度前綴的緊湊紀錄追加寫入
+"""
+import json
+import logging
+import os
+import struct
+from array import array
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from .message_store import MessageStore
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_MAGIC = b"AILSNAP\x00"
+SNAPSHOT_VERSION = 1
+JOURNAL_MAGIC = b"AILJRNL\x00"
+JOURNAL_VERSION = 1
+
+# 檔頭: 版本, 旗標, 訊息數, 來源 JSON 的 (mtime_ns, size)
+_HEADER = struct.Struct("<HHQqq")
+_SECTION = struct.Struct("<Q")
+_RECORD = struct.Struct("<BI")
+JOURNAL_HEADER_SIZE = len(JOURNAL_MAGIC) + struct.calcsize("<Hqq")
+
+# 旗標：訊息內容以 \x00 分隔（內容本身不含 \x00 時使用，載入時只需一次 split）
+FLAG_NUL_SEPARATED_TEXT = 0x1
+
+# 日誌操作代碼
+JOURNAL_ADD = 1
+JOURNAL_PROCESSED = 2
+
+# 來源 JSON 指紋 (mtime_ns, size)，用來判斷快照是否仍對應目前的 JSON
+Fingerprint = Tuple[int, int]
+
+
+class SnapshotError(ValueError):
+    """快照或日誌格式錯誤"""
+
+
+def file_fingerprint(path: str) -> Optional[Fingerprint]:
+    """取得檔案指紋，檔案不存在時回傳 None"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _dump_sparse(sparse: Dict[str, Dict[int, Any]]) -> bytes:
+    return json.dumps(sparse, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
+
+def _load_sparse(blob: bytes) -> Dict[str, Dict[int, Any]]:
+    # JSON 物件鍵一律為字串，需轉回列號
+    return {name: {int(row): value for row, value in values.items()}
+            for name, values in json.loads(blob.decode("utf-8")).items()}
+
+
+def _unpack(fmt: struct.Struct, data: bytes, offset: int, path: str) -> tuple:
+    """讀取固定長度欄位，檔案長度不足時拋出 SnapshotError"""
+    if offset + fmt.size > len(data):
+        raise SnapshotError(f"快照檔已截斷: {path}")
+    return fmt.unpack_from(data, offset)
+
+
+def write_snapshot(path: str, store: MessageStore, source: Fingerprint):
+    """將訊息儲存寫成二進位快照（先寫暫存檔再原子替換）"""
+    columns = store.dump_columns()
+    texts = columns["texts"]
+    joined = "\x00".join(texts)
+    flags = 0
+    if joined.count("\x00") == max(len(texts) - 1, 0):
+        flags |= FLAG_NUL_SEPARATED_TEXT
+        text_section = joined.encode("utf-8")
+        offsets_section = b""
+    else:
+        encoded = [text.encode("utf-8") for text in texts]
+        offsets = array("Q", [0])
+        for item in encoded:
+            offsets.append(offsets[-1] + len(item))
+        text_section = b"".join(encoded)
+        offsets_section = offsets.tobytes()
+
+    sections = [
+        columns["ids"].tobytes(),
+        columns["timestamps"].tobytes(),
+        columns["sender_idx"].tobytes(),
+        bytes(columns["processed"]),
+        json.dumps(columns["senders"], ensure_ascii=False, separators=(",", ":")).encode("utf-8"),
+        offsets_section,
+        text_section,
+        _dump_sparse(columns["sparse"]),
+    ]
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(SNAPSHOT_MAGIC)
+        f.write(_HEADER.pack(SNAPSHOT_VERSION, flags, len(store), source[0], source[1]))
+        for section in sections:
+            f.write(_SECTION.pack(len(section)))
+            f.write(section)
+    os.replace(tmp_path, path)
+
+
+def read_snapshot(path: str) -> Tuple[MessageStore, Fingerprint]:
+    """讀取二進位快照，回傳 (訊息儲存, 來源 JSON 指紋)"""
+    with open(path, "rb") as f:
+        data = f.read()
+
+    if data[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+        raise SnapshotError(f"不是有效的快照檔: {path}")
+    offset = len(SNAPSHOT_MAGIC)
+    version, flags, count, mtime_ns, size = _unpack(_HEADER, data, offset, path)
+    if version != SNAPSHOT_VERSION:
+        raise SnapshotError(f"不支援的快照版本: {version}")
+    offset += _HEADER.size
+
+    view = memoryview(data)
+    sections = []
+    for _ in range(8):
+        (length,) = _unpack(_SECTION, data, offset, path)
+        offset += _SECTION.size
+        if offset + length > len(data):
+            raise SnapshotError(f"快照檔已截斷: {path}")
+        sections.append(view[offset:offset + length])
+        offset += length
+    try:
+        return _decode_sections(sections, flags, count, path), (mtime_ns, size)
+    except SnapshotError:
+        raise
+    except (ValueError, TypeError, IndexError) as e:
+        # 區段長度不是元素大小的倍數、UTF-8 / JSON 損毀等（長度前綴正確但內容損毀）
+        raise SnapshotError(f"快照內容損毀: {path}: {e}") from e
+
+
+def _decode_sections(sections: list, flags: int, count: int, path: str) -> MessageStore:
+    """將快照區段還原為訊息儲存"""
+    ids_raw, ts_raw, sender_raw, processed_raw, senders_raw, offsets_raw, text_raw, sparse_raw = sections
+
+    ids = array("q")
+    ids.frombytes(ids_raw)
+    timestamps = array("q")
+    timestamps.frombytes(ts_raw)
+    sender_idx = array("I")
+    sender_idx.frombytes(sender_raw)
+    if not len(ids) == len(timestamps) == len(sender_idx) == count:
+        raise SnapshotError(f"快照欄位長度不一致: {path}")
+
+    if flags & FLAG_NUL_SEPARATED_TEXT:
+        texts = str(text_raw, "utf-8").split("\x00") if count else []
+    else:
+        offsets = array("Q")
+        offsets.frombytes(offsets_raw)
+        texts = [str(text_raw[offsets[i]:offsets[i + 1]], "utf-8") for i in range(count)]
+
+    return MessageStore.from_columns(
+        ids=ids,
+        timestamps=timestamps,
+        sender_idx=sender_idx,
+        processed=bytearray(processed_raw),
+        texts=texts,
+        senders=[tuple(pair) for pair in json.loads(str(senders_raw, "utf-8"))],
+        sparse=_load_sparse(bytes(sparse_raw)),
+    )
+
+
+def reset_journal(path: str, source: Fingerprint):
+    """建立新的空日誌（記錄其對應的 JSON 指紋）"""
+    with open(path, "wb") as f:
+        f.write(JOURNAL_MAGIC)
+        f.write(struct.pack("<Hqq", JOURNAL_VERSION, source[0], source[1]))
+
+
+def append_journal(path: str, op: int, payload: Dict[str, Any]):
+    """追加一筆日誌紀錄"""
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+    with open(path, "ab") as f:
+        f.write(_RECORD.pack(op, len(body)))
+        f.write(body)
+
+
+def read_journal(path: str) -> Tuple[Optional[Fingerprint], Iterator[Tuple[int, Dict[str, Any]]]]:
+    """
+    讀取日誌，回傳 (對應的 JSON 指紋, 紀錄迭代器)
+
+    結尾不完整的紀錄會被忽略；遇到內容損毀的紀錄時停止重播（之後的紀錄無法確定是否可信）
+    """
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None, iter(())
+
+    header_size = JOURNAL_HEADER_SIZE
+    if len(data) < header_size or data[:len(JOURNAL_MAGIC)] != JOURNAL_MAGIC:
+        return None, iter(())
+    version, mtime_ns, size = struct.unpack_from("<Hqq", data, len(JOURNAL_MAGIC))
+    if version != JOURNAL_VERSION:
+        return None, iter(())
+
+    def records():
+        offset = header_size
+        while offset + _RECORD.size <= len(data):
+            op, length = _RECORD.unpack_from(data, offset)
+            offset += _RECORD.size
+            if offset + length > len(data):
+                break
+            try:
+                payload = json.loads(data[offset:offset + length].decode("utf-8"))
+            except (UnicodeDecodeError, json.JSONDecodeError) as e:
+                logger.error(f"日誌 {path} 於位置 {offset - _RECORD.size} 的紀錄損毀，停止重播: {e}")
+                break
+            if not isinstance(payload, dict):
+                logger.error(f"日誌 {path} 於位置 {offset - _RECORD.size} 的紀錄格式錯誤，停止重播")
+                break
+            yield op, payload
+            offset += length
+
+    return (mtime_ns, size), records()
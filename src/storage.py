@@ -0,0 +1,273 @@
+"""
+統一儲存介面
+訊息、聯絡人優先級、Prompt 與執行日誌共用同一組方法，
+可依部署環境選擇記憶體、SQLite 或 PostgreSQL 實作
+"""
+import itertools
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from .message_store import MessageStore
+
+# create_storage 使用的記憶體後端網址
+MEMORY_URL = "memory://"
+# Demo JSON 檔案後端網址前綴（json://資料目錄）
+JSON_URL_PREFIX = "json://"
+
+
+class StorageBackend(ABC):
+    """儲存後端介面（同步）"""
+
+    # Prompt
+    @abstractmethod
+    def get_active_prompt(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """獲取用戶活躍的 Prompt"""
+
+    @abstractmethod
+    def save_user_prompt(self, user_id: str, name: str, content: str) -> bool:
+        """儲存用戶 Prompt（同名則覆寫內容）"""
+
+    @abstractmethod
+    def activate_prompt(self, user_id: str, prompt_id: int) -> bool:
+        """啟用特定 Prompt"""
+
+    @abstractmethod
+    def get_user_prompts(self, user_id: str) -> List[Dict[str, Any]]:
+        """獲取用戶所有 Prompt（新的在前）"""
+
+    @abstractmethod
+    def delete_prompt(self, user_id: str, prompt_id: int) -> bool:
+        """刪除 Prompt"""
+
+    # 聯絡人
+    @abstractmethod
+    def get_contact_priority(self, user_id: str, sender_id: str) -> Dict[str, Any]:
+        """獲取聯絡人優先級設定"""
+
+    @abstractmethod
+    def get_contact_priorities(self, user_id: str, sender_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """批次獲取多位聯絡人的優先級設定（未設定者填入預設值）"""
+
+    @abstractmethod
+    def set_contact_priority(self, user_id: str, sender_id: str,
+                             priority_boost: int, is_starred: bool) -> bool:
+        """設定聯絡人優先級"""
+
+    # 執行日誌
+    @abstractmethod
+    def log_agent_execution(self, log_data: Dict[str, Any]) -> bool:
+        """記錄 Agent 執行日誌"""
+
+    @abstractmethod
+    def get_execution_stats(self, user_id: str, days: int = 30,
+                            start: Optional[datetime] = None,
+                            end: Optional[datetime] = None) -> Dict[str, Any]:
+        """獲取執行統計"""
+
+    # 訊息
+    @abstractmethod
+    def add_message(self, text: str, sender_id: str, sender_name: str) -> int:
+        """新增訊息，回傳訊息 ID"""
+
+    @abstractmethod
+    def get_message(self, message_id: int) -> Optional[Dict[str, Any]]:
+        """根據 ID 取得訊息"""
+
+    @abstractmethod
+    def list_messages(self, cursor: Optional[int] = None, limit: int = 50,
+                      unprocessed_only: bool = False, fields: Optional[List[str]] = None,
+                      exclude: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        以訊息 ID 游標分頁列出訊息，回傳 {"messages", "next_cursor"}
+
+        fields 只保留指定欄位、exclude 去除指定欄位（見 message_store.project_message）
+        """
+
+    @abstractmethod
+    def mark_message_processed(self, message_id: int, result: Dict[str, Any]) -> bool:
+        """標記訊息為已處理，找不到訊息時回傳 False"""
+
+    @abstractmethod
+    def count_messages(self) -> Dict[str, int]:
+        """訊息計數 {"total_messages", "unprocessed_count"}"""
+
+    def close(self):
+        """釋放資源（預設不需處理）"""
+
+
+class InMemoryStorage(StorageBackend):
+    """
+    記憶體儲存（基準測試與單元測試用，不做任何 I/O）
+
+    訊息沿用 MessageStore 欄式儲存，其餘資料放在 dict / list 中
+    """
+
+    def __init__(self):
+        self.messages = MessageStore()
+        self._prompts: Dict[str, List[Dict[str, Any]]] = {}
+        self._prompt_ids = itertools.count(1)
+        self._contacts: Dict[Tuple[str, str], Tuple[int, bool]] = {}
+        # (user_id, timestamp, total_execution_time, total_tokens)
+        self._logs: List[Tuple[str, datetime, float, int]] = []
+        self._lock = threading.Lock()
+
+    # Prompt
+    def get_active_prompt(self, user_id: str) -> Optional[Dict[str, Any]]:
+        for prompt in self._prompts.get(user_id, []):
+            if prompt["is_active"]:
+                return {key: prompt[key] for key in ("id", "name", "content", "created_at", "updated_at")}
+        return None
+
+    def save_user_prompt(self, user_id: str, name: str, content: str) -> bool:
+        now = datetime.now()
+        with self._lock:
+            prompts = self._prompts.setdefault(user_id, [])
+            for prompt in prompts:
+                if prompt["name"] == name:
+                    prompt.update(content=content, updated_at=now)
+                    return True
+            prompts.append({
+                "id": next(self._prompt_ids),
+                "user_id": user_id,
+                "name": name,
+                "content": content,
+                "is_active": False,
+                "created_at": now,
+                "updated_at": now,
+            })
+        return True
+
+    def activate_prompt(self, user_id: str, prompt_id: int) -> bool:
+        with self._lock:
+            prompts = self._prompts.get(user_id, [])
+            if not any(prompt["id"] == prompt_id for prompt in prompts):
+                return False
+            for prompt in prompts:
+                prompt["is_active"] = prompt["id"] == prompt_id
+                if prompt["is_active"]:
+                    prompt["updated_at"] = datetime.now()
+        return True
+
+    def get_user_prompts(self, user_id: str) -> List[Dict[str, Any]]:
+        prompts = sorted(self._prompts.get(user_id, []), key=lambda p: p["created_at"], reverse=True)
+        return [dict(prompt) for prompt in prompts]
+
+    def delete_prompt(self, user_id: str, prompt_id: int) -> bool:
+        with self._lock:
+            prompts = self._prompts.get(user_id, [])
+            remaining = [prompt for prompt in prompts if prompt["id"] != prompt_id]
+            self._prompts[user_id] = remaining
+            return len(remaining) != len(prompts)
+
+    # 聯絡人
+    def get_contact_priority(self, user_id: str, sender_id: str) -> Dict[str, Any]:
+        priority_boost, is_starred = self._contacts.get((user_id, sender_id), (0, False))
+        return {"priority_boost": priority_boost, "is_starred": is_starred}
+
+    def get_contact_priorities(self, user_id: str, sender_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        return {sender_id: self.get_contact_priority(user_id, sender_id)
+                for sender_id in dict.fromkeys(sender_ids)}
+
+    def set_contact_priority(self, user_id: str, sender_id: str,
+                             priority_boost: int, is_starred: bool) -> bool:
+        self._contacts[(user_id, sender_id)] = (priority_boost, bool(is_starred))
+        return True
+
+    # 執行日誌
+    def log_agent_execution(self, log_data: Dict[str, Any]) -> bool:
+        total_tokens = int((log_data.get("token_usage") or {}).get("total_tokens", 0) or 0)
+        with self._lock:
+            self._logs.append((log_data["user_id"], datetime.now(),
+                               log_data["total_execution_time"], total_tokens))
+        return True
+
+    def get_execution_stats(self, user_id: str, days: int = 30,
+                            start: Optional[datetime] = None,
+                            end: Optional[datetime] = None) -> Dict[str, Any]:
+        end = end or datetime.now()
+        start = start or end - timedelta(days=days)
+        matched = [(elapsed, tokens) for log_user, timestamp, elapsed, tokens in self._logs
+                   if log_user == user_id and start <= timestamp < end]
+        if not matched:
+            return {"total_executions": 0, "avg_execution_time": 0, "total_tokens": 0}
+        return {
+            "total_executions": len(matched),
+            "avg_execution_time": sum(elapsed for elapsed, _ in matched) / len(matched),
+            "total_tokens": sum(tokens for _, tokens in matched)
+        }
+
+    # 訊息
+    def add_message(self, text: str, sender_id: str, sender_name: str) -> int:
+        with self._lock:
+            new_id = self.messages.max_id + 1
+            self.messages.append({
+                "id": new_id,
+                "text": text,
+                "sender_id": sender_id,
+                "sender_name": sender_name,
+                "timestamp": datetime.now().isoformat(),
+                "processed": False
+            })
+        return new_id
+
+    def get_message(self, message_id: int) -> Optional[Dict[str, Any]]:
+        return self.messages.get(message_id)
+
+    def list_messages(self, cursor: Optional[int] = None, limit: int = 50,
+                      unprocessed_only: bool = False, fields: Optional[List[str]] = None,
+                      exclude: Optional[List[str]] = None) -> Dict[str, Any]:
+        rows, next_cursor = self.messages.page(cursor, limit, unprocessed_only)
+        return {
+            "messages": [self.messages.get_projected(row, fields, exclude) for row in rows],
+            "next_cursor": next_cursor
+        }
+
+    def mark_message_processed(self, message_id: int, result: Dict[str, Any]) -> bool:
+        with self._lock:
+            return self.messages.mark_processed(message_id, result, datetime.now().isoformat())
+
+    def count_messages(self) -> Dict[str, int]:
+        return {
+            "total_messages": len(self.messages),
+            "unprocessed_count": self.messages.unprocessed_count
+        }
+
+
+def create_storage(url: Optional[str] = None, **options) -> StorageBackend:
+    """
+    依網址建立儲存後端
+
+    - memory:// → InMemoryStorage
+    - json://目錄 → DemoStorage（Demo 用 JSON 檔案，未指定目錄時為 data）
+    - sqlite:///path、postgresql://... 或未指定（讀取 DATABASE_URL）→ SyncDatabaseManager
+    """
+    if url == MEMORY_URL:
+        return InMemoryStorage()
+    if url is not None and url.startswith(JSON_URL_PREFIX):
+        from .demo_storage import DemoStorage
+        return DemoStorage(url[len(JSON_URL_PREFIX):] or "data", **options)
+    # database 模組實作本介面，延後匯入避免循環相依
+    from .database import SyncDatabaseManager
+    return SyncDatabaseManager(url, **options)
+
+
+def create_storage_from_settings(settings) -> StorageBackend:
+    """
+    依系統設定（config.Settings）建立儲存後端
+
+    使用 STORAGE_URL，未設定時使用 DATABASE_URL；資料庫後端套用連接池設定
+    """
+    url = settings.storage_url or settings.database_url
+    if url == MEMORY_URL or url.startswith(JSON_URL_PREFIX):
+        return create_storage(url)
+    return create_storage(
+        url,
+        min_size=settings.db_pool_min_size,
+        max_size=settings.db_pool_max_size,
+        statement_cache_size=settings.db_statement_cache_size,
+        acquire_timeout=settings.db_acquire_timeout,
+        command_timeout=settings.db_command_timeout,
+        init_retry_interval=settings.db_init_retry_interval,
+    )
@@ -0,0 +1,158 @@
+"""
+對話串彙總
+依發送者將訊息分組，新增 / 處理訊息時增量更新每個對話串的彙總
+（最新訊息時間、未讀數、優先級範圍、分類分布），並同步維護優先收件匣，
+收件匣與排序都不需重新掃描訊息
+"""
+from typing import Any, Dict, List, Optional, Tuple
+
+from .inbox import PriorityInbox
+from .message_store import MessageStore, micros_to_timestamp
+
+# 尚無已處理訊息的對話串在收件匣中使用的優先級
+UNRANKED_PRIORITY = 3
+
+
+class Thread:
+    """單一對話串的彙總"""
+
+    __slots__ = ("thread_id", "sender_name", "message_ids", "last_message_at",
+                 "unread_count", "priority_counts", "category_counts")
+
+    def __init__(self, thread_id: str, sender_name: str):
+        self.thread_id = thread_id
+        self.sender_name = sender_name
+        self.message_ids: List[int] = []
+        self.last_message_at = 0
+        self.unread_count = 0
+        # 已處理訊息的優先級 / 分類計數（重新處理時可扣回舊值）
+        self.priority_counts: Dict[int, int] = {}
+        self.category_counts: Dict[str, int] = {}
+
+    @property
+    def min_priority(self) -> Optional[int]:
+        return min(self.priority_counts) if self.priority_counts else None
+
+    @property
+    def max_priority(self) -> Optional[int]:
+        return max(self.priority_counts) if self.priority_counts else None
+
+    @property
+    def priority(self) -> int:
+        """收件匣排序用的優先級（對話串中最重要的一則）"""
+        min_priority = self.min_priority
+        return min_priority if min_priority is not None else UNRANKED_PRIORITY
+
+    def to_dict(self) -> Dict[str, Any]:
+        """轉為 API / sort_tool 使用的格式"""
+        return {
+            "id": self.thread_id,
+            "sender_name": self.sender_name,
+            "priority": self.priority,
+            "min_priority": self.min_priority,
+            "max_priority": self.max_priority,
+            "last_message_at": micros_to_timestamp(self.last_message_at),
+            "unread_count": self.unread_count,
+            "message_count": len(self.message_ids),
+            "categories": dict(self.category_counts),
+        }
+
+
+def _count(counts: Dict[Any, int], key: Any, delta: int):
+    value = counts.get(key, 0) + delta
+    if value > 0:
+        counts[key] = value
+    else:
+        counts.pop(key, None)
+
+
+def _result_fields(result: Optional[Dict[str, Any]]) -> Tuple[Optional[int], Optional[str]]:
+    """處理結果中的 (priority, category)"""
+    if not isinstance(result, dict):
+        return None, None
+    priority = result.get("priority")
+    category = result.get("category")
+    return (priority if isinstance(priority, int) else None,
+            category if isinstance(category, str) else None)
+
+
+class ThreadIndex:
+    """以發送者為對話串的增量彙總索引"""
+
+    def __init__(self):
+        self._threads: Dict[str, Thread] = {}
+        self.inbox = PriorityInbox()
+
+    def __len__(self) -> int:
+        return len(self._threads)
+
+    @classmethod
+    def from_store(cls, store: MessageStore) -> "ThreadIndex":
+        """掃描一次訊息儲存建立索引"""
+        index = cls()
+        for row in store.iter_rows():
+            sender_id, sender_name = store.sender_at(row)
+            processed = store.is_processed(row)
+            index.add_message(store.id_at(row), sender_id, sender_name,
+                              store.timestamp_micros_at(row), processed=processed,
+                              result=store.result_at(row) if processed else None)
+        return index
+
+    def get(self, thread_id: str) -> Optional[Thread]:
+        return self._threads.get(thread_id)
+
+    def _reindex(self, thread: Thread):
+        self.inbox.upsert(thread.thread_id, thread.priority, thread.last_message_at, thread.unread_count)
+
+    def _apply_result(self, thread: Thread, result: Optional[Dict[str, Any]], delta: int):
+        priority, category = _result_fields(result)
+        if priority is not None:
+            _count(thread.priority_counts, priority, delta)
+        if category is not None:
+            _count(thread.category_counts, category, delta)
+
+    def add_message(self, message_id: int, thread_id: str, sender_name: str, timestamp: int,
+                    processed: bool = False, result: Optional[Dict[str, Any]] = None):
+        """
+        加入一則訊息
+
+        Args:
+            message_id: 訊息 ID
+            thread_id: 對話串 ID（sender_id）
+            sender_name: 發送者名稱（以最新訊息為準）
+            timestamp: 訊息時間（微秒）
+            processed: 是否已處理
+            result: 已處理訊息的處理結果
+        """
+        thread = self._threads.get(thread_id)
+        if thread is None:
+            thread = self._threads[thread_id] = Thread(thread_id, sender_name)
+        thread.message_ids.append(message_id)
+        if timestamp >= thread.last_message_at:
+            thread.last_message_at = timestamp
+            thread.sender_name = sender_name
+        if processed:
+            self._apply_result(thread, result, 1)
+        else:
+            thread.unread_count += 1
+        self._reindex(thread)
+
+    def mark_processed(self, thread_id: str, result: Dict[str, Any], was_processed: bool = False,
+                       previous_result: Optional[Dict[str, Any]] = None):
+        """
+        訊息處理完成（重新處理時傳入舊結果以扣回舊的優先級與分類）
+        """
+        thread = self._threads.get(thread_id)
+        if thread is None:
+            return
+        if was_processed:
+            self._apply_result(thread, previous_result, -1)
+        else:
+            thread.unread_count -= 1
+        self._apply_result(thread, result, 1)
+        self._reindex(thread)
+
+    def page(self, cursor: Optional[str] = None, limit: int = 50) -> Tuple[List[Thread], Optional[str]]:
+        """依收件匣順序分頁（cursor 為上一頁最後一個對話串 ID）"""
+        thread_ids, next_cursor = self.inbox.page(cursor, limit)
+        return [self._threads[thread_id] for thread_id in thread_ids], next_cursor
@@ -0,0 +1,89 @@
+"""
+Prompt token 數估算
+安裝 tiktoken 時使用實際的 BPE 編碼，否則依字元類型估算
+（中日韓文字約每字 1 token，拉丁單字約每 4 個字元 1 token，標點符號各 1 token）
+"""
+import logging
+import math
+import os
+import re
+from typing import Dict, List, Optional, Sequence
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# 供應商前綴快取的最小長度（低於此長度的前綴通常不會被快取）
+MIN_CACHEABLE_PREFIX_TOKENS = 1024
+
+_CJK_RANGES = "\u3000-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef"
+_CJK_CHAR = re.compile(f"[{_CJK_RANGES}]")
+_LATIN_WORD = re.compile(r"[A-Za-z0-9]+")
+_SYMBOL = re.compile(f"[^\\sA-Za-z0-9{_CJK_RANGES}]")
+
+# 載入失敗的標記（之後不再重試）
+_UNAVAILABLE = object()
+_encoding = None if tiktoken is not None else _UNAVAILABLE
+
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None:
+        try:
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            # 無法下載編碼表時改用估算，並記住失敗，避免每次估算都重新嘗試下載
+            logger.warning(f"載入 tiktoken 編碼表失敗，改用字元估算: {e}")
+            _encoding = _UNAVAILABLE
+    return None if _encoding is _UNAVAILABLE else _encoding
+
+
+def estimate_tokens(text: str) -> int:
+    """估算文字的 token 數"""
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return (len(_CJK_CHAR.findall(text))
+            + sum(math.ceil(len(word) / 4) for word in _LATIN_WORD.findall(text))
+            + len(_SYMBOL.findall(text)))
+
+
+def shared_prefix_tokens(texts: Sequence[str]) -> int:
+    """多段文字共同前綴的 token 數（可被供應商前綴快取重用的部分）"""
+    if not texts:
+        return 0
+    return estimate_tokens(os.path.commonprefix(list(texts)))
+
+
+def compare_layouts(renders: Dict[str, List[str]],
+                    min_cacheable: int = MIN_CACHEABLE_PREFIX_TOKENS) -> Dict[str, Dict[str, float]]:
+    """
+    比較不同 Prompt 版面的 token 數與可快取前綴
+
+    Args:
+        renders: 版面名稱 -> 同一批使用者渲染後的 Prompt
+        min_cacheable: 前綴達到此長度才會被供應商快取
+
+    Returns:
+        版面名稱 -> {avg_tokens, shared_prefix_tokens, cacheable_ratio, prefix_cacheable}
+    """
+    result = {}
+    for layout, texts in renders.items():
+        avg_tokens = sum(estimate_tokens(text) for text in texts) / len(texts) if texts else 0.0
+        prefix = shared_prefix_tokens(texts)
+        result[layout] = {
+            "avg_tokens": avg_tokens,
+            "shared_prefix_tokens": prefix,
+            "cacheable_ratio": prefix / avg_tokens if avg_tokens else 0.0,
+            "prefix_cacheable": prefix >= min_cacheable,
+        }
+    return result
+
+
+def tokenizer_name() -> Optional[str]:
+    """目前使用的編碼名稱（估算模式回傳 None）"""
+    encoding = _get_encoding()
+    return encoding.name if encoding is not None else None
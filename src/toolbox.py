@@ -3,7 +3,7 @@
 """
 import logging
 import time
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 try:
     from langchain_core.tools import tool
 except ImportError:
@@ -11,11 +11,31 @@ except ImportError:
     def tool(func):
         return func
 
-from .constants import CATEGORIES, DEFAULT_PRIORITY, AUTO_ARCHIVE_RULES
-from .database import SyncDatabaseManager as DatabaseManager
+from .constants import DEFAULT_USER_ID
+from .database import get_sync_database_manager
+from .inbox import inbox_key
+from .message_store import timestamp_to_micros
+from .ranking import RankingEngine, ThreadBatch
+from .reply_templates import draft_reply
+from .rules import get_rule_set
+from .storage import StorageBackend
 
 logger = logging.getLogger(__name__)
 
+# 工具共用的儲存後端（可由外部注入，預設為行程內共用的資料庫管理器）
+_db_manager: Optional[StorageBackend] = None
+
+
+def set_database_manager(db_manager: Optional[StorageBackend]):
+    """注入工具使用的儲存後端（傳入 None 則恢復使用共用實例）"""
+    global _db_manager
+    _db_manager = db_manager
+
+
+def get_database_manager() -> StorageBackend:
+    """取得工具使用的資料庫管理器"""
+    return _db_manager if _db_manager is not None else get_sync_database_manager()
+
 
 @tool
 def classify_tool(text: str) -> Dict[str, str]:
@@ -32,17 +52,9 @@ def classify_tool(text: str) -> Dict[str, str]:
     
     try:
         # 這裡可以用簡單規則或呼叫 LLM
-        # 目前使用關鍵字匹配作為示例
-        text_lower = text.lower()
-        
-        if any(keyword in text for keyword in ['會議', '工作', '專案', '客戶', '報告', '截止', '任務']):
-            category = "工作"
-        elif any(keyword in text for keyword in ['媽', '爸', '爸爸', '媽媽', '家人', '回家', '家裡']):
-            category = "家人"
-        elif any(keyword in text for keyword in ['促銷', '優惠', '購買', '限時', '特價', '廣告', '推廣']):
-            category = "廣告"
-        else:
-            category = "朋友"
+        # 目前使用規則集的關鍵字匹配作為示例（與標籤、草稿共用同一次關鍵字掃描）
+        rules = get_rule_set()
+        category = rules.matcher.category(text, rules.default_category)
         
         execution_time = time.time() - start_time
         logger.debug(f"classify_tool 執行完成，分類: {category}, 耗時: {execution_time:.3f}s")
@@ -54,14 +66,34 @@ def classify_tool(text: str) -> Dict[str, str]:
         return {"category": "朋友"}  # 預設分類
 
 
+def _compute_priority(category: str, contact_settings: Dict[str, Any]) -> int:
+    """依分類與聯絡人設定計算最終優先級 (1=最高, 5=最低)"""
+    # 基礎優先級
+    base_priority = get_rule_set().default_priority.get(category, 3)
+    
+    # 調整優先級
+    priority_boost = contact_settings.get('priority_boost', 0)
+    is_starred = contact_settings.get('is_starred', False)
+    
+    final_priority = base_priority + priority_boost
+    
+    # 星號聯絡人提升優先級
+    if is_starred:
+        final_priority = max(1, final_priority - 1)
+    
+    # 確保在有效範圍內
+    return max(1, min(5, final_priority))
+
+
 @tool
-def priority_tool(sender_id: str, category: str) -> Dict[str, int]:
+def priority_tool(sender_id: str, category: str, user_id: str = DEFAULT_USER_ID) -> Dict[str, int]:
     """
     根據發送者和分類設定優先級
     
     Args:
         sender_id: 發送者ID
         category: 訊息分類
+        user_id: 收件使用者ID（聯絡人設定屬於此使用者）
         
     Returns:
         包含優先級的字典 (1=最高, 5=最低)
@@ -70,24 +102,10 @@ def priority_tool(sender_id: str, category: str) -> Dict[str, int]:
     
     try:
         # 從資料庫獲取聯絡人設定
-        db = DatabaseManager()
-        contact_settings = db.get_contact_priority(sender_id, sender_id)
-        
-        # 基礎優先級
-        base_priority = DEFAULT_PRIORITY.get(category, 3)
-        
-        # 調整優先級
-        priority_boost = contact_settings.get('priority_boost', 0)
-        is_starred = contact_settings.get('is_starred', False)
-        
-        final_priority = base_priority + priority_boost
+        db = get_database_manager()
+        contact_settings = db.get_contact_priority(user_id, sender_id)
         
-        # 星號聯絡人提升優先級
-        if is_starred:
-            final_priority = max(1, final_priority - 1)
-        
-        # 確保在有效範圍內
-        final_priority = max(1, min(5, final_priority))
+        final_priority = _compute_priority(category, contact_settings)
         
         execution_time = time.time() - start_time
         logger.debug(f"priority_tool 執行完成，優先級: {final_priority}, 耗時: {execution_time:.3f}s")
@@ -99,6 +117,38 @@ def priority_tool(sender_id: str, category: str) -> Dict[str, int]:
         return {"priority": 3}  # 預設優先級
 
 
+@tool
+def batch_priority_tool(items: List[Dict[str, str]], user_id: str = DEFAULT_USER_ID) -> Dict[str, List[int]]:
+    """
+    批次計算多則訊息的優先級（聯絡人設定以單次批次查詢取得）
+    
+    Args:
+        items: 訊息列表，每項包含 sender_id 與 category
+        user_id: 收件使用者ID
+        
+    Returns:
+        包含優先級列表的字典，順序與輸入相同
+    """
+    start_time = time.time()
+    
+    try:
+        db = get_database_manager()
+        contact_map = db.get_contact_priorities(user_id, [item['sender_id'] for item in items])
+        priorities = [
+            _compute_priority(item['category'], contact_map[item['sender_id']])
+            for item in items
+        ]
+        
+        execution_time = time.time() - start_time
+        logger.debug(f"batch_priority_tool 執行完成，共 {len(priorities)} 則, 耗時: {execution_time:.3f}s")
+        
+        return {"priorities": priorities}
+        
+    except Exception as e:
+        logger.error(f"batch_priority_tool 執行失敗: {e}")
+        return {"priorities": [3] * len(items)}
+
+
 @tool
 def archive_tool(category: str, priority: int) -> Dict[str, bool]:
     """
@@ -114,13 +164,8 @@ def archive_tool(category: str, priority: int) -> Dict[str, bool]:
     start_time = time.time()
     
     try:
-        should_archive = False
-        
-        # 檢查自動封存規則
-        if category in AUTO_ARCHIVE_RULES:
-            rule = AUTO_ARCHIVE_RULES[category]
-            if rule['enabled'] and priority >= rule['priority_threshold']:
-                should_archive = True
+        # 查詢由規則集封存規則編譯的 分類 × 優先級 表
+        should_archive = get_rule_set().archive_table.should_archive(category, priority)
         
         execution_time = time.time() - start_time
         logger.debug(f"archive_tool 執行完成，封存決定: {should_archive}, 耗時: {execution_time:.3f}s")
@@ -147,43 +192,9 @@ def draft_reply_tool(text: str, tone_profile: Dict[str, Any]) -> Dict[str, str]:
     start_time = time.time()
     
     try:
-        # 簡單的規則式回覆生成（實際應用中會用 LLM）
-        text_lower = text.lower()
-        style = tone_profile.get('style', '正式')
-        signature = tone_profile.get('signature', '')
-        
-        draft = ""
-        
-        # 根據內容類型生成回覆
-        if '?' in text or '嗎' in text:
-            # 問句
-            if style == '極簡':
-                draft = "好"
-            elif style == '輕鬆':
-                draft = "可以啊！"
-            else:
-                draft = "好的，沒問題。"
-        elif any(keyword in text for keyword in ['謝謝', '感謝']):
-            # 感謝
-            if style == '極簡':
-                draft = "不客氣"
-            else:
-                draft = "不用客氣！"
-        elif any(keyword in text for keyword in ['會議', '開會']):
-            # 會議相關
-            draft = "收到，我會準時參加。"
-        else:
-            # 一般回覆
-            if style == '極簡':
-                draft = "收到"
-            elif style == '輕鬆':
-                draft = "了解！"
-            else:
-                draft = "好的，我知道了。"
-        
-        # 加上簽名
-        if signature and signature.strip():
-            draft += f" {signature}"
+        # 規則式回覆生成（實際應用中會用 LLM）：
+        # 判斷意圖後查詢依語調設定預先編譯的回覆表（已含簽名）
+        draft = draft_reply(text, tone_profile)
         
         execution_time = time.time() - start_time
         logger.debug(f"draft_reply_tool 執行完成，草稿長度: {len(draft)}, 耗時: {execution_time:.3f}s")
@@ -196,12 +207,16 @@ def draft_reply_tool(text: str, tone_profile: Dict[str, Any]) -> Dict[str, str]:
 
 
 @tool
-def sort_tool(threads: List[Dict[str, Any]]) -> Dict[str, List[str]]:
+def sort_tool(threads: List[Dict[str, Any]],
+              weights: Optional[Dict[str, float]] = None,
+              ranking_config: Optional[Dict[str, float]] = None) -> Dict[str, List[str]]:
     """
     對對話串進行多因子排序
     
     Args:
         threads: 對話串列表
+        weights: 加權排序的因子權重（見 RANKING_WEIGHTS），未提供時依優先級 > 時間戳 > 未讀數排序
+        ranking_config: 加權排序的因子參數（見 RANKING，只在提供 weights 時使用）
         
     Returns:
         包含排序後 thread_id 列表的字典
@@ -209,17 +224,24 @@ def sort_tool(threads: List[Dict[str, Any]]) -> Dict[str, List[str]]:
     start_time = time.time()
     
     try:
-        # 多因子排序：優先級 > 時間戳 > 未讀數
-        def sort_key(thread):
-            priority = thread.get('priority', 3)
-            timestamp = thread.get('last_message_at', '1970-01-01T00:00:00Z')
-            unread_count = thread.get('unread_count', 0)
-            
-            # 優先級越小越重要，時間戳越新越重要
-            return (priority, -int(timestamp.replace('-', '').replace(':', '').replace('T', '').replace('Z', '')), -unread_count)
+        if weights is not None:
+            sorted_ids = RankingEngine(weights, ranking_config).rank(ThreadBatch.from_threads(threads))
+            logger.debug(f"sort_tool 加權排序 {len(sorted_ids)} 個對話串, 耗時: {time.time() - start_time:.3f}s")
+            return {"sorted_threads": sorted_ids}
         
-        sorted_threads = sorted(threads, key=sort_key)
-        sorted_ids = [thread['id'] for thread in sorted_threads]
+        # 多因子排序：優先級 > 時間戳 > 未讀數
+        # 每個對話串只解析一次時間戳，再以預先算好的鍵排序索引
+        keys = [
+            inbox_key(
+                "",
+                thread.get('priority', 3),
+                timestamp_to_micros(thread.get('last_message_at', '')) or 0,
+                thread.get('unread_count', 0)
+            )
+            for thread in threads
+        ]
+        order = sorted(range(len(threads)), key=keys.__getitem__)
+        sorted_ids = [threads[i]['id'] for i in order]
         
         execution_time = time.time() - start_time
         logger.debug(f"sort_tool 執行完成，排序 {len(sorted_ids)} 個對話串, 耗時: {execution_time:.3f}s")
@@ -247,30 +269,11 @@ def tag_tool(text: str) -> Dict[str, List[str]]:
     start_time = time.time()
     
     try:
-        tags = []
-        text_lower = text.lower()
-        
-        # 關鍵字標籤映射
-        keyword_tags = {
-            '會議': ['會議', '工作'],
-            '電影': ['電影', '娛樂'],
-            '吃飯': ['聚餐', '美食'],
-            '生日': ['生日', '慶祝'],
-            '旅行': ['旅遊', '出遊'],
-            '購物': ['購物', '消費'],
-            '運動': ['運動', '健身'],
-            '學習': ['學習', '教育'],
-            '醫院': ['健康', '醫療'],
-            '緊急': ['緊急', '重要']
-        }
-        
         # 提取關鍵字標籤
-        for keyword, related_tags in keyword_tags.items():
-            if keyword in text:
-                tags.extend(related_tags)
+        tags = get_rule_set().matcher.tags(text)
         
-        # 去重並限制數量
-        tags = list(set(tags))[:5]
+        # 限制數量
+        tags = tags[:5]
         
         # 如果沒有標籤，給個通用標籤
         if not tags:
@@ -291,6 +294,7 @@ def get_all_tools():
     tools = [
         classify_tool,
         priority_tool,
+        batch_priority_tool,
         archive_tool,
         draft_reply_tool,
         sort_tool,
@@ -306,6 +310,7 @@ def get_tool_by_name(tool_name: str):
     tool_map = {
         'classify_tool': classify_tool,
         'priority_tool': priority_tool,
+        'batch_priority_tool': batch_priority_tool,
         'archive_tool': archive_tool,
         'draft_reply_tool': draft_reply_tool,
         'sort_tool': sort_tool,
@@ -0,0 +1,24 @@
+"""
+測試共用設定
+測試以專案根目錄匯入 src 套件，Demo 儲存一律建立在暫存目錄
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.demo_storage import DemoStorage  # noqa: E402
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    """空的 Demo 資料目錄"""
+    return str(tmp_path / "data")
+
+
+@pytest.fixture
+def storage(data_dir):
+    """不會自動寫出快照的 DemoStorage（異動只寫入日誌）"""
+    return DemoStorage(data_dir, snapshot_every=10**6, snapshot_interval=10**6)
@@ -0,0 +1,37 @@
+"""同步資料庫管理器"""
+import pytest
+
+from src import database
+from src.database import SyncDatabaseManager
+
+
+def test_failed_pool_init_is_not_retried_within_interval(monkeypatch):
+    attempts = []
+
+    def failing_pool(*args, **kwargs):
+        attempts.append(args)
+        raise OSError("connection refused")
+
+    monkeypatch.setattr(database.psycopg2.pool, "ThreadedConnectionPool", failing_pool)
+    manager = SyncDatabaseManager("postgresql://user@127.0.0.1:1/db", init_retry_interval=60)
+
+    with pytest.raises(OSError):
+        manager.init_pool()
+    for _ in range(3):
+        with pytest.raises(RuntimeError, match="connection refused"):
+            manager.init_pool()
+    assert len(attempts) == 1
+
+    # 重試間隔過後才重新連線
+    manager._init_failed_at -= 61
+    with pytest.raises(OSError):
+        manager.init_pool()
+    assert len(attempts) == 2
+
+
+def test_sqlite_pool_initialises(tmp_path):
+    manager = SyncDatabaseManager(f"sqlite:///{tmp_path}/app.db")
+    manager.init_pool()
+    assert manager.set_contact_priority("u", "s", 1, True)
+    assert manager.get_contact_priority("u", "s") == {"priority_boost": 1, "is_starred": True}
+    manager.close()
@@ -0,0 +1,87 @@
+"""關鍵字比對器：結果必須與逐一以 `keyword in text` 比對相同（包含互相重疊的關鍵字）"""
+
+import random
+
+import pytest
+
+from src.keywords import (CATEGORY_KEYWORDS, GENERAL_INTENT, INTENT_KEYWORDS, TAG_KEYWORDS,
+                          KeywordMatcher)
+
+FILLER = list("的了我你他明天今晚開會議爸媽家工作報告好謝嗎") + ["?", "？", " ", "Thank", "MEETING", "a"]
+
+
+def reference_category(text, category_keywords=CATEGORY_KEYWORDS):
+    """原本的分類方式：依序以 any(keyword in text) 比對"""
+    text = text.lower()
+    for category, group in category_keywords:
+        if any(keyword.lower() in text for keyword in group):
+            return category
+    return "朋友"
+
+
+def reference_tags(text, tag_keywords=TAG_KEYWORDS):
+    """原本的標籤方式：依關鍵字表順序，不重複"""
+    text = text.lower()
+    tags = []
+    for keyword, related_tags in tag_keywords.items():
+        if keyword.lower() in text:
+            tags.extend(tag for tag in related_tags if tag not in tags)
+    return tags
+
+
+def reference_intent(text, intent_keywords=INTENT_KEYWORDS):
+    """原本的意圖判斷方式"""
+    text = text.lower()
+    for intent, group in intent_keywords:
+        if any(keyword.lower() in text for keyword in group):
+            return intent
+    return GENERAL_INTENT
+
+
+def sample_texts(count, rng):
+    """由關鍵字與填充字元拼接的隨機訊息（關鍵字之間常互相重疊）"""
+    keywords = [keyword for _, group in CATEGORY_KEYWORDS + INTENT_KEYWORDS for keyword in group]
+    keywords.extend(TAG_KEYWORDS)
+    pieces = keywords + FILLER
+    return ["".join(rng.choice(pieces) for _ in range(rng.randint(1, 8))) for _ in range(count)]
+
+
+@pytest.mark.parametrize("text, category, tags, intent", [
+    # 「開會」與「會議」重疊
+    ("明天開會議", "工作", ["會議", "工作"], "meeting"),
+    # 「爸爸」與「爸」、「媽」互相包含
+    ("爸爸媽", "家人", [], GENERAL_INTENT),
+    ("媽媽", "家人", [], GENERAL_INTENT),
+    ("爸", "家人", [], GENERAL_INTENT),
+    # 問號優先於會議
+    ("要開會嗎", "朋友", [], "question"),
+    # 英文不分大小寫
+    ("Thank you for the MEETING", "朋友", [], "thanks"),
+    ("限時特價會議", "工作", ["會議", "工作"], "meeting"),
+    ("", "朋友", [], GENERAL_INTENT),
+])
+def test_overlapping_keywords(text, category, tags, intent):
+    matcher = KeywordMatcher()
+    assert matcher.category(text) == category
+    assert matcher.tags(text) == tags
+    assert matcher.intent(text) == intent
+
+
+def test_matches_reference_on_random_texts():
+    matcher = KeywordMatcher(cache_size=1)
+    for text in sample_texts(5000, random.Random(0)):
+        got = (matcher.category(text), matcher.tags(text), matcher.intent(text))
+        expected = (reference_category(text), reference_tags(text), reference_intent(text))
+        assert got == expected, text
+
+
+def test_custom_keywords_nested_in_each_other():
+    categories = [("長", ("abc",)), ("中", ("bc",)), ("短", ("c", "B"))]
+    tags = {"ab": ["x"], "abcd": ["y"], "d": ["z", "x"]}
+    matcher = KeywordMatcher(categories, tags, [], cache_size=1)
+    rng = random.Random(1)
+    for _ in range(2000):
+        text = "".join(rng.choice("abcdABCD ") for _ in range(rng.randint(0, 10)))
+        assert matcher.category(text) == reference_category(text, categories), text
+        assert matcher.tags(text) == reference_tags(text, tags), text
+        assert matcher.intent(text) == GENERAL_INTENT
@@ -0,0 +1,50 @@
+"""Prompt 壓縮"""
+from src.prompt_compression import compress_prompt
+
+TEMPLATE = """# 角色
+你是 {{ name }} 的訊息助理。
+
+
+## 分類規則
+- 只輸出 JSON
+- 只輸出 JSON
+- 優先級 1-5
+
+## 草稿規則
+- 只輸出 JSON
+- 語氣：{{ style }}
+
+
+{% if signature %}簽名：{{ signature }}{% endif %}
+
+## 範例
+- 輸入：明天開會
+"""
+
+
+def test_duplicates_removed_only_within_a_section():
+    content = compress_prompt(TEMPLATE)["content"]
+    rules, drafts = content.split("## 草稿規則")
+    assert rules.count("- 只輸出 JSON") == 1
+    assert drafts.count("- 只輸出 JSON") == 1
+
+
+def test_blank_line_runs_collapse_but_sections_stay_separated():
+    content = compress_prompt(TEMPLATE)["content"]
+    assert "\n\n\n" not in content
+    assert "訊息助理。\n\n## 分類規則" in content
+    assert "- 優先級 1-5\n\n## 草稿規則" in content
+    assert not content.startswith("\n") and not content.endswith("\n")
+
+
+def test_examples_dropped_and_template_kept_valid():
+    result = compress_prompt(TEMPLATE)
+    assert "## 範例" not in result["content"]
+    assert "{% if signature %}" in result["content"]
+    assert result["saved_tokens"] > 0
+
+
+def test_paragraphs_without_headings_keep_repeated_items():
+    template = "輸出格式：\n- 使用繁體中文\n\n回覆草稿：\n- 使用繁體中文\n- 使用繁體中文"
+    content = compress_prompt(template)["content"]
+    assert content == "輸出格式：\n- 使用繁體中文\n\n回覆草稿：\n- 使用繁體中文"
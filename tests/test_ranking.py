@@ -0,0 +1,50 @@
+"""對話串加權排序的設定驗證"""
+
+import pytest
+
+from src.ranking import RankingEngine, ThreadBatch
+
+NOW = 100 * 3600 * 1_000_000
+
+THREADS = [
+    {"id": "old-urgent", "priority": 1, "unread_count": 0},
+    {"id": "starred", "priority": 3, "unread_count": 2, "is_starred": True},
+    {"id": "unread", "priority": 3, "unread_count": 40},
+]
+
+
+def test_partial_weights_keep_defaults():
+    engine = RankingEngine({"starred": 5.0})
+    assert engine.weights["starred"] == 5.0
+    assert engine.weights["priority"] == 1.0
+    assert engine.config["UNREAD_CAP"] == 10
+    assert engine.rank(ThreadBatch.from_threads(THREADS), now=NOW)[0] == "starred"
+
+
+def test_config_is_separate_from_weights():
+    batch = ThreadBatch.from_threads(THREADS)
+    low_cap = RankingEngine({"unread": 2.0}, {"UNREAD_CAP": 1}).scores(batch, now=NOW)
+    high_cap = RankingEngine({"unread": 2.0}, {"UNREAD_CAP": 100}).scores(batch, now=NOW)
+    # 上限為 1 時只要有未讀就拿滿分，兩個有未讀的對話串得到相同的未讀分數
+    assert low_cap[2] - low_cap[1] < high_cap[2] - high_cap[1]
+
+
+@pytest.mark.parametrize("weights, config", [
+    ({"UNREAD_CAP": 10}, None),
+    ({"recncy": 0.5}, None),
+    (None, {"priority": 1.0}),
+    ({"priority": "1"}, None),
+    (None, {"RECENCY_HALF_LIFE_HOURS": 0}),
+    (None, {"UNREAD_CAP": True}),
+])
+def test_invalid_settings_are_rejected(weights, config):
+    with pytest.raises(ValueError):
+        RankingEngine(weights, config)
+
+
+def test_sort_tool_keeps_order_for_misplaced_config():
+    from src.toolbox import sort_tool
+
+    # 參數誤放在權重裡時不套用任何排序，回傳原始順序
+    result = sort_tool(THREADS, weights={"UNREAD_CAP": 10})
+    assert result["sorted_threads"] == [thread["id"] for thread in THREADS]
@@ -0,0 +1,46 @@
+"""封存狀態重新評估：只寫回改變的決定，換封存規則後的結果不視為過期"""
+from src.archive import ArchiveTable
+from src.demo_storage import DemoStorage
+from src.dependencies import STALE_RULES, build_depends_on, prompt_version
+
+TONE = {"style": "friendly"}
+RULES = {"朋友": {"priority_threshold": 3, "enabled": True}}
+
+
+def process(storage, sender_id, priority, rule_version):
+    message_id = storage.add_message(f"訊息 {priority}", sender_id, sender_id)
+    storage.mark_message_processed(message_id, {
+        "category": "朋友", "priority": priority, "should_archive": False,
+        "depends_on": build_depends_on(sender_id, None, rule_version, TONE)
+    })
+    return message_id
+
+
+def test_rearchive_moves_current_results_to_new_rule_version(storage, data_dir):
+    low = process(storage, "amy", 4, "v1")
+    high = process(storage, "bob", 1, "v1")
+    old = process(storage, "bob", 5, "v0")
+
+    result = storage.rearchive(ArchiveTable(RULES), rule_version="v2", previous_rule_version="v1")
+
+    assert result["changed"] == 2
+    assert result["rule_version_updated"] == 2
+    assert storage.get_message(low)["processing_result"]["should_archive"] is True
+    assert storage.get_message(high)["processing_result"]["depends_on"]["rule_version"] == "v2"
+    # 更早的規則版本處理的結果仍然過期
+    assert storage.find_stale_messages("v2", prompt_version(TONE)) == {old: STALE_RULES}
+
+    reopened = DemoStorage(data_dir, snapshot_every=10**6, snapshot_interval=10**6)
+    assert reopened.find_stale_messages("v2", prompt_version(TONE)) == {old: STALE_RULES}
+    assert reopened.get_message(old)["processing_result"]["should_archive"] is True
+
+
+def test_rearchive_dry_run_writes_nothing(storage):
+    message_id = process(storage, "amy", 4, "v1")
+
+    result = storage.rearchive(ArchiveTable(RULES), dry_run=True,
+                               rule_version="v2", previous_rule_version="v1")
+
+    assert (result["changed"], result["rule_version_updated"]) == (1, 1)
+    assert storage.get_message(message_id)["processing_result"]["should_archive"] is False
+    assert storage.find_stale_messages("v1", prompt_version(TONE)) == {}
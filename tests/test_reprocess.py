@@ -0,0 +1,91 @@
+"""相依追蹤與重新處理：只重新處理依賴舊輸入的訊息，且不重複計入處理統計"""
+import importlib
+
+import pytest
+
+from src.dependencies import (STALE_CONTACT, STALE_PROMPT, STALE_RULES, DependencyIndex,
+                              build_depends_on, prompt_version)
+
+TONE = {"style": "friendly"}
+PLAIN = {"priority_boost": 0, "is_starred": False}
+STARRED = {"priority_boost": 0, "is_starred": True}
+
+
+def result_for(sender_id, contact, rule_version="v1", tone=TONE):
+    return {"category": "朋友", "priority": 3,
+            "depends_on": build_depends_on(sender_id, contact, rule_version, tone)}
+
+
+def test_changed_contact_marks_only_that_sender():
+    index = DependencyIndex()
+    index.update(1, "amy", result_for("amy", PLAIN))
+    index.update(2, "amy", result_for("amy", PLAIN))
+    index.update(3, "bob", result_for("bob", PLAIN))
+
+    contacts = {"amy": STARRED, "bob": PLAIN}
+    assert index.stale("v1", prompt_version(TONE), contacts=contacts) == {1: STALE_CONTACT, 2: STALE_CONTACT}
+    assert index.stale("v1", prompt_version(TONE), contacts=contacts, sender_ids=["bob"]) == {}
+
+    # 重新處理後記錄新的設定，不再過期
+    index.update(1, "amy", result_for("amy", STARRED))
+    index.update(2, "amy", result_for("amy", STARRED))
+    assert index.stale("v1", prompt_version(TONE), contacts=contacts) == {}
+
+
+def test_rule_and_prompt_versions():
+    index = DependencyIndex()
+    index.update(1, "amy", result_for("amy", PLAIN, rule_version="v0"))
+    index.update(2, "bob", result_for("bob", PLAIN, tone={"style": "formal"}))
+    index.update(3, "bob", result_for("bob", PLAIN))
+
+    assert index.stale("v1", prompt_version(TONE)) == {1: STALE_RULES, 2: STALE_PROMPT}
+    assert index.stale("v1", prompt_version(TONE), sender_ids=["amy"]) == {1: STALE_RULES}
+
+
+@pytest.fixture
+def contacts():
+    """目前的聯絡人設定（測試中可直接修改）"""
+    return {"amy": dict(PLAIN), "bob": dict(PLAIN)}
+
+
+@pytest.fixture
+def client(storage, contacts, tmp_path, monkeypatch):
+    """以暫存的 Demo 儲存與可控的聯絡人設定載入 API"""
+    from fastapi.testclient import TestClient
+
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setenv("SECRET_KEY", "test")
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'test.db'}")
+    workdir = tmp_path / "cwd"
+    workdir.mkdir()
+    monkeypatch.chdir(workdir)
+    api = importlib.import_module("src.api")
+    monkeypatch.setattr(api, "demo_storage", storage)
+    monkeypatch.setattr(api, "_current_contacts",
+                        lambda sender_ids: {sid: dict(contacts[sid]) for sid in sender_ids if sid in contacts})
+    return TestClient(api.app)
+
+
+def test_reprocess_endpoint_counts_each_message_once(client, contacts, storage):
+    for text, sender_id in [("明天開會", "amy"), ("謝謝", "amy"), ("你好嗎", "bob"), ("晚安", "bob")]:
+        storage.add_message(text, sender_id, sender_id)
+    assert client.post("/demo/batch-process").json()["processed_count"] == 4
+
+    contacts["amy"]["is_starred"] = True
+    preview = client.post("/demo/maintenance/reprocess", params={"dry_run": True}).json()
+    assert preview["stale_count"] == 2
+    assert preview["reasons"][STALE_CONTACT] == 2
+
+    response = client.post("/demo/maintenance/reprocess").json()
+    assert response["reprocessed_count"] == 2
+    assert response["contacts_checked"] is True
+    assert client.post("/demo/maintenance/reprocess", params={"dry_run": True}).json()["stale_count"] == 0
+
+    stats = storage.get_processing_stats()
+    assert stats["total_processed"] == 4
+    assert stats["total_reprocessed"] == 2
+
+    # 壓縮成每日彙總後仍只計一次
+    storage.compact_processing_history(retain_days=0)
+    stats = storage.get_processing_stats()
+    assert (stats["total_processed"], stats["total_reprocessed"]) == (4, 2)
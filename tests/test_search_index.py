@@ -0,0 +1,45 @@
+"""訊息全文檢索索引"""
+import random
+
+from src.message_store import MessageStore
+from src.search_index import MessageSearchIndex
+
+TEXTS = ["媽，你好", "媽媽回家吃飯", "明天開會議", "Meeting at 3pm", "爸爸說週末回家"]
+
+
+def build(texts):
+    store = MessageStore.from_records(
+        {"id": i + 1, "text": text, "sender_id": "s", "sender_name": "n",
+         "timestamp": "2024-01-15T09:00:00"}
+        for i, text in enumerate(texts)
+    )
+    return store, MessageSearchIndex.from_store(store)
+
+
+def found(texts, query):
+    store, index = build(texts)
+    total, rows = index.search(query, store, limit=len(texts))
+    assert total == len(rows)
+    return sorted(store.text_at(row) for row in rows)
+
+
+def test_single_cjk_character_matches_standalone_and_within_runs():
+    assert found(TEXTS, "媽") == sorted(["媽，你好", "媽媽回家吃飯"])
+
+
+def test_single_cjk_character_without_standalone_occurrence():
+    assert found(TEXTS, "家") == sorted(["媽媽回家吃飯", "爸爸說週末回家"])
+
+
+def test_multiple_terms_are_anded():
+    assert found(TEXTS, "回家 爸爸") == ["爸爸說週末回家"]
+    assert found(TEXTS, "meeting 3pm") == ["Meeting at 3pm"]
+    assert found(TEXTS, "不存在") == []
+
+
+def test_short_cjk_queries_match_substring_search():
+    rng = random.Random(0)
+    alphabet = "媽爸回家開會議吃飯，"
+    texts = ["".join(rng.choice(alphabet) for _ in range(rng.randint(1, 6))) for _ in range(300)]
+    for query in list(alphabet[:-1]) + ["媽媽", "回家", "會議", "家開"]:
+        assert found(texts, query) == sorted(text for text in texts if query in text), query
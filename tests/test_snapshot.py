@@ -0,0 +1,85 @@
+"""二進位快照、寫入日誌重播與指紋失效"""
+import json
+import os
+
+import pytest
+
+from src.demo_storage import DemoStorage
+from src.message_store import MessageStore
+from src.snapshot import SnapshotError, read_snapshot, write_snapshot
+
+RECORDS = [
+    {"id": 1, "text": "明天開會", "sender_id": "boss", "sender_name": "老闆",
+     "timestamp": "2024-01-15T09:00:00", "processed": False},
+    {"id": 2, "text": "含\x00分隔字元", "sender_id": "mom", "sender_name": "媽媽",
+     "timestamp": "2024-01-15T10:00:00+08:00", "processed": True,
+     "processing_result": {"category": "家人", "priority": 1, "should_archive": False},
+     "processed_at": "2024-01-15T10:01:00", "extra": {"read": True}},
+]
+
+
+def reopen(data_dir):
+    return DemoStorage(data_dir, snapshot_every=10**6, snapshot_interval=10**6)
+
+
+def test_snapshot_round_trip(tmp_path):
+    path = str(tmp_path / "messages.snap")
+    store = MessageStore.from_records(RECORDS)
+    write_snapshot(path, store, (123, 456))
+
+    loaded, source = read_snapshot(path)
+
+    assert source == (123, 456)
+    assert loaded.to_records() == store.to_records()
+    assert loaded.unprocessed_count == 1
+
+
+@pytest.mark.parametrize("size", [0, 4, 10, 20, 40, 80])
+def test_truncated_snapshot_raises_snapshot_error(tmp_path, size):
+    path = str(tmp_path / "messages.snap")
+    write_snapshot(path, MessageStore.from_records(RECORDS), (1, 2))
+    with open(path, "r+b") as f:
+        f.truncate(size)
+
+    with pytest.raises(SnapshotError):
+        read_snapshot(path)
+
+
+def test_journal_replay_after_add_and_process(storage, data_dir):
+    message_id = storage.add_message("週末回家吃飯", "mom", "媽媽")
+    result = {"category": "家人", "priority": 1, "should_archive": False}
+    assert storage.mark_message_processed(message_id, result)
+    # 異動只寫入日誌，JSON 仍是舊內容
+    assert storage.load_json("demo_messages")["messages"] == []
+
+    reloaded = reopen(data_dir)
+
+    message = reloaded.get_message_by_id(message_id)
+    assert message["text"] == "週末回家吃飯"
+    assert message["processed"] is True
+    assert message["processing_result"] == result
+
+
+def test_changed_json_invalidates_snapshot(storage, data_dir):
+    storage.add_message("舊訊息", "friend", "朋友")
+    storage.flush()
+    # 外部直接修改 JSON：快照與日誌的指紋不再相符
+    with open(os.path.join(data_dir, "demo_messages.json"), "w", encoding="utf-8") as f:
+        json.dump({"messages": RECORDS}, f, ensure_ascii=False)
+
+    reloaded = reopen(data_dir)
+
+    assert [m["text"] for m in reloaded.get_all_messages()] == [r["text"] for r in RECORDS]
+
+
+@pytest.mark.parametrize("size", [10, 20, 40])
+def test_truncated_snapshot_falls_back_to_json(storage, data_dir, size):
+    storage.add_message("已寫入 JSON", "friend", "朋友")
+    storage.flush()
+    storage.add_message("只在日誌", "friend", "朋友")
+    with open(storage.snapshot_path, "r+b") as f:
+        f.truncate(size)
+
+    reloaded = reopen(data_dir)
+
+    assert [m["text"] for m in reloaded.get_all_messages()] == ["已寫入 JSON", "只在日誌"]
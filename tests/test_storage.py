@@ -0,0 +1,49 @@
+"""StorageBackend 各實作的一致性"""
+import inspect
+
+import pytest
+
+from src.database import SyncDatabaseManager
+from src.demo_storage import DemoStorage
+from src.storage import JSON_URL_PREFIX, MEMORY_URL, InMemoryStorage, StorageBackend, create_storage
+
+BACKENDS = [InMemoryStorage, DemoStorage, SyncDatabaseManager]
+
+
+@pytest.fixture(params=["memory", "json", "sqlite"])
+def backend(request, tmp_path):
+    urls = {
+        "memory": MEMORY_URL,
+        "json": f"{JSON_URL_PREFIX}{tmp_path}/data",
+        "sqlite": f"sqlite:///{tmp_path}/app.db",
+    }
+    storage = create_storage(urls[request.param])
+    yield storage
+    storage.close()
+
+
+@pytest.mark.parametrize("implementation", BACKENDS, ids=lambda cls: cls.__name__)
+def test_public_methods_match_interface(implementation):
+    for name in StorageBackend.__abstractmethods__:
+        expected = inspect.signature(getattr(StorageBackend, name))
+        actual = inspect.signature(getattr(implementation, name))
+        assert list(actual.parameters) == list(expected.parameters), name
+
+
+def test_list_messages_pagination_and_projection(backend):
+    ids = [backend.add_message(f"訊息 {i}", "friend", "朋友") for i in range(3)]
+    backend.mark_message_processed(ids[0], {"category": "朋友", "priority": 3})
+
+    page = backend.list_messages(limit=2)
+    assert [m["id"] for m in page["messages"]] == ids[:2]
+    assert page["next_cursor"] == ids[1]
+    assert [m["id"] for m in backend.list_messages(cursor=page["next_cursor"])["messages"]] == ids[2:]
+
+    projected = backend.list_messages(limit=10, fields=["id", "text"])["messages"]
+    assert projected == [{"id": i, "text": f"訊息 {n}"} for n, i in enumerate(ids)]
+
+    excluded = backend.list_messages(limit=10, exclude=["processing_result"])["messages"]
+    assert all("processing_result" not in m for m in excluded)
+
+    unprocessed = backend.list_messages(limit=10, unprocessed_only=True, fields=["id"])["messages"]
+    assert unprocessed == [{"id": i} for i in ids[1:]]